@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Pantries per minute for bulk meal planning: N pantries answered one
+``/api/text`` turn at a time, as concurrent ``/api/text`` turns, and through
+``/api/bulk`` (``chef_agent.answer_many``).
+
+The real ``tools.chef_agent`` pipeline runs against the shipped BM25 index
+and a throw-away FAISS index built from the same passages with hashed
+vectors (``CHEF_INDEX_DIR`` points at a temp dir).  Upstreams are stubbed
+with log-normal latency: embedding (one round trip per request, slightly
+longer per extra input), gatekeeper, Cohere rerank and generation.
+Latencies are scaled by ``--scale`` (default 0.1) to keep the run short;
+ratios between modes are what matter.
+
+    python -m benchmarks.bulk_throughput --pantries 60 --concurrency 8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+for var in ("OPENAI_API_KEY", "COHERE_API_KEY", "SPEECH_KEY", "SPEECH_REGION",
+            "GOOGLEMAP_API"):
+    os.environ.setdefault(var, "bench")
+
+# median latency (ms) at scale 1
+MEDIANS = {"gatekeeper": 350, "embed": 250, "rerank": 300, "generate": 1500}
+EMBED_PER_INPUT_MS = 5
+DIM = 64
+INGREDIENTS = ["鸡蛋", "西红柿", "土豆", "猪肉", "牛肉", "豆腐", "青椒", "洋葱", "大蒜",
+               "生姜", "葱", "白菜", "胡萝卜", "鸡肉", "虾", "米饭", "面条", "黄瓜",
+               "茄子", "蘑菇", "egg", "tomato", "potato", "pork", "tofu", "rice"]
+
+CALLS: Counter = Counter()
+
+
+def _latency(name: str, scale: float, rnd: random.Random, extra_ms: float = 0) -> float:
+    CALLS[name] += 1
+    return (MEDIANS[name] * rnd.lognormvariate(0, 0.25) + extra_ms) * scale / 1000
+
+
+def _vector(text: str) -> list[float]:
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    r = random.Random(seed)
+    return [r.gauss(0, 1) for _ in range(DIM)]
+
+
+def _build_index_dir() -> tempfile.TemporaryDirectory:
+    """BM25 from ``indexes/`` (symlinked) + a hashed-vector FAISS index."""
+    from langchain_community.vectorstores import FAISS
+
+    from tools.rag.bm25_retriever import BM25
+
+    tmp = tempfile.TemporaryDirectory()
+    d = Path(tmp.name)
+    src = ROOT / "indexes"
+    os.symlink(src / "bm25.pkl", d / "bm25.pkl")
+    if BM25.compact_dir(src / "bm25.pkl").exists():
+        os.symlink(BM25.compact_dir(src / "bm25.pkl"), BM25.compact_dir(d / "bm25.pkl"))
+    texts = list(BM25.load(src / "bm25.pkl").chunks)
+    os.symlink(BM25.chunk_dir(src / "bm25.pkl"), BM25.chunk_dir(d / "bm25.pkl"))
+
+    class HashEmbeddings:
+        def embed_documents(self, xs):
+            return [_vector(x) for x in xs]
+
+        def embed_query(self, x):
+            return _vector(x)
+
+    store = FAISS.from_embeddings([(t, _vector(t)) for t in texts], HashEmbeddings())
+    store.save_local(str(d / "faiss"))
+    os.environ["CHEF_INDEX_DIR"] = str(d)
+    return tmp
+
+
+def _install_stubs(scale: float, rnd: random.Random):
+    """Import the real agent, then swap its network clients for stubs."""
+    gk = types.ModuleType("tools.gatekeeper")
+
+    async def need_rag(focus, new_msg, session_id="anon"):
+        await asyncio.sleep(_latency("gatekeeper", scale, rnd))
+        return True, "RAG"
+
+    gk.need_rag = need_rag
+    sys.modules["tools.gatekeeper"] = gk
+
+    from tools import chef_agent
+
+    class Embeddings:
+        def embed_query(self, x):
+            time.sleep(_latency("embed", scale, rnd))
+            return _vector(x)
+
+        def embed_documents(self, xs):
+            time.sleep(_latency("embed", scale, rnd, EMBED_PER_INPUT_MS * (len(xs) - 1)))
+            return [_vector(x) for x in xs]
+
+    class Cohere:
+        def rerank(self, query, documents, top_n, model):
+            time.sleep(_latency("rerank", scale, rnd))
+            results = [types.SimpleNamespace(index=i, relevance_score=-i)
+                       for i in range(len(documents))][:top_n]
+            return types.SimpleNamespace(results=results)
+
+    class Completions:
+        async def create(self, model, messages, **kw):
+            await asyncio.sleep(_latency("generate", scale, rnd))
+            msg = types.SimpleNamespace(content="番茄炒蛋 — uses your eggs and tomatoes. TERMINATE")
+            usage = types.SimpleNamespace(prompt_tokens=1200, completion_tokens=150)
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)],
+                                         usage=usage)
+
+    openai = types.SimpleNamespace(chat=types.SimpleNamespace(completions=Completions()))
+    chef_agent.faiss.embeddings = Embeddings()
+    chef_agent.reranker.client = Cohere()
+    chef_agent.openai_client = lambda: openai
+
+    from server import agent
+    return agent
+
+
+def _pantries(n: int, rnd: random.Random) -> list[list[str]]:
+    return [rnd.sample(INGREDIENTS, rnd.randint(3, 7)) for _ in range(n)]
+
+
+async def _text_turns(agent, pantries, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i, pantry):
+        async with sem:
+            await agent.aget_response(json.dumps(pantry, ensure_ascii=False), f"bench-{i}")
+
+    await asyncio.gather(*(one(i, p) for i, p in enumerate(pantries)))
+
+
+async def _bulk(agent, pantries):
+    async for item in agent.aget_bulk_responses(pantries):
+        assert "response" in item, item
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pantries", type=int, default=60)
+    ap.add_argument("--concurrency", type=int, default=8,
+                    help="concurrent /api/text turns, and BULK_CONCURRENCY")
+    ap.add_argument("--scale", type=float, default=0.1)
+    args = ap.parse_args()
+    os.environ["BULK_CONCURRENCY"] = str(args.concurrency)
+
+    tmp = _build_index_dir()
+    rnd = random.Random(7)
+    agent = _install_stubs(args.scale, rnd)
+    from tools import tracing
+    tracing.logger.disabled = True
+    pantries = _pantries(args.pantries, random.Random(3))
+
+    print(f"{args.pantries} pantries, concurrency {args.concurrency}, scale {args.scale:g}")
+    print(f"{'mode':22} {'seconds':>8} {'pantries/min':>13}   upstream calls")
+    modes = (("/api/text sequential", lambda: _text_turns(agent, pantries, 1)),
+             ("/api/text concurrent", lambda: _text_turns(agent, pantries, args.concurrency)),
+             ("/api/bulk", lambda: _bulk(agent, pantries)))
+    for name, run in modes:
+        CALLS.clear()
+        t0 = time.perf_counter()
+        asyncio.run(run())
+        wall = (time.perf_counter() - t0) / args.scale          # production scale
+        calls = " ".join(f"{k}={CALLS[k]}" for k in MEDIANS)
+        print(f"{name:22} {wall:8.1f} {args.pantries / wall * 60:13.1f}   {calls}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
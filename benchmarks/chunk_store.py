@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Corpus memory and per-request allocation: passages held as langchain
+``Document`` objects (``BM25.full_documents`` + the FAISS docstore, fused by
+hashing full passage strings, fresh ``Document`` objects for the reranker)
+against the shared chunk store (one UTF-8 blob + offsets, retrievers return
+IDs, text decoded for the rerank payload and the final passages only).
+
+Uses the shipped BM25 passage table; candidate IDs are drawn at random
+(20 lexical + 20 dense with overlap, as in ``chef_agent``), the reranker is
+an identity stub.  The chunk store's heap is what ``ChunkStore.from_texts``
+allocates; a worker that loads ``indexes/chunks`` maps the same bytes from
+the shared page cache instead.
+
+    python -m benchmarks.chunk_store --requests 2000
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from langchain.schema import Document  # noqa: E402
+
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_store import ChunkStore  # noqa: E402
+
+SEP = "\n\n---\n\n"
+TOP_K, FINAL_K = 20, 6
+
+
+def _heap(make):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = make()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def _copy(text: str) -> str:
+    return text.encode("utf-8").decode("utf-8")    # own object, as after unpickling
+
+
+def _legacy_corpus(texts):
+    full_documents = [Document(page_content=_copy(t), metadata={"id": i})
+                      for i, t in enumerate(texts)]
+    keys = [str(uuid.uuid4()) for _ in texts]
+    docstore = {k: Document(page_content=_copy(t), metadata={"id": i})
+                for i, (k, t) in enumerate(zip(keys, texts))}
+    return full_documents, docstore, dict(enumerate(keys))
+
+
+def _legacy_request(corpus, lex, dense):
+    full_documents, docstore, row_key = corpus
+    bm25_hits = [full_documents[r].page_content for r in lex]
+    faiss_hits = [docstore[row_key[r]].page_content for r in dense]
+    pool = {t: t for t in bm25_hits + faiss_hits}.values()
+    docs = [Document(page_content=p) for p in pool]
+    payload = [d.page_content for d in docs]                 # Cohere request body
+    reranked = [docs[i] for i in range(len(payload))][:FINAL_K]
+    return SEP.join(f"{i+1}. {d.page_content}" for i, d in enumerate(reranked))
+
+
+def _store_request(chunks, lex, dense):
+    pool = list(dict.fromkeys(lex + dense))
+    payload = chunks.texts(pool)                              # Cohere request body
+    top = list(range(len(payload)))[:FINAL_K]
+    return SEP.join(f"{i+1}. {payload[j]}" for i, j in enumerate(top))
+
+
+def _candidates(n_docs, rnd):
+    lex = rnd.sample(range(n_docs), TOP_K)
+    dense = rnd.sample(lex, TOP_K // 2) + rnd.sample(range(n_docs), TOP_K // 2)
+    return lex, dense
+
+
+def _per_request(fn, corpus, n_docs, requests):
+    rnd = random.Random(5)
+    work = [_candidates(n_docs, rnd) for _ in range(requests)]
+    tracemalloc.start()
+    peak = 0
+    for lex, dense in work[:200]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(corpus, lex, dense)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for lex, dense in work:
+        fn(corpus, lex, dense)
+    return peak, (time.perf_counter() - t0) / requests * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+
+    texts = list(BM25.load(ROOT / "indexes" / "bm25.pkl").chunks)
+    legacy, legacy_bytes = _heap(lambda: _legacy_corpus(texts))
+    store, store_bytes = _heap(lambda: ChunkStore.from_texts(texts))
+    chunks = ChunkStore.load(ROOT / "indexes" / "chunks")     # what workers hold (mmap)
+
+    print(f"{len(texts)} passages, {sum(len(t) for t in texts):,} characters")
+    print(f"{'layout':10} {'corpus heap MB':>15} {'peak B/request':>15} {'µs/request':>11}")
+    for name, fn, corpus, heap in (("documents", _legacy_request, legacy, legacy_bytes),
+                                   ("chunks", _store_request, chunks, store_bytes)):
+        peak, us = _per_request(fn, corpus, len(texts), args.requests)
+        print(f"{name:10} {heap / 1e6:15.1f} {peak:15,} {us:11.1f}")
+    assert _legacy_request(legacy, [1, 2], [2, 3]) == _store_request(chunks, [1, 2], [2, 3])
+    del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Worker boot time: fresh interpreters import ``server.server`` and run the
+warm-up for several ``CHEF_WARMUP`` settings, then answer a first
+``chef_agent.chunk_ids`` lookup (the first thing a RAG request touches).
+Reports the median of ``--runs`` boots: import seconds, warm-up seconds
+(time until the worker would accept traffic is their sum) and the extra
+latency the first request pays for whatever was left lazy.
+
+The index is the shipped BM25 plus a throw-away hashed-vector FAISS index
+(see ``benchmarks/bulk_throughput.py``).
+
+    python -m benchmarks.cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.bulk_throughput import _build_index_dir  # noqa: E402  (sets the env too)
+
+BOOT = """
+import json, time
+t0 = time.perf_counter()
+import server.server
+t1 = time.perf_counter()
+from tools import startup
+startup.warm_up()
+t2 = time.perf_counter()
+from tools import chef_agent
+chef_agent.chunk_ids("x")
+t3 = time.perf_counter()
+print(json.dumps([t1 - t0, t2 - t1, t3 - t2]))
+"""
+
+
+def _boot(warmup: str) -> list[float]:
+    env = {**os.environ, "CHEF_WARMUP": warmup}
+    out = subprocess.run([sys.executable, "-c", BOOT], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--modes", nargs="+", default=["none", "rag", "all"],
+                    help="CHEF_WARMUP values to compare")
+    args = ap.parse_args()
+
+    tmp = _build_index_dir()
+    _boot("none")                                  # fill the OS page cache / jieba cache
+    print(f"median of {args.runs} boots")
+    print(f"{'CHEF_WARMUP':12} {'import s':>9} {'warm-up s':>10} {'ready s':>8} "
+          f"{'1st request s':>14}")
+    for mode in args.modes:
+        runs = [_boot(mode) for _ in range(args.runs)]
+        imp, warm, first = (statistics.median(r[i] for r in runs) for i in range(3))
+        print(f"{mode:12} {imp:9.2f} {warm:10.2f} {imp + warm:8.2f} {first:14.2f}")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
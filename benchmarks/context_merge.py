@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Prompt context before and after overlap-aware merging
+(``tools/rag/spans.py``) on the shipped index.
+
+Queries are pairs of lexicon ingredients and the lexicon's dish names, in
+Chinese; the BM25 top ``--pool`` stands in for the reranked candidate
+pool (no Cohere call offline).  Rows:
+
+* ranked   – the top ``final_k`` windows as they are (before)
+* merged   – the same windows, overlapping ones merged into spans
+* filled   – merged, plus further ranked passages in the tokens saved
+             (served: the budget is the ``ranked`` row's tokens)
+
+Reports mean / p50 prompt tokens of the passages, passages sent, windows
+covered and distinct dishes (``dish:`` labels of the covered windows), and
+the assembly time.  Tokens are ``tiktoken`` counts when it is installed,
+otherwise the estimate of ``spans.count_tokens`` (printed).
+
+    python -m benchmarks.context_merge --pool 40
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools.rag import spans  # noqa: E402
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_meta import extract  # noqa: E402
+from tools.rag.lexicon import LEXICON  # noqa: E402
+
+FINAL_K = 6                                       # chef_agent.final_k
+
+
+def _queries(n: int, rnd: random.Random) -> list[str]:
+    items = [e.zh[0] for e in LEXICON.entries if e.kind == "ingredient"]
+    dishes = [e.zh[0] for e in LEXICON.entries if e.kind == "dish"]
+    return [" ".join(rnd.sample(items, 2)) for _ in range(n)] + dishes
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", type=Path, default=ROOT / "indexes")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--pool", type=int, default=40)
+    args = ap.parse_args()
+
+    bm25 = BM25.load(args.index / "bm25.pkl")
+    chunks = bm25.chunks
+    labels, _ = extract(list(chunks))
+    dishes = [{x for x in lab if x.startswith("dish:")} for lab in labels]
+    queries = _queries(args.queries, random.Random(0))
+    bm25.GetBM25TopKIds("鸡蛋", 1)                                # jieba warm-up
+    spans.count_tokens("")                                        # loads the encoding
+    tokenizer = "tiktoken o200k_base" if spans._encoding else "estimate (no tiktoken)"
+
+    rows: dict[str, list[tuple[int, int, int, int]]] = {"ranked": [], "merged": [], "filled": []}
+    seconds = []
+    for q in queries:
+        ranked = bm25.GetBM25TopKIds(q, args.pool).tolist()
+        top = ranked[:FINAL_K]
+        raw = [spans.count_tokens(t) for t in chunks.texts(top)]
+        rows["ranked"].append((sum(raw), len(top), len(top),
+                               len(set().union(*(dishes[i] for i in top)))))
+        for name, pool in (("merged", top), ("filled", ranked)):
+            t = time.perf_counter()
+            picked = spans.assemble(pool, chunks, sum(raw))
+            if name == "filled":
+                seconds.append(time.perf_counter() - t)
+            covered = [i for s in picked for i in s.ids]
+            rows[name].append((sum(s.tokens for s in picked), len(picked), len(covered),
+                               len(set().union(*(dishes[i] for i in covered)))))
+
+    print(f"{len(chunks)} passages, {len(queries)} queries, pool {args.pool}, "
+          f"final_k {FINAL_K}; tokens: {tokenizer}")
+    print(f"{'context':8} {'mean tok':>9} {'p50 tok':>8} {'passages':>9} {'windows':>8} {'dishes':>7}")
+    base = np.mean([r[0] for r in rows["ranked"]])
+    for name, rs in rows.items():
+        a = np.asarray(rs, dtype=float)
+        print(f"{name:8} {a[:, 0].mean():9.0f} {np.median(a[:, 0]):8.0f} {a[:, 1].mean():9.2f} "
+              f"{a[:, 2].mean():8.2f} {a[:, 3].mean():7.2f}   ({a[:, 0].mean() / base - 1:+.1%} tokens)")
+    print(f"assembly: p50 {np.percentile(seconds, 50) * 1e3:.2f} ms, "
+          f"p95 {np.percentile(seconds, 95) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Load time and resident memory of the dense index in its two on-disk
+formats, for N workers that each load it themselves (no preload):
+
+* pickle – langchain ``save_local``: ``FAISS.load_local`` reads the index
+  into private memory and unpickles the docstore and the row → ID map
+* mmap   – raw ``index.faiss`` opened with ``IO_FLAG_MMAP_IFC`` plus the
+  ``ids.npy`` / ``meta.json`` sidecar (``FaissRetriever.load``)
+
+Both are built from the shipped BM25 passages with hashed vectors of
+``--dim`` dimensions (3072 = ``text-embedding-3-large``).  Each worker loads,
+runs a few searches, then reports from ``/proc/self/smaps_rollup`` while all
+workers are alive: ``Pss`` (file pages shared between workers are split) and
+anonymous memory, which is never shared after load (Linux only).
+
+    python -m benchmarks.faiss_load --workers 1 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.faiss_retriever import FaissRetriever  # noqa: E402
+
+
+def _rollup() -> dict:
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1])
+    return out
+
+
+def _build(directory: Path, dim: int) -> None:
+    """A langchain directory (pickle) and a copy with the sidecar (mmap)."""
+    import faiss
+    from langchain.schema import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    bm25 = BM25.load(ROOT / "indexes" / "bm25.pkl")
+    texts = list(bm25.chunks)
+    rnd = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(dim)
+    index.add(rnd.standard_normal((len(texts), dim), dtype=np.float32))
+    docs = {str(i): Document(page_content=t, metadata={"id": i}) for i, t in enumerate(texts)}
+    store = FAISS(None, index, InMemoryDocstore(docs), {i: str(i) for i in range(len(texts))})
+    store.save_local(str(directory / "pickle"))
+    shutil.copytree(directory / "pickle", directory / "mmap")
+    FaissRetriever.load(directory / "mmap", chunks=bm25.chunks)      # writes the sidecar
+    (directory / "mmap" / "index.pkl").unlink()
+
+
+def _worker(path: str, dim: int, barrier, results) -> None:
+    before = _rollup()
+    t0 = time.perf_counter()
+    retriever = FaissRetriever.load(path)
+    load = time.perf_counter() - t0
+    q = np.random.default_rng(os.getpid()).standard_normal((8, dim), dtype=np.float32)
+    for row in q:                                       # touch every vector page
+        retriever.index.search(row[None, :], 20)
+    barrier.wait()                                      # measure with all workers alive
+    after = _rollup()
+    results.put((load, after["Pss"] - before["Pss"],
+                 after.get("Anonymous", 0) - before.get("Anonymous", 0)))
+    barrier.wait()
+
+
+def _run(path: Path, dim: int, n: int) -> list[tuple[float, int, int]]:
+    ctx = mp.get_context("fork")
+    barrier, results = ctx.Barrier(n), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(path), dim, barrier, results))
+             for _ in range(n)]
+    for p in procs:
+        p.start()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    ap.add_argument("--dim", type=int, default=3072)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        _build(tmp, args.dim)
+        size = (tmp / "mmap" / "index.faiss").stat().st_size
+        pkl = (tmp / "pickle" / "index.pkl").stat().st_size
+        print(f"index.faiss {size / 2**20:.1f} MB, docstore pickle {pkl / 2**20:.1f} MB")
+        print(f"{'format':7} {'workers':>7} {'load ms':>8} {'PSS/worker MB':>14} "
+              f"{'anon/worker MB':>15}")
+        for fmt in ("pickle", "mmap"):
+            for n in args.workers:
+                rows = _run(tmp / fmt, args.dim, n)
+                load = sorted(r[0] for r in rows)[len(rows) // 2] * 1000
+                pss = sum(r[1] for r in rows) / n / 1024
+                priv = sum(r[2] for r in rows) / n / 1024
+                print(f"{fmt:7} {n:7d} {load:8.1f} {pss:14.1f} {priv:15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Metadata-filtered retrieval: ranking only the passages a filter allows
+(bitmap applied before top-k) against filtering an unfiltered top-k
+afterwards, as a caller without bitmaps would.
+
+Runs on the shipped BM25 index and a random-vector FAISS index of
+``--dim`` dimensions (the dense ranking is meaningless, the cost and the
+number of hits that survive a filter are not).  Queries are passage
+prefixes.  For every filter and method it reports per-query p50 latency of
+each stage and the fill rate — the share of the *k* requested passages
+returned that satisfy the filter:
+
+* before     – ``where=`` on both retrievers (this tree)
+* after      – top-k, then drop passages that do not match
+* after x5   – top-5k, then keep the first *k* matches
+
+It first checks the filters ``chunk_meta.constraints`` derives from a few
+questions (``QUESTIONS``) and stops on a mismatch.
+
+    python -m benchmarks.filtered_retrieval --queries 200 --k 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_meta import constraints  # noqa: E402
+from tools.rag.faiss_retriever import FaissRetriever  # noqa: E402
+
+FILTERS = ["vegetarian", "NOT protein:pork", "vegetarian AND time<=20",
+           "method:steamed", "protein:chicken AND NOT method:fried"]
+# question → filter (egg is not chicken, fish sauce / oyster sauce no protein)
+QUESTIONS = [
+    ("不要鸡蛋", "NOT protein:egg"),
+    ("不吃鸡，20分钟以内", "NOT protein:chicken AND time<=20"),
+    ("no fish sauce please, I have tofu", None),
+    ("不加鱼露和蚝油", None),
+    ("不要鸡精", None),
+    ("no pork, no oysters", "NOT protein:pork AND NOT protein:shellfish"),
+    ("steamed, without shrimp", "NOT protein:shrimp AND method:steamed"),
+]
+
+
+def _faiss(d: Path, n: int, dim: int) -> np.ndarray:
+    import faiss
+    x = np.random.default_rng(0).standard_normal((n, dim), dtype=np.float32)
+    d.mkdir()
+    index = faiss.IndexFlatL2(dim)
+    index.add(x)
+    faiss.write_index(index, str(d / "index.faiss"))
+    np.save(d / "ids.npy", np.arange(n, dtype=np.int64))
+    (d / "meta.json").write_text(json.dumps({"normalize_L2": False, "dim": dim, "rows": n}))
+    return x
+
+
+def _timed(fn, items):
+    out, times = [], []
+    for it in items:
+        t = time.perf_counter()
+        out.append(fn(it))
+        times.append(time.perf_counter() - t)
+    return out, float(np.percentile(times, 50)) * 1e3
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--dim", type=int, default=768)
+    args = ap.parse_args()
+
+    for question, want in QUESTIONS:
+        got = constraints(question)
+        assert got == want, f"{question!r}: {got!r}, expected {want!r}"
+    print(f"constraints: {len(QUESTIONS)} questions ok")
+
+    bm25 = BM25.load(ROOT / "indexes" / "bm25.pkl")
+    texts = list(bm25.chunks)
+    rnd = random.Random(0)
+    queries = [t[:12] for t in rnd.sample(texts, args.queries)]
+    k = args.k
+    with tempfile.TemporaryDirectory() as tmp:
+        x = _faiss(Path(tmp) / "faiss", len(texts), args.dim)
+        dense = FaissRetriever.load(Path(tmp) / "faiss", chunks=bm25.chunks)
+        vectors = x[rnd.sample(range(len(x)), args.queries)] + 0.5
+        bm25.GetBM25TopKIds(queries[0], k)                     # jieba warm-up
+        print(f"{len(texts)} passages, {args.queries} queries, k={k}, dim {args.dim}")
+        print(f"{'filter':38} {'method':9} {'bm25 ms':>8} {'fill':>6} {'faiss ms':>9} {'fill':>6}")
+        for where in FILTERS:
+            allow = bm25.chunks.select(where)
+            methods = {
+                "before": (lambda q: bm25.GetBM25TopKIds(q, k, where),
+                           lambda v: dense.GetTopKIdsByVector(v, k, where)),
+                "after": (lambda q: bm25.GetBM25TopKIds(q, k),
+                          lambda v: dense.GetTopKIdsByVector(v, k)),
+                "after x5": (lambda q: bm25.GetBM25TopKIds(q, 5 * k),
+                             lambda v: dense.GetTopKIdsByVector(v, 5 * k)),
+            }
+            for name, (lex, den) in methods.items():
+                lex_ids, lex_ms = _timed(lex, queries)
+                den_ids, den_ms = _timed(den, vectors)
+                fill = lambda rows: np.mean([min(int(allow[r].sum()), k) / k   # noqa: E731
+                                             for r in rows])
+                print(f"{where:38} {name:9} {lex_ms:8.2f} {fill(lex_ids):6.1%} "
+                      f"{den_ms:9.2f} {fill(den_ids):6.1%}")
+            print(f"{'':38} ({int(allow.sum())} of {len(allow)} passages match)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+/api/image pipeline: legacy (disk write → re-read → full-resolution base64)
+versus in-memory downscale + perceptual-hash cache, against a stubbed vision
+endpoint.
+
+The stub charges upload time for the request body (``--uplink-mbps``), a
+fixed model latency, and gpt-4o's documented image token formula
+(85 + 170 per 512 px tile after the 2048 / 768 px resize), so both latency
+and token usage respond to what is actually sent.
+
+    python -m benchmarks.image_pipeline                 # synthetic phone photos
+    python -m benchmarks.image_pipeline --images a.jpg b.jpg ...
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+from tools.entity_recognition import ingredient_recognition as ir  # noqa: E402
+
+
+def _image_tokens(w: int, h: int) -> int:
+    s = min(1.0, 2048 / max(w, h))
+    w, h = w * s, h * s
+    s = min(1.0, 768 / min(w, h))
+    w, h = w * s, h * s
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+class StubVision:
+    """Quacks like ``openai.OpenAI()`` for ``chat.completions.create``."""
+
+    def __init__(self, uplink_mbps: float, model_ms: float):
+        self.uplink, self.model_s = uplink_mbps * 1e6 / 8, model_ms / 1000
+        self.calls = self.tokens = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages):
+        url = messages[1]["content"][0]["image_url"]["url"]
+        raw = base64.b64decode(url.split(",", 1)[1])
+        w, h = Image.open(io.BytesIO(raw)).size
+        time.sleep(len(url) / self.uplink + self.model_s)
+        prompt = _image_tokens(w, h) + 60
+        self.calls += 1
+        self.tokens += prompt + 12
+        usage = types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=12)
+        msg = types.SimpleNamespace(content=json.dumps(["egg", "green bell pepper"]))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)],
+                                     usage=usage)
+
+
+def _synthetic_photos(n: int) -> list[bytes]:
+    """Phone-sized noisy JPEGs; every third upload is a near-duplicate shot."""
+    rnd = random.Random(7)
+    out, base = [], None
+    for i in range(n):
+        if base is not None and i % 3 == 2:
+            img = base.crop((20, 15, base.width - 20, base.height - 15))  # same fridge, moved
+        else:
+            img = Image.new("RGB", (4032, 3024), tuple(rnd.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(40):                   # "groceries": random coloured blobs
+                x, y = rnd.randrange(4032), rnd.randrange(3024)
+                r = rnd.randrange(150, 900)
+                draw.ellipse((x - r, y - r, x + r, y + r),
+                             fill=tuple(rnd.randrange(256) for _ in range(3)))
+            noise = Image.effect_noise(img.size, 60).convert("RGB")
+            img = Image.blend(img, noise, 0.25).filter(ImageFilter.GaussianBlur(1))
+            base = img
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=92)
+        out.append(buf.getvalue())
+    return out
+
+
+def _legacy(data: bytes, stub: StubVision, tmp: str) -> None:
+    path = os.path.join(tmp, f"{time.time_ns()}.jpg")
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode()
+    stub.create("gpt-4o", [{"role": "system", "content": ""},
+                           {"role": "user", "content": [{"type": "image_url",
+                            "image_url": {"url": f"data:image/jpeg;base64,{b64}"}}]}])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", nargs="*")
+    ap.add_argument("-n", type=int, default=9)
+    ap.add_argument("--uplink-mbps", type=float, default=20)
+    ap.add_argument("--model-ms", type=float, default=1500)
+    args = ap.parse_args()
+
+    photos = ([Path(p).read_bytes() for p in args.images] if args.images
+              else _synthetic_photos(args.n))
+    photos = photos + photos[:2]                  # plus two exact re-uploads
+    print(f"{len(photos)} uploads, mean {statistics.mean(map(len, photos)) / 1e6:.1f} MB")
+
+    rows = []
+    stub = StubVision(args.uplink_mbps, args.model_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        lat = []
+        for data in photos:
+            t0 = time.perf_counter()
+            _legacy(data, stub, tmp)
+            lat.append(time.perf_counter() - t0)
+    rows.append(("legacy (disk + full-res)", lat, stub.calls, stub.tokens))
+
+    stub = StubVision(args.uplink_mbps, args.model_ms)
+    ir.openai_sync_client = lambda: stub
+    lat = []
+    for data in photos:
+        t0 = time.perf_counter()
+        ir.detect_ingredients(data)
+        lat.append(time.perf_counter() - t0)
+    rows.append(("in-memory + downscale + cache", lat, stub.calls, stub.tokens))
+
+    print(f"{'pipeline':32} {'mean ms':>8} {'p50 ms':>8} {'vision calls':>13} {'tokens':>8}")
+    for name, lat, calls, tokens in rows:
+        print(f"{name:32} {statistics.mean(lat) * 1e3:8.0f} "
+              f"{statistics.median(lat) * 1e3:8.0f} {calls:13d} {tokens:8d}")
+
+
+if __name__ == "__main__":
+    main()
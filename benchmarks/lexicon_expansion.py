@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+English queries on the Chinese BM25 index, with and without the bilingual
+lexicon (``tools/rag/lexicon.py``), and how often BM25 answers alone.
+
+Queries are the ``lsa_dense`` pantry queries translated back to English:
+for each sampled dish, ``--ingredients`` items of its 必备原料和工具 list
+that the lexicon knows (as ingredients), written with their first English
+alias ("egg tomato scallion").  A query is a hit at *k* when a passage
+labelled with that dish is in the BM25 top *k*.  Rows:
+
+* english     – the English query as is (jieba tokens of English text)
+* expanded    – English aliases → each entry's usual Chinese term (served)
+* expanded+   – → all of the entry's Chinese terms
+* chinese     – the original Chinese items (upper bound)
+
+then the lexical shortcut on the served expansion: the share of queries it
+answers without the dense stages and rerank, how often those answers
+contain the sampled dish among their ``final_k`` passages (a pantry has
+many right answers, so this understates them) and how many of their
+passages have an ingredient list with every queried item.
+
+    python -m benchmarks.lexicon_expansion --dishes 300 --k 6 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from benchmarks.lsa_dense import _ITEM, _run  # noqa: E402
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_meta import _INGREDIENTS, extract  # noqa: E402
+from tools.rag.lexicon import LEXICON  # noqa: E402
+
+FINAL_K = 6                                       # chef_agent.final_k
+
+
+def _queries(texts, n_dishes: int, n_items: int, rnd: random.Random):
+    labels, _ = extract(texts)
+    chunks_of: dict[str, set[int]] = {}
+    for i, lab in enumerate(labels):
+        for label in lab:
+            if label.startswith("dish:"):
+                chunks_of.setdefault(label[5:], set()).add(i)
+    items: dict[str, list[tuple[str, str]]] = {}
+    for dish, ids in chunks_of.items():
+        for i in sorted(ids):
+            if (m := _INGREDIENTS.search(texts[i])) and dish not in items:
+                known = {}
+                for x in _ITEM.split(m.group(1)):
+                    e = LEXICON._by_term.get(x)
+                    if e is not None and e.kind == "ingredient" and e.en:
+                        known.setdefault(e.en[0], x)
+                if len(known) >= n_items:
+                    items[dish] = list(known.items())
+    dishes = rnd.sample(sorted(items), min(n_dishes, len(items)))
+    out = []
+    for d in dishes:
+        pick = rnd.sample(items[d], n_items)
+        out.append((" ".join(en for en, _ in pick), " ".join(zh for _, zh in pick),
+                    chunks_of[d]))
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", type=Path, default=ROOT / "indexes")
+    ap.add_argument("--dishes", type=int, default=300)
+    ap.add_argument("--ingredients", type=int, default=2)
+    ap.add_argument("--k", type=int, nargs="+", default=[FINAL_K, 20])
+    args = ap.parse_args()
+
+    bm25 = BM25.load(args.index / "bm25.pkl")
+    texts = list(bm25.chunks)
+    queries = _queries(texts, args.dishes, args.ingredients, random.Random(0))
+    bm25.GetBM25TopKIds("鸡蛋", 1)                                # jieba warm-up
+    search = lambda q, k: bm25.GetBM25TopKIds(q, k)               # noqa: E731
+    variants = {
+        "english": [(en, rel) for en, _, rel in queries],
+        "expanded": [(LEXICON.expand(en), rel) for en, _, rel in queries],
+        "expanded+": [(LEXICON.expand(en, alternatives=True), rel) for en, _, rel in queries],
+        "chinese": [(zh, rel) for _, zh, rel in queries],
+    }
+    print(f"{len(texts)} passages, {len(queries)} dishes, "
+          f"{args.ingredients} lexicon ingredients per query")
+    head = " ".join(f"{f'hit@{k}':>7}" for k in args.k)
+    print(f"{'query':10} {head} {'p50 ms':>8}")
+    for name, qs in variants.items():
+        rate, p50, _ = _run(search, qs, args.k)
+        print(f"{name:10} " + " ".join(f"{rate[k]:7.1%}" for k in args.k) + f" {p50:8.2f}")
+
+    recipe = bm25.chunks.select("recipe")
+    answered = hits = listed = 0
+    t = time.perf_counter()
+    for en, _, relevant in queries:
+        top = bm25.GetBM25TopKIds(LEXICON.expand(en), FINAL_K).tolist()
+        passages = bm25.chunks.texts(top)
+        if recipe[top].all() and LEXICON.confident(en, passages):
+            answered += 1
+            hits += bool(relevant.intersection(top))
+            wanted, _ = LEXICON.concepts(en)
+            listed += sum(any(all(any(z in m.group(1) for z in e.zh) for e in wanted)
+                              for m in _INGREDIENTS.finditer(p)) for p in passages)
+    ms = (time.perf_counter() - t) / max(len(queries), 1) * 1e3
+    n, a = max(len(queries), 1), max(answered, 1)
+    print(f"shortcut: {answered / n:.1%} of queries answered by BM25 alone "
+          f"({ms:.2f} ms each incl. search)")
+    print(f"  sampled dish among their {FINAL_K} passages: {hits / a:.1%}; passages with "
+          f"an ingredient list holding every item: {listed / (a * FINAL_K):.1%}")
+
+
+if __name__ == "__main__":
+    main()
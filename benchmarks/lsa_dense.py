@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Dense retrieval without the embedding API: the in-process LSA index
+(``tools/rag/lsa.py``) against BM25 and — when the version has an OpenAI
+``faiss/`` index and ``OPENAI_API_KEY`` is a real key — the
+``text-embedding-3-large`` index.
+
+Queries come from the book itself, with a known answer: for each sampled
+dish, ``--ingredients`` random items of its 必备原料和工具 list ("pantry"
+queries, what users send) and the dish name ("dish" queries).  A query is
+a hit at *k* when any passage labelled with that dish (``chunk_meta``) is
+in the top *k*.  Latency is per query, p50 / p95: embedding (LSA
+projection or the API round trip) plus the search.
+
+    python -m benchmarks.lsa_dense --dishes 150 --k 5 20
+    python -m benchmarks.lsa_dense --index indexes/20250601-0930 --dim 384
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools.rag import lsa  # noqa: E402
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_meta import _INGREDIENTS, extract  # noqa: E402
+
+# the ingredient list is one run of names; cut it at the usual item boundaries
+_ITEM = re.compile(r"[，、,（）()/\s]+|(?<=[油盐糖醋酒葱姜蒜椒肉蛋菜瓜粉面米])(?=[一-鿿])")
+
+
+def _queries(texts, n_dishes: int, n_items: int, rnd: random.Random):
+    labels, _ = extract(texts)
+    chunks_of: dict[str, set[int]] = {}
+    for i, lab in enumerate(labels):
+        for label in lab:
+            if label.startswith("dish:"):
+                chunks_of.setdefault(label[5:], set()).add(i)
+    items: dict[str, list[str]] = {}
+    for dish, ids in chunks_of.items():
+        for i in sorted(ids):
+            if (m := _INGREDIENTS.search(texts[i])) and dish not in items:
+                found = [x for x in _ITEM.split(m.group(1)) if 1 < len(x) <= 6]
+                if len(found) >= n_items:
+                    items[dish] = found
+    dishes = rnd.sample(sorted(items), min(n_dishes, len(items)))
+    pantry = [(" ".join(rnd.sample(items[d], n_items)), chunks_of[d]) for d in dishes]
+    named = [(d, chunks_of[d]) for d in dishes]
+    return {"pantry": pantry, "dish": named}
+
+
+def _run(search, queries, ks):
+    lat, hits = [], {k: 0 for k in ks}
+    for q, relevant in queries:
+        t = time.perf_counter()
+        ids = search(q, max(ks))
+        lat.append(time.perf_counter() - t)
+        for k in ks:
+            hits[k] += bool(relevant.intersection(np.asarray(ids[:k]).tolist()))
+    n = max(len(queries), 1)
+    return ({k: hits[k] / n for k in ks},
+            float(np.percentile(lat, 50)) * 1e3, float(np.percentile(lat, 95)) * 1e3)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", type=Path, default=ROOT / "indexes",
+                    help="version directory (bm25.pkl, chunks/, optional faiss/ and lsa/)")
+    ap.add_argument("--dishes", type=int, default=150)
+    ap.add_argument("--ingredients", type=int, default=3)
+    ap.add_argument("--k", type=int, nargs="+", default=[5, 20])
+    ap.add_argument("--dim", type=int, default=lsa.DIM)
+    args = ap.parse_args()
+
+    bm25 = BM25.load(args.index / "bm25.pkl")
+    texts = list(bm25.chunks)
+    queries = _queries(texts, args.dishes, args.ingredients, random.Random(0))
+    bm25.GetBM25TopKIds("鸡蛋", 1)                                # jieba warm-up
+
+    with tempfile.TemporaryDirectory() as tmp:
+        lsa_dir = args.index
+        if not lsa.exists(lsa_dir) or args.dim != lsa.DIM:
+            lsa_dir = Path(tmp)
+            t = time.perf_counter()
+            lsa.build(lsa_dir, bm25.chunks, dim=args.dim)
+            print(f"trained LSA (dim {args.dim}) in {time.perf_counter() - t:.1f} s")
+        dense = lsa.load(lsa_dir, bm25.chunks)
+        backends = {
+            "bm25": lambda q, k: bm25.GetBM25TopKIds(q, k),
+            f"lsa-{args.dim}": lambda q, k: dense.GetTopKIdsByVector(dense.EmbedQuery(q), k),
+        }
+        key = os.getenv("OPENAI_API_KEY", "")
+        if (args.index / "faiss").exists() and key not in ("", "bench"):
+            from tools.rag.faiss_retriever import FaissRetriever
+            remote = FaissRetriever.load(args.index / "faiss", chunks=bm25.chunks)
+            backends["openai"] = lambda q, k: remote.GetTopKIdsByVector(remote.EmbedQuery(q), k)
+        else:
+            print("(no faiss/ index or no OPENAI_API_KEY: OpenAI row skipped)")
+
+        print(f"{len(texts)} passages, {len(queries['pantry'])} dishes, "
+              f"{args.ingredients} ingredients per pantry query")
+        head = " ".join(f"{f'hit@{k}':>7}" for k in args.k)
+        print(f"{'backend':10} {'queries':8} {head} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, search in backends.items():
+            for kind, qs in queries.items():
+                rate, p50, p95 = _run(search, qs, args.k)
+                cells = " ".join(f"{rate[k]:7.1%}" for k in args.k)
+                print(f"{name:10} {kind:8} {cells} {p50:8.2f} {p95:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Cost of the per-request profiler (``tools/profiling.py``) on a retrieval-
+shaped request: BM25 on the shipped index through ``run_blocking`` plus an
+awaited 20 ms "upstream", ``--concurrency`` requests at a time.
+
+* off      – no request profiled (the production default)
+* sampled  – every request profiled (``X-Profile`` on all of them)
+
+Reports per-request p50 / p95 latency, throughput and, when sampled, the
+mean samples per buffered profile.  With profiling off the added cost is
+one context-variable lookup per blocking call.
+
+    python -m benchmarks.profiler_overhead --requests 400 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools import clients, profiling, tracing  # noqa: E402
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+
+
+async def _request(bm25, query: str, profile: bool) -> float:
+    t = time.perf_counter()
+    trace = tracing.begin_trace()
+    token = profiling.begin("/bench", profile)
+    try:
+        await asyncio.gather(clients.run_blocking(bm25.GetBM25TopKIds, query, 20),
+                             asyncio.sleep(0.02))
+    finally:
+        profiling.end(token)
+        tracing.end_trace(trace)
+    return time.perf_counter() - t
+
+
+async def _run(bm25, queries, concurrency: int, profile: bool):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with sem:
+            return await _request(bm25, q, profile)
+
+    t = time.perf_counter()
+    lat = await asyncio.gather(*(one(q) for q in queries))
+    return np.asarray(lat), time.perf_counter() - t
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    profiling.MAX_ACTIVE = args.concurrency
+
+    bm25 = BM25.load(ROOT / "indexes" / "bm25.pkl")
+    rnd = random.Random(0)
+    queries = [t[:12] for t in rnd.choices(list(bm25.chunks), k=args.requests)]
+    bm25.GetBM25TopKIds(queries[0], 20)                           # jieba warm-up
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"sampling every {profiling.INTERVAL * 1e3:.0f} ms")
+    print(f"{'mode':8} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8} {'samples/profile':>16}")
+    for mode in ("off", "sampled"):
+        lat, wall = asyncio.run(_run(bm25, queries, args.concurrency, mode == "sampled"))
+        kept = profiling.profiles() if mode == "sampled" else []
+        per = np.mean([p["samples"] for p in kept]) if kept else 0
+        print(f"{mode:8} {np.percentile(lat, 50) * 1e3:8.2f} {np.percentile(lat, 95) * 1e3:8.2f} "
+              f"{len(queries) / wall:8.1f} {per:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Throughput per worker: Flask (per-request ``asyncio.run``), Flask (shared loop)
+and the ASGI app, all driving the same stubbed agent.
+
+The agent's upstream calls are replaced by ``asyncio.sleep`` so the numbers
+isolate serving overhead from OpenAI/Cohere latency.
+
+    python -m benchmarks.serving_throughput --requests 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import types
+
+for var in ("OPENAI_API_KEY", "SPEECH_KEY", "SPEECH_REGION", "GOOGLEMAP_API"):
+    os.environ.setdefault(var, "bench")
+
+
+def _install_stub_agent(upstream_ms: float) -> None:
+    """Fake ``tools.chef_agent`` / ``tools.gatekeeper`` with fixed latency."""
+    delay = upstream_ms / 1000
+
+    chef = types.ModuleType("tools.chef_agent")
+
+    async def answer_query(question, history=None, precomputed_context=None):
+        await asyncio.sleep(delay)
+        return f"stub answer for {question}", "stub context"
+
+    chef.answer_query = answer_query
+    chef.detect_topic = lambda msg, ctx: None
+    chef.filter_passages = lambda topic, ctx: ctx
+
+    gk = types.ModuleType("tools.gatekeeper")
+
+    async def need_rag(focus, new_msg, session_id="anon"):
+        await asyncio.sleep(delay / 4)
+        return True, "RAG"
+
+    gk.need_rag = need_rag
+    sys.modules["tools.chef_agent"] = chef
+    sys.modules["tools.gatekeeper"] = gk
+
+
+def _serve_flask(port: int, legacy: bool):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    from server import agent, server
+    if legacy:
+        server.get_response = lambda msg, sid=None: asyncio.run(agent.aget_response(msg, sid))
+    else:
+        server.get_response = agent.get_response
+    httpd = make_server("127.0.0.1", port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.shutdown
+
+
+def _serve_asgi(port: int):
+    import uvicorn
+    from server.asgi import app
+    srv = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                        log_level="warning"))
+    threading.Thread(target=srv.run, daemon=True).start()
+    while not srv.started:
+        time.sleep(0.05)
+
+    def stop():
+        srv.should_exit = True
+    return stop
+
+
+async def _drive(url: str, n: int, concurrency: int) -> list[float]:
+    import httpx
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def one(i):
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post(url, json={"text": f"eggs {i % 17}"},
+                                      cookies={"sid": f"s{i % 50}"})
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+        await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--upstream-ms", type=float, default=200)
+    args = ap.parse_args()
+
+    _install_stub_agent(args.upstream_ms)
+    modes = [
+        ("flask (asyncio.run per request)", lambda p: _serve_flask(p, legacy=True)),
+        ("flask (shared loop)",             lambda p: _serve_flask(p, legacy=False)),
+        ("asgi (uvicorn, 1 worker)",        _serve_asgi),
+    ]
+    print(f"{'mode':34} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for i, (name, start) in enumerate(modes):
+        port = 5601 + i
+        stop = start(port)
+        time.sleep(0.3)
+        t0 = time.perf_counter()
+        lat = asyncio.run(_drive(f"http://127.0.0.1:{port}/api/text",
+                                 args.requests, args.concurrency))
+        wall = time.perf_counter() - t0
+        stop()
+        lat.sort()
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+        print(f"{name:34} {len(lat) / wall:8.1f} "
+              f"{statistics.median(lat) * 1e3:8.1f} {p99 * 1e3:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Heap bytes per live session: the previous ``ConversationMemory`` (list
+history, ``last_rag`` as the formatted passage text) against the compact one
+(``__slots__``, deque, chunk-ID array, zlib for older bot turns).
+
+Sessions hold five turns: a pantry / question from the user, a ~1 KB
+English answer, and six cached passages drawn from the shipped BM25
+passage table.  Heap use is measured with ``tracemalloc``; the
+``approx_bytes`` column is what the session store accounts per session.
+
+    python -m benchmarks.session_memory --sessions 5000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.ui_memory import ConversationMemory  # noqa: E402
+
+TEXTS = list(BM25.load(ROOT / "indexes" / "bm25.pkl").chunks)
+SEP = "\n\n---\n\n"
+DISHES = ["Tomato and Egg Stir-fry (番茄炒蛋)", "Mapo Tofu (麻婆豆腐)",
+          "Shredded Potato with Vinegar (醋溜土豆丝)", "Braised Pork Belly (红烧肉)",
+          "Kung Pao Chicken (宫保鸡丁)", "Steamed Egg Custard (蒸水蛋)"]
+SENTENCES = [
+    "Your {a} and {b} are a classic pairing for this dish.",
+    "Heat the wok until it just starts to smoke, then add oil and the {a}.",
+    "The {b} is critical; without it the dish loses its character.",
+    "Scallion and ginger are optional but recommended for aroma.",
+    "Season with a pinch of salt and sugar, then finish with a splash of soy sauce.",
+    "If you have no {c}, you can substitute with whatever greens are at hand.",
+    "Serve hot with steamed rice.",
+]
+INGREDIENTS = ["eggs", "tomatoes", "tofu", "pork belly", "potatoes", "chicken",
+               "scallions", "garlic", "ginger", "green peppers", "cabbage"]
+
+
+class LegacyMemory:
+    """``tools/ui_memory.ConversationMemory`` before the compact layout."""
+
+    def __init__(self, max_history=5):
+        self.max_history = max_history
+        self.history = []
+        self.last_rag = None
+        self.last_topic = None
+
+    def add_interaction(self, user_msg, bot_msg):
+        self.history.append((user_msg, bot_msg))
+        if len(self.history) > self.max_history:
+            self.history.pop(0)
+
+
+def _answer(rnd: random.Random) -> str:
+    dish = rnd.choice(DISHES)
+    lines = [f"Based on your ingredients, I suggest **{dish}**."]
+    while sum(map(len, lines)) < 1000:
+        a, b, c = rnd.sample(INGREDIENTS, 3)
+        lines.append(rnd.choice(SENTENCES).format(a=a, b=b, c=c))
+    return " ".join(lines) + "\nTERMINATE"
+
+
+def _session(cls, rnd: random.Random, **kw):
+    mem = cls(5, **kw)
+    for _ in range(6):
+        pantry = json.dumps(rnd.sample(INGREDIENTS, 4))
+        mem.add_interaction(pantry, _answer(rnd))
+    rows = rnd.sample(range(len(TEXTS)), 6)
+    if cls is LegacyMemory:
+        mem.last_rag = SEP.join(f"{i+1}. {TEXTS[r]}" for i, r in enumerate(rows))
+    else:
+        mem.last_rag = rows
+    mem.last_topic = "tomato and egg"
+    return mem
+
+
+def _measure(make, n: int) -> tuple[float, list]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [make(random.Random(i)) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n, sessions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=5000)
+    args = ap.parse_args()
+
+    modes = (("legacy", lambda r: _session(LegacyMemory, r)),
+             ("compact", lambda r: _session(ConversationMemory, r)),
+             ("compact+zlib", lambda r: _session(ConversationMemory, r, keep_plain=1)))
+    print(f"{args.sessions} sessions, 5 turns + 6 cached passages each")
+    print(f"{'layout':14} {'heap B/session':>15} {'approx_bytes':>13} "
+          f"{'JSON B':>8} {'read µs':>8}")
+    for name, make in modes:
+        per, sessions = _measure(make, args.sessions)
+        sample = sessions[: min(500, len(sessions))]
+        t0 = time.perf_counter()
+        for s in sample:                     # what one request reads back
+            if name == "legacy":
+                s.history[-5:], s.last_rag
+            else:
+                s.recent(5), SEP.join(f"{i+1}. {TEXTS[r]}" for i, r in enumerate(s.last_rag))
+        recent_us = (time.perf_counter() - t0) / len(sample) * 1e6
+        if name == "legacy":                 # the old 4-bytes-per-char estimate
+            approx = sum(4 * (sum(len(u) + len(b) for u, b in s.history)
+                              + len(s.last_rag) + len(s.last_topic)) for s in sample)
+            json_b = sum(len(json.dumps({"max_history": 5, "history": s.history,
+                                         "last_rag": s.last_rag, "last_topic": s.last_topic},
+                                        ensure_ascii=False).encode()) for s in sample)
+        else:
+            approx = sum(s.approx_bytes() for s in sample)
+            json_b = sum(len(json.dumps(s.to_dict(), ensure_ascii=False).encode())
+                         for s in sample)
+        approx, json_b = approx / len(sample), json_b / len(sample)
+        print(f"{name:14} {per:15,.0f} {approx:13,.0f} {json_b:8,.0f} {recent_us:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Retrieval latency and worker memory as the corpus grows: the shipped index
+(unsharded) against a sharded version with ``--shards`` copies of it.
+
+Every shard reuses the shipped BM25 arrays and passage table (symlinked)
+and gets its own hashed-vector FAISS index of ``--dim`` dimensions, drawn
+around a per-shard direction so the centroids differ.  Queries are passage
+prefixes; their vectors come from shard 0's distribution.  Configurations:
+
+* single  – the shipped index, no router
+* routed  – N shards; the query names shard 0's routing term, dense search
+            goes to the ``SHARD_FANOUT`` closest centroids
+* vocab   – N shards, no routing term: every shard shares the vocabulary,
+            so the lexical stage searches all of them (worst case)
+
+Each configuration runs in a fresh forked process and reports per-query
+p50 / p95 of the lexical and dense stage and the anonymous (private) memory
+the process gained (Linux only).
+
+    python -m benchmarks.shard_scaling --shards 10 --queries 300
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+
+SRC = ROOT / "indexes"
+
+
+def _anon_kb() -> int:
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Anonymous:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _write_faiss(d: Path, vectors: np.ndarray) -> None:
+    import faiss
+    d.mkdir(parents=True)
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, str(d / "index.faiss"))
+    np.save(d / "ids.npy", np.arange(len(vectors), dtype=np.int64))
+    (d / "meta.json").write_text(json.dumps({"normalize_L2": False, "dim": vectors.shape[1],
+                                             "rows": len(vectors)}))
+
+
+def _vectors(n: int, dim: int, shard: int) -> np.ndarray:
+    direction = np.random.default_rng(1000 + shard).standard_normal(dim).astype(np.float32)
+    noise = np.random.default_rng(shard).standard_normal((n, dim), dtype=np.float32)
+    return noise + 2.0 * direction
+
+
+def _build(tmp: Path, shards: int, dim: int) -> tuple[Path, Path]:
+    n = len(BM25.load(SRC / "bm25.pkl").chunks)
+    single = tmp / "single"
+    single.mkdir()
+    for name in ("bm25.pkl", "bm25_csr", "chunks"):
+        os.symlink(SRC / name, single / name)
+    _write_faiss(single / "faiss", _vectors(n, dim, 0))
+    sharded = tmp / "sharded"
+    entries = []
+    for i in range(shards):
+        d = sharded / "shards" / f"s{i}"
+        d.mkdir(parents=True)
+        for name in ("bm25.pkl", "bm25_csr", "chunks"):
+            os.symlink(SRC / name, d / name)
+        _write_faiss(d / "faiss", _vectors(n, dim, i))
+        entries.append({"name": f"s{i}", "terms": [f"区域{i}"], "passages": n})
+    (sharded / "shards.json").write_text(json.dumps({"shards": entries}, ensure_ascii=False))
+    return single, sharded
+
+
+def _run(config: str, single: Path, sharded: Path, queries, vectors, results) -> None:
+    from tools.rag import shards
+    from tools.rag.faiss_retriever import FaissRetriever
+
+    base = _anon_kb()
+    if config == "single":
+        bm25 = BM25.load(single / "bm25.pkl")
+        dense = FaissRetriever.load(single / "faiss", chunks=bm25.chunks)
+    else:
+        bm25, dense = shards.load(sharded, "text-embedding-3-large")
+    if config == "routed":
+        queries = [f"区域0 {q}" for q in queries]
+    lex, den = [], []
+    for q, v in zip(queries, vectors):
+        t = time.perf_counter()
+        bm25.GetBM25TopKIds(q, 20)
+        lex.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        dense.GetTopKIdsByVector(v, 20)
+        den.append(time.perf_counter() - t)
+    pct = lambda xs, p: float(np.percentile(xs[len(xs) // 10:], p)) * 1e3   # noqa: E731
+    results.put((pct(lex, 50), pct(lex, 95), pct(den, 50), pct(den, 95),
+                 (_anon_kb() - base) / 1024))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--dim", type=int, default=768)
+    args = ap.parse_args()
+
+    import jieba
+    jieba.initialize()                                  # shared by every forked run
+    texts = list(BM25.load(SRC / "bm25.pkl").chunks)
+    rnd = random.Random(0)
+    queries = [t[:12] for t in rnd.sample(texts, args.queries)]
+    vectors = _vectors(args.queries, args.dim, 0)
+    ctx = mp.get_context("fork")
+    with tempfile.TemporaryDirectory() as tmp:
+        single, sharded = _build(Path(tmp), args.shards, args.dim)
+        print(f"{len(texts)} passages per shard, dim {args.dim}, {args.queries} queries, "
+              f"SHARD_FANOUT={os.getenv('SHARD_FANOUT', '2')}")
+        print(f"{'config':8} {'passages':>9} {'bm25 p50':>9} {'p95 ms':>7} "
+              f"{'faiss p50':>10} {'p95 ms':>7} {'anon MB':>8}")
+        for config in ("single", "routed", "vocab"):
+            results = ctx.Queue()
+            p = ctx.Process(target=_run, args=(config, single, sharded, queries, vectors, results))
+            p.start()
+            row = results.get()
+            p.join()
+            n = len(texts) * (1 if config == "single" else args.shards)
+            print(f"{config:8} {n:9d} {row[0]:9.2f} {row[1]:7.2f} {row[2]:10.2f} "
+                  f"{row[3]:7.2f} {row[4]:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
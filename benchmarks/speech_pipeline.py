@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+/api/speech pipeline: legacy (upload → temp file → ffmpeg → temp WAV →
+``recognize_once`` on the file) versus the in-memory path (ffmpeg stdin/stdout
+pipe → PCM streamed into the recognizer while it decodes).
+
+The Azure recognizer is replaced by :class:`FakeRecognizer`, which consumes
+PCM at ``--realtime`` × real time and then needs ``--final-ms`` to produce the
+result — so streaming overlaps decoding with recognition and the legacy path
+does not.  Reports end-to-end latency and how many temp files each path left
+behind.
+
+    FFMPEG_BIN=/path/to/ffmpeg python -m benchmarks.speech_pipeline
+"""
+import argparse
+import io
+import math
+import os
+import queue
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tools.audio import speech_to_text as stt  # noqa: E402
+
+BYTES_PER_SEC = 16000 * 2
+
+
+class FakeRecognizer:
+    """Stands in for ``AzureStreamingRecognizer`` (write / close / result).
+
+    Like the SDK's push stream, ``write`` only buffers; a background thread
+    "recognizes" the audio as it arrives."""
+
+    def __init__(self, realtime: float, final_ms: float):
+        self.realtime, self.final_s = realtime, final_ms / 1000
+        self.received = 0
+        self._queue = queue.SimpleQueue()
+        self._worker = threading.Thread(target=self._consume, daemon=True)
+        self._worker.start()
+
+    def _consume(self) -> None:
+        while (pcm := self._queue.get()) is not None:
+            self.received += len(pcm)
+            time.sleep(len(pcm) / BYTES_PER_SEC / self.realtime)
+
+    def write(self, pcm: bytes) -> None:
+        self._queue.put(pcm)
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    def result(self) -> str:
+        self._worker.join()
+        time.sleep(self.final_s)
+        return f"{self.received / BYTES_PER_SEC:.1f}s of speech"
+
+
+def _recording(seconds: float) -> bytes:
+    """A browser-style webm/opus recording of a warbling tone."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(48000)
+        wf.writeframes(b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * (300 + 80 * math.sin(i / 4800)) * i / 48000)))
+            for i in range(int(48000 * seconds))))
+    out = subprocess.run([stt.FFMPEG_BIN, "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                          "-c:a", "libopus", "-f", "webm", "pipe:1"],
+                         input=buf.getvalue(), capture_output=True, check=True)
+    return out.stdout
+
+
+def _legacy(data: bytes, rec: FakeRecognizer, tmpdir: str) -> str:
+    """The old handler, temp files and all (pointed at *tmpdir* to count them)."""
+    tmp_in = tempfile.NamedTemporaryFile(delete=False, suffix=".webm", dir=tmpdir)
+    tmp_in.write(data)
+    tmp_in.close()
+    tmp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav", dir=tmpdir).name
+    subprocess.run([stt.FFMPEG_BIN, "-y", "-i", tmp_in.name, "-acodec", "pcm_s16le",
+                    "-ar", "16000", "-ac", "1", tmp_wav],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with wave.open(tmp_wav) as wf:                # recognize_once on the whole file
+        rec.write(wf.readframes(wf.getnframes()))
+    rec.close()
+    return rec.result()
+
+
+def _run(fn, clips, concurrency):
+    def one(data):
+        t0 = time.perf_counter()
+        fn(data)
+        return time.perf_counter() - t0
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(one, clips))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=16, help="uploads")
+    ap.add_argument("--seconds", type=float, default=6.0, help="clip length")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--realtime", type=float, default=8.0,
+                    help="recognizer speed as a multiple of real time")
+    ap.add_argument("--final-ms", type=float, default=300)
+    args = ap.parse_args()
+
+    clip = _recording(args.seconds)
+    clips = [clip] * args.n
+    print(f"{args.n} uploads of {args.seconds:.0f}s webm ({len(clip) / 1e3:.0f} kB), "
+          f"concurrency {args.concurrency}, ffmpeg cap {stt.FFMPEG_MAX_PROCS}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lat = _run(lambda d: _legacy(d, FakeRecognizer(args.realtime, args.final_ms), tmpdir),
+                   clips, args.concurrency)
+        rows.append(("legacy (temp files)", lat, len(os.listdir(tmpdir))))
+
+    before = set(os.listdir(tempfile.gettempdir()))
+    lat = _run(lambda d: stt.transcribe_bytes(
+        d, "audio/webm", recognizer=FakeRecognizer(args.realtime, args.final_ms)),
+        clips, args.concurrency)
+    leaked = len(set(os.listdir(tempfile.gettempdir())) - before)
+    rows.append(("in-memory pipe + streaming", lat, leaked))
+
+    print(f"{'pipeline':28} {'mean ms':>8} {'p50 ms':>8} {'max ms':>8} {'temp files left':>16}")
+    for name, lat, left in rows:
+        print(f"{name:28} {statistics.mean(lat) * 1e3:8.0f} {statistics.median(lat) * 1e3:8.0f} "
+              f"{max(lat) * 1e3:8.0f} {left:16d}")
+
+
+if __name__ == "__main__":
+    main()
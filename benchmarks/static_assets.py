@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Bytes on the wire for a first and a repeat visit to the front page, before
+(raw ``front_end/`` through Flask's static route) and after the asset build
+(``server.assets``: hashed AVIF/WebP/JPEG variants, precompressed HTML,
+immutable caching, ETag revalidation).
+
+A small browser model keeps an HTTP cache: ``immutable`` responses are reused
+without a request, everything else is revalidated with ``If-None-Match``.
+Counted bytes are status line + headers + body.
+
+    python -m server.assets                 # build front_end/dist first
+    python -m benchmarks.static_assets --check
+"""
+import argparse
+import gzip
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from flask import Flask  # noqa: E402
+
+from server import assets  # noqa: E402
+
+FRONT_DIR = ROOT / "front_end"
+ACCEPT_ENCODING = "gzip, deflate, br" if assets.brotli is not None else "gzip, deflate"
+brotli = assets.brotli
+
+
+class Browser:
+    """Fetch through a per-browser HTTP cache; counts requests and bytes."""
+
+    def __init__(self, fetch):
+        self.fetch = fetch                 # (path, headers) → (status, headers, body)
+        self.cache: dict[str, tuple[dict, bytes]] = {}
+        self.requests = self.bytes = 0
+
+    def get(self, path: str) -> bytes:
+        cached = self.cache.get(path)
+        if cached and "immutable" in cached[0].get("Cache-Control", ""):
+            return cached[1]
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if cached and "ETag" in cached[0]:
+            headers["If-None-Match"] = cached[0]["ETag"]
+        status, resp_headers, body = self.fetch(path, headers)
+        self.requests += 1
+        self.bytes += 17 + sum(len(k) + len(v) + 4 for k, v in resp_headers.items()) + len(body)
+        if status == 304:
+            return cached[1]
+        encoding = resp_headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "br":
+            body = brotli.decompress(body)
+        self.cache[path] = (resp_headers, body)
+        return body
+
+    def visit(self, viewport: int) -> tuple[int, int]:
+        r0, b0 = self.requests, self.bytes
+        html = self.get("/")
+        self.get("/" + _background_url(html, viewport))
+        return self.requests - r0, self.bytes - b0
+
+
+def _background_url(html: bytes, viewport: int) -> str:
+    """The background a browser supporting AVIF picks at *viewport* px."""
+    text = html.decode("utf-8", "replace")
+    if "image-set(" not in text:
+        return re.search(r"url\('([^']+)'\)", text).group(1)
+    chosen = re.search(r'image-set\(url\("([^"]+)"', text).group(1)      # base rule
+    for width, url in sorted(((int(w), u) for w, u in re.findall(
+            r'max-width: (\d+)px\) \{ body \{[^}]*?image-set\(url\("([^"]+)"', text)),
+            reverse=True):
+        if viewport <= width:
+            chosen = url
+    return chosen
+
+
+def _legacy_fetch():
+    app = Flask(__name__, static_folder=str(FRONT_DIR), static_url_path="")
+    app.add_url_rule("/", "index", lambda: app.send_static_file("index.html"))
+    client = app.test_client()
+
+    def fetch(path, headers):
+        r = client.get(path, headers=headers)
+        return r.status_code, {k: v for k, v in r.headers.items()}, r.data
+    return fetch
+
+
+def _built_fetch(dist: str):
+    site = assets.StaticAssets(dist)
+
+    def fetch(path, headers):
+        rel = "index.html" if path == "/" else path.lstrip("/")
+        reply = site.respond(rel, headers.get("Accept-Encoding", ""),
+                             headers.get("If-None-Match", ""))
+        if reply.status == 304:
+            return 304, reply.headers, b""
+        body = Path(reply.path).read_bytes()
+        return 200, {**reply.headers, "Content-Length": str(len(body))}, body
+    return fetch
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--check", action="store_true",
+                    help="fail unless the built site meets the byte budgets")
+    args = ap.parse_args()
+
+    dist = FRONT_DIR / "dist"
+    tmp = None
+    if not (dist / "index.html").exists():
+        tmp = tempfile.TemporaryDirectory()
+        dist = Path(tmp.name) / "dist"
+        assets.build(str(FRONT_DIR), str(dist))
+
+    print(f"{'site':8} {'device':8} {'first visit':>18} {'repeat visit':>18}")
+    results = {}
+    for name, make in (("legacy", _legacy_fetch), ("built", lambda: _built_fetch(str(dist)))):
+        for device, viewport in (("desktop", 1920), ("mobile", 412)):
+            browser = Browser(make())
+            first, repeat = browser.visit(viewport), browser.visit(viewport)
+            results[name, device] = first, repeat
+            print(f"{name:8} {device:8} {first[1]:>10,} B {first[0]:>2} req "
+                  f"{repeat[1]:>10,} B {repeat[0]:>2} req")
+
+    if args.check:
+        for device in ("desktop", "mobile"):
+            (f_req, f_bytes), (r_req, r_bytes) = results["built", device]
+            assert f_bytes < 100_000, f"{device}: first visit {f_bytes} B"
+            assert r_req == 1 and r_bytes < 1_000, f"{device}: repeat visit {r_bytes} B"
+            assert f_bytes * 10 < results["legacy", device][0][1]
+        print("byte budgets OK")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Tail latency of the /api/text pipeline under injected upstream latency,
+with and without the ``tools.resilience`` call layer.
+
+The stage graph mirrors ``server.agent`` / ``tools.chef_agent``: gatekeeper →
+(BM25 ‖ query embedding) → Cohere rerank → generation.  Upstreams are
+stubbed with log-normal latency plus a slow tail (``--slow-p`` of calls take
+``--slow-x`` times longer); the ``outage`` scenario additionally makes
+Cohere hang and fail for the middle third of the run.  Rerank goes through
+the real ``APIReranker`` with a stubbed client, so its hedging and
+keep-fused-order fallback are the production code paths.
+
+Latencies and stage timeouts are scaled by ``--scale`` (default 0.1) to keep
+the run short; ratios between modes are what matter.
+
+    python -m benchmarks.tail_latency
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("COHERE_API_KEY", "bench")
+
+from langchain.schema import Document  # noqa: E402
+
+from tools import resilience, tracing  # noqa: E402
+from tools.clients import run_blocking  # noqa: E402
+from tools.rag.rerank_api import APIReranker  # noqa: E402
+
+# median latency (ms) at scale 1
+MEDIANS = {"gatekeeper": 350, "embed": 250, "rerank": 300, "generate": 1500}
+OUTAGE_HANG_MS = 10_000
+
+
+class FakeUpstream:
+    def __init__(self, name, scale, slow_p, slow_x, rnd, outage=None):
+        self.name, self.scale, self.slow_p, self.slow_x = name, scale, slow_p, slow_x
+        self.rnd, self.outage = rnd, outage          # outage: (t_start, t_end) monotonic
+
+    def _delay(self) -> tuple[float, bool]:
+        now = time.monotonic()
+        if self.outage and self.outage[0] <= now < self.outage[1]:
+            return OUTAGE_HANG_MS * self.scale / 1000, True
+        d = MEDIANS[self.name] * self.rnd.lognormvariate(0, 0.25)
+        if self.rnd.random() < self.slow_p:
+            d *= self.slow_x
+        return d * self.scale / 1000, False
+
+    async def acall(self):
+        d, fail = self._delay()
+        await asyncio.sleep(d)
+        if fail:
+            raise ConnectionError(f"{self.name} unavailable")
+        return self.name
+
+    def call(self):
+        d, fail = self._delay()
+        time.sleep(d)
+        if fail:
+            raise ConnectionError(f"{self.name} unavailable")
+        return self.name
+
+
+class StubCohere:
+    def __init__(self, upstream: FakeUpstream):
+        self.upstream = upstream
+
+    def rerank(self, query, documents, top_n, model):
+        self.upstream.call()
+        results = [types.SimpleNamespace(index=i, relevance_score=-i)
+                   for i in range(len(documents))]
+        return types.SimpleNamespace(results=results)
+
+
+async def _request(i: int, ups: dict, reranker: APIReranker, guard: bool, budget: float):
+    query = f"query {i}"
+    docs = [Document(page_content=f"{query} passage {k}") for k in range(12)]
+    if not guard:
+        await ups["gatekeeper"].acall()
+        await asyncio.gather(asyncio.sleep(0.005), ups["embed"].acall())
+        await run_blocking(reranker._rerank_call, query, [d.page_content for d in docs])
+        return await ups["generate"].acall()
+
+    with resilience.budget(budget):
+        await resilience.guarded("gatekeeper", ups["gatekeeper"].acall, fallback=lambda: None)
+        await asyncio.gather(
+            asyncio.sleep(0.005),
+            resilience.guarded("embed", ups["embed"].acall, fallback=lambda: None))
+        await run_blocking(reranker.predict, query, docs)
+        return await resilience.guarded("generate", ups["generate"].acall)
+
+
+def _reset_stages(scale: float) -> None:
+    for name, st in list(resilience.STAGES.items()):
+        timeout = None if st.timeout is None else st.timeout * scale
+        resilience.STAGES[name] = resilience.Stage(name, timeout, hedge=st.hedge)
+
+
+async def _run(args, scenario: str, guard: bool, defaults: dict):
+    rnd = random.Random(11)
+    resilience.STAGES.update(defaults)
+    _reset_stages(args.scale)
+    resilience.BREAKER_COOLDOWN = 15 * args.scale
+    for st in resilience.STAGES.values():
+        st.breaker.cooldown = resilience.BREAKER_COOLDOWN
+
+    t_start = time.monotonic()
+    expected = args.n / args.concurrency * sum(MEDIANS.values()) * args.scale / 1000
+    outage = (t_start + expected / 3, t_start + 2 * expected / 3) if scenario == "outage" else None
+    ups = {name: FakeUpstream(name, args.scale, args.slow_p, args.slow_x, rnd,
+                              outage if name == "rerank" else None)
+           for name in MEDIANS}
+    reranker = APIReranker()
+    reranker.client = StubCohere(ups["rerank"])
+
+    sem = asyncio.Semaphore(args.concurrency)
+    lat, errors = [], 0
+    degraded0 = {k: v for k, v in resilience.DEGRADED._series.items()}
+    hedges0 = sum(resilience.HEDGES._series.values())
+
+    async def one(i):
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await _request(i, ups, reranker, guard, resilience.REQUEST_BUDGET * args.scale)
+            except Exception:
+                errors += 1
+            lat.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one(i) for i in range(args.n)))
+    degraded = sum(v - degraded0.get(k, 0) for k, v in resilience.DEGRADED._series.items())
+    hedges = sum(resilience.HEDGES._series.values()) - hedges0
+    return lat, errors, int(degraded), int(hedges)
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p * len(xs)))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--slow-p", type=float, default=0.05)
+    ap.add_argument("--slow-x", type=float, default=10)
+    ap.add_argument("--scale", type=float, default=0.1)
+    args = ap.parse_args()
+    defaults = dict(resilience.STAGES)
+    tracing.logger.disabled = True
+
+    print(f"{args.n} requests, concurrency {args.concurrency}, "
+          f"{args.slow_p:.0%} of upstream calls {args.slow_x:g}x slower, scale {args.scale:g}")
+    print(f"{'scenario':9} {'mode':10} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+          f"{'errors':>7} {'degraded':>9} {'hedges':>7}")
+    for scenario in ("tail", "outage"):
+        for guard in (False, True):
+            lat, errors, degraded, hedges = asyncio.run(_run(args, scenario, guard, defaults))
+            ms = lambda s: s * 1000 / args.scale       # report at production scale
+            print(f"{scenario:9} {'guarded' if guard else 'plain':10} "
+                  f"{ms(statistics.median(lat)):7.0f} {ms(_pct(lat, .95)):7.0f} "
+                  f"{ms(_pct(lat, .99)):7.0f} {ms(max(lat)):7.0f} "
+                  f"{errors:7d} {degraded:9d} {hedges:7d}")
+
+
+if __name__ == "__main__":
+    main()
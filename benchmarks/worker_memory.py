@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Resident memory per worker count for three ways of holding the BM25 index
+(plus the FAISS index when ``indexes/faiss`` exists):
+
+* private  – every worker unpickles its own copy after fork (old behaviour)
+* preload  – loaded once before fork, ``gc.freeze()``, shared copy-on-write
+* mmap     – every worker maps ``indexes/bm25_csr/*.npy`` read-only
+
+Each worker runs a few queries (so touched pages are really touched), then
+reports ``Pss`` / ``Private_*`` from ``/proc/self/smaps_rollup`` (Linux only).
+
+    python -m benchmarks.worker_memory --workers 1 2 4 8
+"""
+import argparse
+import gc
+import gzip
+import os
+import pickle
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import jieba  # noqa: E402
+from tools.rag.bm25_retriever import BM25  # noqa: E402
+from tools.rag.chunk_store import ChunkStore  # noqa: E402
+
+BM25_PATH = ROOT / "indexes" / "bm25.pkl"
+QUERIES = ["鸡蛋 青椒", "红烧肉", "豆腐 葱", "土豆 牛肉", "西红柿炒蛋"]
+
+
+def _rollup() -> dict:
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1])
+    return out
+
+
+def _load(mode: str):
+    if mode == "mmap":
+        return BM25.load(BM25_PATH, mmap=True)
+    # "private": the pickle path, ignoring the flat layout
+    obj = object.__new__(BM25)
+    with gzip.open(BM25_PATH, "rb") as f:
+        obj.retriever = pickle.load(f)
+        obj.chunks = ChunkStore.from_texts(d.page_content for d in pickle.load(f))
+    obj.documents = None
+    return obj
+
+
+def _work(index) -> None:
+    for q in QUERIES * 4:
+        index.GetBM25TopK(q, 20)
+
+
+def _run(mode: str, n: int) -> tuple[int, int]:
+    shared = None
+    if mode == "preload":
+        shared = BM25.load(BM25_PATH, mmap=False)
+        jieba.initialize()
+        gc.collect()
+        gc.freeze()
+    pipes = []
+    for _ in range(n):
+        r, w = os.pipe()
+        if os.fork() == 0:
+            os.close(r)
+            index = shared if shared is not None else _load(mode)
+            jieba.initialize()
+            _work(index)
+            m = _rollup()
+            os.write(w, f"{m.get('Pss', 0)} {m.get('Private_Clean', 0) + m.get('Private_Dirty', 0)}".encode())
+            os._exit(0)
+        os.close(w)
+        pipes.append(r)
+    pss = priv = 0
+    for r in pipes:
+        a, b = os.read(r, 64).split()
+        pss, priv = pss + int(a), priv + int(b)
+        os.close(r)
+    for _ in range(n):
+        os.wait()
+    if shared is not None:
+        gc.unfreeze()
+    return pss, priv
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = ap.parse_args()
+    jieba.setLogLevel(60)
+    if not BM25.compact_dir(BM25_PATH).exists():
+        BM25.load(BM25_PATH).save_compact(BM25.compact_dir(BM25_PATH))
+
+    print(f"{'mode':8} {'workers':>7} {'total PSS MB':>13} {'PSS/worker MB':>14} {'private/worker MB':>18}")
+    for mode in ("private", "preload", "mmap"):
+        for n in args.workers:
+            pss, priv = _run(mode, n)
+            print(f"{mode:8} {n:7d} {pss / 1024:13.1f} {pss / 1024 / n:14.1f} {priv / 1024 / n:18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+gunicorn settings — warm up once in the master, then fork workers.
+
+    gunicorn -c gunicorn.conf.py server.server:app                      # Flask
+    CHEF_ASGI=1 gunicorn -c gunicorn.conf.py server.asgi:app            # ASGI
+
+Importing the app loads nothing heavy (see ``tools/startup.py``); the
+subsystems in ``CHEF_WARMUP`` (default here: ``rag,queries``) are loaded
+before any worker accepts traffic.  With ``preload_app`` that happens in the master, so
+the BM25 arrays, the FAISS matrix (C++ heap) and the jieba dictionary are
+built before ``fork()`` and shared copy-on-write.  ``gc.freeze()`` moves
+everything loaded so far into the permanent generation so the cyclic GC in
+each worker never writes to (and thereby un-shares) those pages.
+The query-cache warm-up (``queries``) makes upstream calls on thread pools,
+which do not survive ``fork()``; it always runs in ``post_worker_init``.
+Set ``CHEF_PRELOAD=0`` to compare against one private copy per worker
+(warmed in ``post_worker_init``), ``CHEF_WARMUP=none`` for a lazy boot.
+"""
+import gc
+import os
+
+os.environ.setdefault("CHEF_WARMUP", "rag,queries")
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = 120
+preload_app = os.getenv("CHEF_PRELOAD", "1") != "0"
+if os.getenv("CHEF_ASGI") == "1":
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def when_ready(server):
+    if preload_app:
+        from tools import startup
+        startup.warm_up(before_fork=True)
+        server.log.info("warm-up: %s", startup.report()["seconds"])
+        gc.collect()
+        gc.freeze()
+        server.log.info("indexes preloaded; %d objects frozen for copy-on-write",
+                        gc.get_freeze_count())
+
+
+def post_worker_init(worker):
+    from tools import startup
+    startup.warm_up()          # everything when not preloading, else what must not fork
@@ -0,0 +1,112 @@
+# admission.py
+"""Request admission control shared by the Flask and ASGI servers.
+
+Every expensive endpoint (text, image, bulk, speech, grocery) must pass
+
+1. a per-session token bucket (``SESSION_RPS`` / ``SESSION_BURST``) —
+   over-eager clients get ``429``, and
+2. a bounded in-flight limit (``CHEF_MAX_INFLIGHT``) with a bounded FIFO
+   queue (``CHEF_MAX_QUEUE``) whose wait is capped by ``CHEF_QUEUE_TIMEOUT``
+   — anything beyond that gets ``503`` right away rather than timing out later.
+
+Both carry ``Retry-After``; queue depth, in-flight count and shed counts are
+exported through ``/api/metrics`` (``chef_limit_*``).
+
+Sessions are the ``sid`` cookie, which the servers set on the first API
+response that lacks one.  A request without it (first turn, clients that
+drop cookies) is not rate-limited per session — never by peer address,
+which every client behind one proxy or NAT shares — only by 2.
+"""
+import math
+import os
+import re
+import secrets
+import threading
+import time
+
+from tools.limits import KeyedRateLimiter, Limiter, Overloaded
+
+MAX_INFLIGHT  = int(os.getenv("CHEF_MAX_INFLIGHT", "32"))
+MAX_QUEUE     = int(os.getenv("CHEF_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("CHEF_QUEUE_TIMEOUT", "5"))
+SESSION_RPS   = float(os.getenv("SESSION_RPS", "1"))
+SESSION_BURST = float(os.getenv("SESSION_BURST", "5"))
+
+# Flask endpoint names / ASGI paths that go through admission
+ADMITTED_ENDPOINTS = {"api_text", "api_image", "api_bulk", "api_speech", "api_grocery"}
+ADMITTED_PATHS     = {"/api/text", "/api/image", "/api/bulk", "/api/speech", "/api/grocery"}
+
+SESSION_COOKIE = "sid"
+_SID_RE = re.compile(r"^[A-Za-z0-9\-_]{16,64}$")
+
+
+def session_cookie(value: str | None) -> str | None:
+    """The session ID in a ``sid`` cookie value, ``None`` unless well-formed."""
+    return value if value and _SID_RE.match(value) else None
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(18)
+
+
+def session_cookie_header(session_id: str) -> str:
+    """``Set-Cookie`` value handing *session_id* to the browser."""
+    return f"{SESSION_COOKIE}={session_id}; Path=/; HttpOnly; SameSite=Lax"
+
+
+class Admission:
+    """In-flight limit + queue + per-session rate limit for one worker."""
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT, session_rps: float = SESSION_RPS,
+                 session_burst: float = SESSION_BURST):
+        self.slots = Limiter("requests", max_inflight, max_waiting=max_queue,
+                             timeout=queue_timeout)
+        self.sessions = KeyedRateLimiter("session", session_rps, session_burst)
+        self._lock = threading.Lock()
+        self._service = 1.0          # EWMA of admitted request duration (s)
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued request would be served."""
+        return (self.slots.waiting + 1) * self._service / self.slots.concurrency
+
+    def _shed(self, err: Overloaded) -> Overloaded:
+        err.retry_after = max(1, math.ceil(min(self.retry_after(), self.slots.timeout)))
+        return err
+
+    def admit(self, session_id: str | None) -> float:
+        """Block until admitted (returns a start stamp for :meth:`done`) or
+        raise :class:`~tools.limits.Overloaded` / ``RateLimited``; no
+        per-session limit without a *session_id* (no session cookie)."""
+        if session_id is not None:
+            self.sessions.check(session_id)
+        try:
+            self.slots.acquire()
+        except Overloaded as err:
+            raise self._shed(err) from None
+        return time.monotonic()
+
+    async def aadmit(self, session_id: str | None) -> float:
+        if session_id is not None:
+            self.sessions.check(session_id)
+        try:
+            await self.slots.acquire_async()
+        except Overloaded as err:
+            raise self._shed(err) from None
+        return time.monotonic()
+
+    def done(self, started: float) -> None:
+        self.slots.release()
+        with self._lock:
+            self._service += 0.1 * (time.monotonic() - started - self._service)
+
+
+def overload_payload(err: Overloaded) -> tuple[dict, int, dict]:
+    """``(json body, status, headers)`` for a shed request."""
+    msg = ("Too many requests, please slow down." if err.status == 429
+           else "The kitchen is busy, please try again shortly.")
+    return ({"error": msg, "retry_after": err.retry_after},
+            err.status, {"Retry-After": str(err.retry_after)})
+
+
+admission = Admission()
@@ -1,22 +1,37 @@
 import asyncio
+import contextvars
+import json
+import queue
+import threading
 from tools import chef_agent
-from tools.ui_memory import ConversationMemory
+from tools.rag import index_store
 import os
 from tools.gatekeeper import need_rag
+from tools.entity_recognition.ingredient_recognition import adetect_many, merge_detections
+from tools import profiling, query_log, tracing
+from .sessions import SessionStore
 
-_sessions: dict[str, ConversationMemory] = {}
+_sessions = SessionStore.from_env()
 
-async def _async_get_response(msg: str, session_id: str | None):
+MAX_IMAGES         = int(os.getenv("MAX_IMAGES_PER_REQUEST", "8"))
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+MAX_BULK           = int(os.getenv("MAX_BULK_PANTRIES", "100"))
+BULK_CONCURRENCY   = int(os.getenv("BULK_CONCURRENCY", "8"))
+
+async def aget_response(msg: str, session_id: str | None) -> str:
     sid = session_id or "anon"
-    mem = _sessions.setdefault(sid, ConversationMemory(5))
-    history_pairs = mem.history[-5:]
+    mem = await _sessions.aget(sid)
+    history_pairs = mem.recent(5)
 
     # 1. gatekeeper
-    hist_for_gk = "\n".join(f"U:{u} A:{a}" for u, a in mem.history[-5:])
-    rag_needed, _ = await need_rag(hist_for_gk, msg, sid)
+    hist_for_gk = "\n".join(f"U:{u} A:{a}" for u, a in history_pairs)
+    rag_needed, verdict = await need_rag(hist_for_gk, msg, sid)
 
     # 2. context selection
-    cached_ctx = None if rag_needed or mem.last_rag is None else mem.last_rag
+    # (chunk IDs from an index version that has since been swapped out → None)
+    cached_ctx = (None if rag_needed or mem.last_rag is None
+                  else chef_agent.chunk_context(mem.last_rag, mem.rag_version))
+    tracing.record_cache("rag_context", cached_ctx is not None)
 
     # 3. main agent (stick the last topic in front so the LLM “knows the it”)
     user_query = f"{mem.last_topic or ''} {msg}".strip() if not rag_needed else msg
@@ -25,17 +40,119 @@ async def _async_get_response(msg: str, session_id: str | None):
                                                 cached_ctx)
     # 4. update memory
     mem.add_interaction(msg, answer)
+    idx = chef_agent.indexes.current()      # one snapshot for the log and the session
+    retrieved = cached_ctx is None
+    query_log.record(user_query, verdict, retrieved, idx.version,
+                     chef_agent.chunk_ids(ctx, idx) if retrieved else ())
 
     if rag_needed:
         topic = chef_agent.detect_topic(msg, ctx) or mem.last_topic or ""
         mem.last_topic = topic
-        mem.last_rag   = chef_agent.filter_passages(topic, ctx)
+        mem.last_rag   = chef_agent.chunk_ids(chef_agent.filter_passages(topic, ctx), idx)
+        mem.rag_version = idx.version
         prefix = mem.last_topic or ""
         if len(prefix) > 40:
             prefix = ""                     # too long – skip
         user_query = f"{prefix} {msg}".strip() if not rag_needed else msg
 
+    await _sessions.aput(sid, mem)
     return answer
 
+async def aget_images_response(images: list[bytes], session_id: str | None) -> str:
+    """Concurrent vision detections → merged pantry → a single agent turn."""
+    detections = await adetect_many(images[:MAX_IMAGES], VISION_CONCURRENCY)
+    pantry = merge_detections(detections)
+    return await aget_response(json.dumps(pantry, ensure_ascii=False), session_id)
+
+def _pantry_question(pantry) -> str:
+    return pantry.strip() if isinstance(pantry, str) else json.dumps(pantry, ensure_ascii=False)
+
+async def aget_bulk_responses(pantries: list):
+    """Meal ideas for many pantries at once (no chat history); async-yields
+    ``{"index", "pantry", "response" | "error"}`` in completion order."""
+    questions = [_pantry_question(p) for p in pantries]
+    async for i, answer in chef_agent.answer_many(questions, BULK_CONCURRENCY):
+        item = {"index": i, "pantry": pantries[i]}
+        if isinstance(answer, Exception):
+            item["error"] = str(answer) or type(answer).__name__
+        else:
+            item["response"] = answer
+        yield item
+
+def index_status() -> dict:
+    return chef_agent.indexes.status()
+
+def reload_indexes(version: str | None = None, wait: bool = False) -> dict:
+    """Swap this worker to *version* (default: the manifest's current one).
+    Naming a version also publishes it, so watching workers follow."""
+    if version:
+        index_store.publish(chef_agent.INDEX_DIR, version)
+    return chef_agent.indexes.reload(version, wait)
+
+# ───────────────────── one long-lived loop for sync callers ─────────────────────
+# Flask handlers are synchronous.  Instead of spinning up (and tearing down) an
+# event loop per request with asyncio.run, every request is scheduled onto one
+# background loop so pooled upstream connections survive between requests.
+# The loop is started lazily, i.e. after a pre-fork server has forked.
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_pid = 0
+_loop_lock = threading.Lock()
+
+def _shared_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop.is_closed() or _loop_pid != os.getpid():
+            _loop, _loop_pid = asyncio.new_event_loop(), os.getpid()
+            threading.Thread(target=_loop.run_forever, name="chef-agent-loop",
+                             daemon=True).start()
+        return _loop
+
+def _submit(coro):
+    """Schedule *coro* on the shared loop with the caller's context variables
+    (trace, request budget) carried over; returns a concurrent future."""
+    ctx = contextvars.copy_context()
+
+    async def _in_context():
+        for var, value in ctx.items():
+            var.set(value)
+        profiling.attach()
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(_in_context(), _shared_loop())
+
+def run_sync(coro):
+    """Run *coro* on the shared loop and block for its result."""
+    return _submit(coro).result()
+
+def iter_sync(agen):
+    """Drive async generator *agen* on the shared loop; yield its items here.
+    Closing this generator early (client went away) cancels the producer."""
+    items: queue.Queue = queue.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except Exception as err:
+            items.put(err)
+        finally:
+            items.put(end)
+
+    fut = _submit(pump())
+    try:
+        while (item := items.get()) is not end:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        fut.cancel()
+
 def get_response(msg: str, session_id: str | None = None) -> str:
-    return asyncio.run(_async_get_response(msg, session_id))
+    return run_sync(aget_response(msg, session_id))
+
+def get_images_response(images: list[bytes], session_id: str | None = None) -> str:
+    return run_sync(aget_images_response(images, session_id))
+
+def get_bulk_responses(pantries: list):
+    return iter_sync(aget_bulk_responses(pantries))
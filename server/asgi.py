@@ -0,0 +1,368 @@
+# asgi.py
+"""ASGI serving mode — same routes and static front end as ``server.server``.
+
+Everything runs on the server's single long-lived event loop: the agent is
+awaited directly (no per-request ``asyncio.run``), OpenAI calls go through one
+pooled ``AsyncOpenAI`` client, and the blocking SDKs (vision, Azure STT,
+ffmpeg pipes, Google Places) run on the bounded pool from ``tools.clients``.
+
+Run with::
+
+    uvicorn server.asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import contextlib
+import hmac
+import json
+import re
+import time
+import logging
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.exceptions import HTTPException
+from starlette.responses import (FileResponse, JSONResponse, PlainTextResponse, Response,
+                                 StreamingResponse)
+from starlette.routing import Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from .config import (FRONT_DIR, SPEECH_KEY, SPEECH_REGION,
+                     GOOGLEMAP_API, GROCERY_RADIUS, ADMIN_TOKEN)
+from .agent import (aget_response, aget_images_response, aget_bulk_responses, MAX_BULK,
+                    index_status, reload_indexes)
+from tools.audio.speech_to_text import transcribe_bytes, AudioConversionError
+from tools.entity_recognition.image_prep import ImageDecodeError
+from tools.grocery_search.grocery_helper import search_grocery_store_nearby
+from tools import clients, profiling, resilience, startup, tracing
+from tools.limits import Overloaded
+from .admission import (admission, overload_payload, ADMITTED_PATHS, SESSION_COOKIE,
+                        new_session_id, session_cookie, session_cookie_header)
+from .assets import site
+
+logger = logging.getLogger(__name__)
+
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9\-_.]{8,64}$")
+
+
+def _session_id(request: Request) -> str:
+    """The ``sid`` cookie, or the session ID this request hands out."""
+    return (session_cookie(request.cookies.get(SESSION_COOKIE))
+            or getattr(request.state, "new_sid", None)
+            or "anon")
+
+
+def _endpoint(scope) -> str:
+    """Name of the route *scope* matches (the view's name, as Flask's
+    ``request.endpoint``); ``other`` for unmatched paths and methods, so
+    arbitrary URLs never become metric labels."""
+    for route in routes:
+        if isinstance(route, Route) and route.matches(scope)[0] == Match.FULL:
+            return route.name
+    return "other"
+
+
+class TraceMiddleware:
+    """Per-request trace ID (``X-Trace-Id``), request-duration histogram, the
+    latency budget upstream deadlines are derived from, and the opt-in
+    profile of the request (``tools/profiling.py``)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        incoming = headers.get(b"x-trace-id", b"").decode("latin-1")
+        token = tracing.begin_trace(incoming if _TRACE_ID_RE.match(incoming) else None)
+        trace_id = tracing.current_trace_id()
+        budget = resilience.begin_budget()
+        profile = None
+        if scope.get("path") in ADMITTED_PATHS:
+            profile = profiling.begin(scope["path"], headers.get(b"x-profile") == b"1" and
+                                      _is_admin(headers.get(b"x-admin-token", b"").decode("latin-1")))
+        t0 = time.perf_counter()
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(
+                    (b"x-trace-id", trace_id.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            if scope.get("path", "").startswith("/api/"):
+                tracing.REQUEST_SECONDS.observe(time.perf_counter() - t0, _endpoint(scope))
+            profiling.end(profile)
+            resilience.end_budget(budget)
+            tracing.end_trace(token)
+
+
+class AdmissionMiddleware:
+    """Per-session rate limit + bounded in-flight/queue for the API routes;
+    hands out the session cookie to requests without one."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in ADMITTED_PATHS:
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        sid = session_cookie(request.cookies.get(SESSION_COOKIE))
+        if sid is None:
+            request.state.new_sid = new_session_id()       # seen by _session_id
+            send = _with_cookie(send, request.state.new_sid)
+        try:
+            started = await admission.aadmit(sid)
+        except Overloaded as err:
+            response = await overloaded(Request(scope), err)
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.done(started)
+
+
+def _with_cookie(send, session_id: str):
+    header = (b"set-cookie", session_cookie_header(session_id).encode("latin-1"))
+
+    async def send_with_cookie(message):
+        if message["type"] == "http.response.start":
+            message.setdefault("headers", []).append(header)
+        await send(message)
+    return send_with_cookie
+
+
+async def overloaded(request: Request, err: Overloaded):
+    body, status, headers = overload_payload(err)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def config(request: Request):
+    return JSONResponse({"googlemaps_api_key": GOOGLEMAP_API})
+
+
+_site = site(FRONT_DIR)
+
+
+def _asset(request: Request, rel: str):
+    reply = _site.respond(rel, request.headers.get("accept-encoding", ""),
+                          request.headers.get("if-none-match", ""))
+    if reply is None:
+        raise HTTPException(status_code=404)
+    if reply.status == 304:
+        return Response(status_code=304, headers=reply.headers)
+    return FileResponse(reply.path, headers=reply.headers)
+
+
+async def index(request: Request):
+    return _asset(request, "index.html")
+
+
+async def asset(request: Request):
+    return _asset(request, "assets/" + request.path_params["name"])
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(tracing.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+
+def _is_admin(token: str) -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _require_admin(request: Request) -> None:
+    if not _is_admin(request.headers.get("x-admin-token", "")):
+        raise HTTPException(status_code=403)
+
+
+async def admin_index(request: Request):
+    _require_admin(request)
+    return JSONResponse(index_status())
+
+
+async def admin_reload(request: Request):
+    _require_admin(request)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    data = data if isinstance(data, dict) else {}
+    try:
+        status = await clients.run_blocking(reload_indexes, data.get("version"),
+                                            bool(data.get("wait")))
+    except FileNotFoundError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    return JSONResponse(status, status_code=202 if status["loading"] else 200)
+
+
+async def admin_startup(request: Request):
+    _require_admin(request)
+    return JSONResponse(startup.report())
+
+
+async def admin_profiles(request: Request):
+    _require_admin(request)
+    return JSONResponse(profiling.profiles())
+
+
+async def admin_profile_folded(request: Request):
+    _require_admin(request)
+    profile_id = request.query_params.get("id")          # none: all buffered, merged
+    folded = profiling.folded(profile_id)
+    if folded is None:
+        return JSONResponse({"error": f"no profile {profile_id!r}"}, status_code=404)
+    return PlainTextResponse(folded)
+
+
+async def _json_object(request: Request) -> dict | None:
+    """The request body as a JSON object; ``None`` when it is not one."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+_BAD_JSON = {"error": "Request body must be a JSON object"}
+
+
+# 1. Text endpoint
+async def api_text(request: Request):
+    data = await _json_object(request)
+    if data is None:
+        return JSONResponse(_BAD_JSON, status_code=400)
+    text = data.get("text", "").strip()
+    if not text:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+
+    resp = await aget_response(text, _session_id(request))
+    return JSONResponse({"response": resp})
+
+
+# 2. Image endpoint
+async def api_image(request: Request):
+    form = await request.form()
+    images = [await f.read() for f in form.getlist("image") if hasattr(f, "read")]
+    images = [d for d in images if d]
+    if not images:
+        return JSONResponse({"error": "No image uploaded"}, status_code=400)
+
+    try:
+        resp = await aget_images_response(images, _session_id(request))
+    except ImageDecodeError:
+        return JSONResponse({"error": "The upload is not a readable image"}, status_code=400)
+    return JSONResponse({"response": resp})
+
+
+# 2b. Bulk meal planning
+async def api_bulk(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    pantries = data.get("pantries") if isinstance(data, dict) else None
+    if not isinstance(pantries, list) or not pantries:
+        return JSONResponse({"error": "No pantries provided"}, status_code=400)
+    if len(pantries) > MAX_BULK:
+        return JSONResponse({"error": f"At most {MAX_BULK} pantries per request"},
+                            status_code=413)
+
+    async def lines():
+        async for item in aget_bulk_responses(pantries):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# 3. Speech endpoint
+async def api_speech(request: Request):
+    form = await request.form()
+    audio = form.get("audio")
+    if not audio or not hasattr(audio, "read"):
+        return JSONResponse({"error": "No audio uploaded"}, status_code=400)
+
+    data = await audio.read()
+    try:
+        text = await clients.run_blocking(
+            transcribe_bytes, data, audio.content_type,
+            speech_key=SPEECH_KEY, region=SPEECH_REGION)
+    except FileNotFoundError:
+        logger.error("ffmpeg not found — install it or upload wav/16k mono")
+        return JSONResponse({"error": "ffmpeg missing on server"}, status_code=500)
+    except AudioConversionError as e:
+        logger.error("ffmpeg failed: %s", e)
+        return JSONResponse({"error": "audio conversion failed"}, status_code=500)
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.exception("STT error")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    if not text:
+        return JSONResponse({"error": "No speech recognized, please try again."})
+
+    resp = await aget_response(text, _session_id(request))
+    return JSONResponse({"response": resp, "transcript": text})
+
+
+# 4. Grocery search
+async def api_grocery(request: Request):
+    data = await _json_object(request)
+    if data is None:
+        return JSONResponse(_BAD_JSON, status_code=400)
+    zipcode = data.get("zip", "").strip()
+    items   = data.get("items", [])
+    if not zipcode or not items:
+        return JSONResponse({"error": "zip or items missing"}, status_code=400)
+    try:
+        stores = await clients.run_blocking(
+            search_grocery_store_nearby, zipcode, items, radius=GROCERY_RADIUS)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return JSONResponse({"stores": stores})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # uvicorn accepts connections only after this; a no-op when already warm
+    await clients.run_blocking(startup.warm_up)
+    yield
+    await clients.aclose()
+
+
+routes = [
+    Route("/", index),
+    Route("/assets/{name:path}", asset),
+    Route("/api/config", config),
+    Route("/api/metrics", metrics),
+    Route("/api/admin/index", admin_index),
+    Route("/api/admin/reload", admin_reload, methods=["POST"]),
+    Route("/api/admin/startup", admin_startup),
+    Route("/api/admin/profiles", admin_profiles),
+    Route("/api/admin/profiles/folded", admin_profile_folded),
+    Route("/api/text", api_text, methods=["POST"]),
+    Route("/api/image", api_image, methods=["POST"]),
+    Route("/api/bulk", api_bulk, methods=["POST"]),
+    Route("/api/speech", api_speech, methods=["POST"]),
+    Route("/api/grocery", api_grocery, methods=["POST"]),
+    Mount("/", app=StaticFiles(directory=FRONT_DIR)),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"],
+                   allow_headers=["*"], expose_headers=["X-Trace-Id"]),
+        Middleware(TraceMiddleware),
+        Middleware(AdmissionMiddleware),
+    ],
+    exception_handlers={Overloaded: overloaded},
+    lifespan=lifespan,
+)
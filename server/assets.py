@@ -0,0 +1,248 @@
+# assets.py
+"""Static front-end assets: build step and cache-aware serving.
+
+Build (run once per deploy, after editing ``front_end/``)::
+
+    python -m server.assets            # → front_end/dist/
+
+* ``background.jpg`` (5000 px, 3.3 MB) becomes AVIF / WebP / JPEG variants
+  at a few widths; ``index.html`` picks one through ``image-set()`` and
+  width media queries.
+* Every derived asset gets a content-hashed name under ``dist/assets/`` and
+  is served with ``Cache-Control: public, max-age=31536000, immutable``.
+* Text files get precompressed ``.gz`` / ``.br`` siblings (brotli only when
+  the ``brotli`` package is installed).
+* ``manifest.json`` maps logical names to hashed ones.
+
+Serving (:class:`StaticAssets`) is framework-neutral; both servers use it for
+``/`` and ``/assets/…``.  ``index.html`` is ``no-cache`` but carries a strong
+ETag, so a repeat visit costs one ``304``; hashed assets are not re-requested
+at all.  Without a build the original ``front_end/`` files are served the same
+way, minus hashing and precompression.
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+BACKGROUND_WIDTHS = (640, 1280, 1920)
+IMAGE_FORMATS = (("avif", "AVIF", {"quality": 50}),
+                 ("webp", "WEBP", {"quality": 72, "method": 6}),
+                 ("jpg",  "JPEG", {"quality": 78, "optimize": True, "progressive": True}))
+COMPRESSIBLE = (".html", ".css", ".js", ".json", ".svg", ".txt")
+
+try:
+    import brotli
+except ImportError:          # gzip copies only
+    brotli = None
+
+
+# ───────────────────────────── build ─────────────────────────────
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write_hashed(out_dir: str, stem: str, ext: str, data: bytes) -> str:
+    name = f"{stem}.{_digest(data)}.{ext}"
+    with open(os.path.join(out_dir, name), "wb") as f:
+        f.write(data)
+    return name
+
+
+def _precompress(path: str) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def _background_variants(src: str, assets_dir: str) -> dict[int, dict[str, str]]:
+    from PIL import Image
+
+    with Image.open(src) as img:
+        img = img.convert("RGB")
+        out: dict[int, dict[str, str]] = {}
+        for width in BACKGROUND_WIDTHS:
+            height = round(img.height * width / img.width)
+            small = img.resize((width, height), Image.LANCZOS)
+            out[width] = {}
+            for ext, fmt, opts in IMAGE_FORMATS:
+                buf = io.BytesIO()
+                small.save(buf, format=fmt, **opts)
+                out[width][ext] = _write_hashed(assets_dir, f"background-{width}", ext,
+                                                buf.getvalue())
+    return out
+
+
+def _image_set(variants: dict[str, str]) -> str:
+    types = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg"}
+    return ", ".join(f'url("assets/{variants[ext]}") type("{types[ext]}")'
+                     for ext, _, _ in IMAGE_FORMATS)
+
+
+def _background_css(variants: dict[int, dict[str, str]]) -> str:
+    widths = sorted(variants)
+    rules = [f'body {{ background-image: url("assets/{variants[widths[-1]]["jpg"]}");'
+             f' background-image: image-set({_image_set(variants[widths[-1]])}); }}']
+    for w in reversed(widths[:-1]):             # narrower screens → smaller file
+        rules.append(f"@media (max-width: {w}px) {{ body {{ "
+                     f'background-image: url("assets/{variants[w]["jpg"]}");'
+                     f" background-image: image-set({_image_set(variants[w])}); }} }}")
+    return "\n    ".join(rules)
+
+
+def build(front_dir: str, dist_dir: str | None = None) -> dict:
+    """Build ``dist_dir`` (default ``front_dir/dist``) and return the manifest."""
+    dist_dir = dist_dir or os.path.join(front_dir, "dist")
+    staging = dist_dir + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    assets_dir = os.path.join(staging, "assets")
+    os.makedirs(assets_dir)
+
+    variants = _background_variants(os.path.join(front_dir, "background.jpg"), assets_dir)
+    with open(os.path.join(front_dir, "index.html"), encoding="utf-8") as f:
+        html = f.read()
+    html = re.sub(r"\s*background-image:\s*url\('background\.jpg'\);", "", html, count=1)
+    html = html.replace("</style>", f"    {_background_css(variants)}\n  </style>", 1)
+    index = os.path.join(staging, "index.html")
+    with open(index, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    manifest = {"background.jpg": {str(w): v for w, v in variants.items()}}
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    for root, _, files in os.walk(staging):
+        for name in files:
+            if name.endswith(COMPRESSIBLE):
+                _precompress(os.path.join(root, name))
+
+    old = dist_dir + ".old"
+    if os.path.isdir(dist_dir):
+        os.replace(dist_dir, old)
+    os.replace(staging, dist_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+# ───────────────────────────── serving ─────────────────────────────
+_HASHED = re.compile(r"\.[0-9a-f]{12}\.[a-z0-9]+$")
+
+
+@dataclass(frozen=True)
+class _Entry:
+    etag: str                                  # of the identity representation
+    content_type: str
+    cache_control: str
+    files: dict                                # encoding ("br" / "gzip" / None) → path
+
+
+@dataclass
+class Reply:
+    status: int
+    headers: dict
+    path: str | None = None                    # body, when status == 200
+
+
+class StaticAssets:
+    """Resolve ``rel`` paths under *root* into cache-aware replies."""
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+
+    def _load(self, rel: str) -> _Entry | None:
+        path = os.path.realpath(os.path.join(self.root, rel))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            etag = hashlib.sha256(f.read()).hexdigest()[:16]
+        files = {None: path}
+        for enc, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if os.path.isfile(path + suffix):
+                files[enc] = path + suffix
+        ctype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if ctype.startswith("text/") or ctype.endswith(("json", "javascript")):
+            ctype += "; charset=utf-8"
+        return _Entry(etag, ctype, IMMUTABLE if _HASHED.search(rel) else REVALIDATE, files)
+
+    def entry(self, rel: str) -> _Entry | None:
+        with self._lock:
+            entry = self._entries.get(rel)
+            if entry is None:                     # built once per deploy: cache hits forever
+                entry = self._load(rel)
+                if entry is not None:
+                    self._entries[rel] = entry
+            return entry
+
+    @staticmethod
+    def _encoding(accept_encoding: str, files: dict) -> str | None:
+        offered = {}
+        for part in accept_encoding.split(","):
+            name, _, params = part.strip().partition(";")
+            q = params.strip()[2:] if params.strip().startswith("q=") else "1"
+            try:
+                offered[name.strip().lower()] = float(q)
+            except ValueError:
+                pass
+        for enc in ("br", "gzip"):
+            if enc in files and offered.get(enc, 0) > 0:
+                return enc
+        return None
+
+    def respond(self, rel: str, accept_encoding: str = "",
+                if_none_match: str = "") -> Reply | None:
+        """``None`` → 404.  Otherwise a 200 (with ``path``) or a bodiless 304."""
+        entry = self.entry(rel)
+        if entry is None:
+            return None
+        enc = self._encoding(accept_encoding, entry.files)
+        etag = f'"{entry.etag}-{enc}"' if enc else f'"{entry.etag}"'
+        headers = {"ETag": etag, "Cache-Control": entry.cache_control}
+        if len(entry.files) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",") if t.strip()}
+        if etag in tags or "*" in tags:
+            return Reply(304, headers)
+        headers["Content-Type"] = entry.content_type
+        if enc:
+            headers["Content-Encoding"] = enc
+        return Reply(200, headers, entry.files[enc])
+
+
+def site(front_dir: str) -> StaticAssets:
+    """Serve the built ``dist/`` when present, else the raw front end."""
+    dist = os.path.join(front_dir, "dist")
+    return StaticAssets(dist if os.path.isfile(os.path.join(dist, "index.html")) else front_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # not via .config: building must not need API credentials
+    front = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "front_end")
+    ap = argparse.ArgumentParser(description="Build hashed, precompressed front-end assets.")
+    ap.add_argument("--front-dir", default=front)
+    args = ap.parse_args()
+    manifest = build(args.front_dir)
+    dist = os.path.join(args.front_dir, "dist")
+    for root, _, files in sorted(os.walk(dist)):
+        for name in sorted(files):
+            p = os.path.join(root, name)
+            print(f"{os.path.getsize(p):>10,}  {os.path.relpath(p, dist)}")
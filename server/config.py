@@ -0,0 +1,20 @@
+"""server/config.py — settings shared by the Flask (WSGI) and ASGI servers."""
+import os
+
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+BASE_DIR  = os.path.dirname(os.path.dirname(__file__))  # project root
+FRONT_DIR = os.path.join(BASE_DIR, "front_end")
+
+# Load credentials from env
+OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
+SPEECH_KEY     = os.environ["SPEECH_KEY"]
+SPEECH_REGION  = os.environ["SPEECH_REGION"]
+GOOGLEMAP_API  = os.environ["GOOGLEMAP_API"]
+if not SPEECH_KEY or not SPEECH_REGION:
+    raise RuntimeError("SPEECH_KEY / SPEECH_REGION not set in environment")
+
+GROCERY_RADIUS = 3500
+
+# /api/admin/* is disabled unless a token is configured (sent as X-Admin-Token)
+ADMIN_TOKEN = os.getenv("CHEF_ADMIN_TOKEN", "")
@@ -1,43 +1,139 @@
 # server.py
+import hmac
 import os
-from flask import Flask, request, jsonify, Response, render_template
+import re
+import time
+import json
+from flask import (Flask, request, jsonify, Response, render_template, g, abort,
+                   stream_with_context)
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
-from .agent import get_response             
-from tools.entity_recognition.ingredient_recognition import ingredients_detector
-from tools.audio.speech_to_text import transcribe_audio
+from .agent import (get_response, get_images_response, get_bulk_responses, MAX_BULK,
+                    index_status, reload_indexes)
+from tools.audio.speech_to_text import transcribe_bytes, AudioConversionError
+from tools.entity_recognition.image_prep import ImageDecodeError
 from tools.grocery_search.grocery_helper import search_grocery_store_nearby
-import tempfile, subprocess, mimetypes
-
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+from tools import profiling, resilience, startup, tracing
+from tools.limits import Overloaded
+from .admission import (admission, overload_payload, ADMITTED_ENDPOINTS, SESSION_COOKIE,
+                        new_session_id, session_cookie, session_cookie_header)
+from .assets import site
+from .config import (FRONT_DIR, SPEECH_KEY, SPEECH_REGION,
+                     GOOGLEMAP_API, GROCERY_RADIUS, ADMIN_TOKEN)
 
 # SINGLE instance – point to front_end
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # project root
-FRONT_DIR = os.path.join(BASE_DIR, "front_end")
 app = Flask(__name__, static_folder=FRONT_DIR, static_url_path="")
 
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-# CONFIGURATION
-UPLOAD_DIR = "uploads"
-# purge old files on start, create fresh dir
-import shutil, uuid
-if os.path.exists(UPLOAD_DIR):
-    shutil.rmtree(UPLOAD_DIR)
-os.makedirs(UPLOAD_DIR)
-
-# Load credentials from env
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-SPEECH_KEY     = os.environ["SPEECH_KEY"]
-SPEECH_REGION  = os.environ["SPEECH_REGION"]
-GOOGLEMAP_API  = os.environ["GOOGLEMAP_API"]
-if not SPEECH_KEY or not SPEECH_REGION:
-    raise RuntimeError("SPEECH_KEY / SPEECH_REGION not set in environment")
-
-CORS(app)  # allow index.html (file:// or other port) to talk to this server
+CORS(app, expose_headers=["X-Trace-Id"])  # allow index.html (file:// or other port) to talk to this server
 
 def _session_id() -> str:
-    return request.cookies.get("sid") or request.remote_addr or "anon"
+    """The ``sid`` cookie, or the session ID this request hands out."""
+    return session_cookie(request.cookies.get(SESSION_COOKIE)) or g.get("new_sid") or "anon"
+
+# per-request trace: honour a sane incoming X-Trace-Id, otherwise mint one
+_TRACE_ID_RE = re.compile(r"^[A-Za-z0-9\-_.]{8,64}$")
+
+@app.before_request
+def _start_trace():
+    incoming = request.headers.get("X-Trace-Id", "")
+    g.trace_token = tracing.begin_trace(incoming if _TRACE_ID_RE.match(incoming) else None)
+    g.trace_t0 = time.perf_counter()
+    g.budget_token = resilience.begin_budget()   # upstream deadlines count down from here
+    if request.endpoint in ADMITTED_ENDPOINTS:    # opt-in profile (tools/profiling.py)
+        g.profile_token = profiling.begin(
+            request.path, request.headers.get("X-Profile") == "1"
+            and _is_admin(request.headers.get("X-Admin-Token", "")))
+
+# admission control: per-session rate limit, then bounded in-flight + queue
+@app.before_request
+def _admit():
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    sid = session_cookie(request.cookies.get(SESSION_COOKIE))
+    if sid is None:
+        g.new_sid = new_session_id()            # set as the cookie by _finish_trace
+    try:
+        g.admitted_at = admission.admit(sid)
+    except Overloaded as err:
+        return _overloaded(err)
+
+@app.errorhandler(Overloaded)
+def _overloaded(err):
+    body, status, headers = overload_payload(err)
+    return jsonify(body), status, headers
+
+@app.after_request
+def _finish_trace(resp):
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        resp.headers["X-Trace-Id"] = trace_id
+    if "new_sid" in g:
+        resp.headers.add("Set-Cookie", session_cookie_header(g.new_sid))
+    if request.endpoint and request.endpoint != "static":
+        tracing.REQUEST_SECONDS.observe(time.perf_counter() - g.trace_t0, request.endpoint)
+    return resp
+
+@app.teardown_request
+def _end_trace(exc):
+    started = g.pop("admitted_at", None)
+    if started is not None:
+        admission.done(started)
+    profiling.end(g.pop("profile_token", None))
+    budget = g.pop("budget_token", None)
+    if budget is not None:
+        resilience.end_budget(budget)
+    token = g.pop("trace_token", None)
+    if token is not None:
+        tracing.end_trace(token)
+
+@app.route("/api/metrics")
+def metrics():
+    return Response(tracing.render_prometheus(),
+                    mimetype="text/plain; version=0.0.4")
+
+# admin: which index version is served; hot-swap to another without a restart
+def _is_admin(token: str) -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def _require_admin():
+    if not _is_admin(request.headers.get("X-Admin-Token", "")):
+        abort(403)
+
+@app.route("/api/admin/index")
+def admin_index():
+    _require_admin()
+    return jsonify(index_status())
+
+@app.route("/api/admin/reload", methods=["POST"])
+def admin_reload():
+    _require_admin()
+    data = request.get_json(silent=True) or {}
+    try:
+        status = reload_indexes(data.get("version"), bool(data.get("wait")))
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(status), 202 if status["loading"] else 200
+
+@app.route("/api/admin/startup")
+def admin_startup():
+    _require_admin()
+    return jsonify(startup.report())
+
+# admin: per-request profiles (tools/profiling.py), as collapsed stacks
+@app.route("/api/admin/profiles")
+def admin_profiles():
+    _require_admin()
+    return jsonify(profiling.profiles())
+
+@app.route("/api/admin/profiles/folded")
+def admin_profile_folded():
+    _require_admin()
+    profile_id = request.args.get("id")                 # none: all buffered, merged
+    folded = profiling.folded(profile_id)
+    if folded is None:
+        return jsonify({"error": f"no profile {profile_id!r}"}), 404
+    return Response(folded, mimetype="text/plain")
 
 @app.route('/api/config')
 def config():
@@ -45,10 +141,27 @@ def config():
       "googlemaps_api_key": GOOGLEMAP_API
     })
 
+# built front end (hashed, precompressed — see server/assets.py) or the raw files
+_site = site(FRONT_DIR)
+
+def _asset(rel: str):
+    reply = _site.respond(rel, request.headers.get("Accept-Encoding", ""),
+                          request.headers.get("If-None-Match", ""))
+    if reply is None:
+        abort(404)
+    if reply.status == 304:
+        return Response(status=304, headers=reply.headers)
+    with open(reply.path, "rb") as f:
+        return Response(f.read(), headers=reply.headers)
+
 # Serve your index.html at the root
 @app.route("/")
 def index():
-    return app.send_static_file("index.html")
+    return _asset("index.html")
+
+@app.route("/assets/<path:name>")
+def assets(name):
+    return _asset(f"assets/{name}")
 
 # 1. Text endpoint
 @app.route("/api/text", methods=["POST"])
@@ -65,21 +178,33 @@ def api_text():
 # 2. Image endpoint
 @app.route("/api/image", methods=["POST"])
 def api_image():
-    img = request.files.get("image")
-    if not img:
+    # one or more files under "image" (fridge photo + receipt, …)
+    images = [f.read() for f in request.files.getlist("image")]
+    images = [d for d in images if d]
+    if not images:
         return jsonify({"error": "No image uploaded"}), 400
 
-    ext = os.path.splitext(img.filename)[1]
-    filename = f"{uuid.uuid4().hex}{ext}"
-    path = os.path.join(UPLOAD_DIR, filename)
-    img.save(path)
+    # entity_recognition (in memory, concurrent) → merged pantry → one agent turn
+    try:
+        resp = get_images_response(images, _session_id())
+    except ImageDecodeError:
+        return jsonify({"error": "The upload is not a readable image"}), 400
+    return jsonify({"response": resp})
 
-    # first do entity_recognition → text
-    img_text = ingredients_detector(path)
+# 2b. Bulk meal planning: many pantries in, NDJSON out as each one is answered
+@app.route("/api/bulk", methods=["POST"])
+def api_bulk():
+    data = request.get_json(silent=True) or {}
+    pantries = data.get("pantries")
+    if not isinstance(pantries, list) or not pantries:
+        return jsonify({"error": "No pantries provided"}), 400
+    if len(pantries) > MAX_BULK:
+        return jsonify({"error": f"At most {MAX_BULK} pantries per request"}), 413
 
-    # then send that to agent
-    resp = get_response(img_text, _session_id())
-    return jsonify({"response": resp})
+    # stream_with_context keeps the request (and its admission slot) open to the end
+    lines = (json.dumps(item, ensure_ascii=False) + "\n"
+             for item in get_bulk_responses(pantries))
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
 
 # 3. Speech endpoint
 @app.route("/api/speech", methods=["POST"])
@@ -87,39 +212,19 @@ def api_speech():
     audio = request.files.get("audio")
     if not audio:
         return jsonify({"error": "No audio uploaded"}), 400
-    
-        # save to tmp file
-    ext = mimetypes.guess_extension(audio.mimetype) or ".webm"
-    tmp_in = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-    audio.save(tmp_in.name)
-
-    # if WebM/OGG → convert to wav 16 kHz for Azure
-    if audio.mimetype != "audio/wav":
-        tmp_wav = tempfile.NamedTemporaryFile(delete=False, suffix=".wav").name
-        try:
-            subprocess.run(
-                [
-                    "ffmpeg", "-y", "-i", tmp_in.name,
-                    "-acodec", "pcm_s16le",  # 16-bit PCM
-                    "-ar", "16000",          # 16 kHz
-                    "-ac", "1",              # mono
-                    tmp_wav
-                ],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-        except FileNotFoundError:
-            app.logger.error("ffmpeg not found — install it or upload wav/16k mono")
-            return jsonify({"error": "ffmpeg missing on server"}), 500
-        except subprocess.CalledProcessError as e:
-            app.logger.exception("ffmpeg failed: %s", e)
-            return jsonify({"error": "audio conversion failed"}), 500
-    else:
-        tmp_wav = tmp_in.name
 
+    # in memory: upload → ffmpeg pipe → 16 kHz PCM streamed into Azure (no temp files)
     try:
-        text = transcribe_audio(tmp_wav, speech_key=SPEECH_KEY, region=SPEECH_REGION)
+        text = transcribe_bytes(audio.read(), audio.mimetype,
+                                speech_key=SPEECH_KEY, region=SPEECH_REGION)
+    except FileNotFoundError:
+        app.logger.error("ffmpeg not found — install it or upload wav/16k mono")
+        return jsonify({"error": "ffmpeg missing on server"}), 500
+    except AudioConversionError as e:
+        app.logger.error("ffmpeg failed: %s", e)
+        return jsonify({"error": "audio conversion failed"}), 500
+    except Overloaded:
+        raise
     except Exception as e:
         app.logger.exception("STT error")
         return jsonify({"error": str(e)}), 500
@@ -139,7 +244,9 @@ def api_grocery():
     if not zipcode or not items:
         return jsonify({"error": "zip or items missing"}), 400
     try:
-        stores = search_grocery_store_nearby(zipcode, items, radius=3500)
+        stores = search_grocery_store_nearby(zipcode, items, radius=GROCERY_RADIUS)
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     return jsonify({"stores": stores})
@@ -151,5 +258,6 @@ def stream_openai(answer_gen):
     return Response(gen(), mimetype="text/event-stream")
 
 if __name__ == "__main__":
+    startup.warm_up()                       # CHEF_WARMUP, before the first request
     # debug=True only for local dev
     app.run(host="0.0.0.0", port=5000, debug=True)
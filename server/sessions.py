@@ -0,0 +1,436 @@
+"""server/sessions.py — bounded, expiring conversation-memory store.
+
+``SESSION_BACKEND`` selects where :class:`~tools.ui_memory.ConversationMemory`
+objects live:
+
+* ``memory`` (default) — in-process LRU with idle-TTL eviction and a byte cap.
+  Fast, but private to one worker (needs sticky routing).
+* ``sqlite:///path/to/sessions.db`` — shared by every worker on one host
+  (the URL path as is: ``sqlite:///var/tmp/chef.db`` is ``/var/tmp/chef.db``;
+  ``sqlite:chef.db`` is relative to the working directory).
+* ``redis://host:6379/0`` — any Redis-protocol server, shared across hosts.
+  ``python -m server.sessions --port 6380`` runs a tiny local stand-in.
+
+Knobs: ``SESSION_TTL`` (idle seconds, default 3600), ``SESSION_MAX``
+(sessions, default 10000), ``SESSION_MAX_BYTES`` (default 256 MiB),
+``SESSION_COMPRESS`` (default 1: zlib all but the newest bot turn).
+Shared backends store JSON (``ConversationMemory.to_dict``); the Redis
+server's own ``maxmemory`` / LRU policy enforces its memory cap.
+
+Accounting: ``chef_sessions_bytes`` is the in-process total,
+``chef_session_size_bytes`` the per-session distribution (heap bytes for
+``memory``, stored JSON bytes for the shared backends).
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from tools import tracing
+from tools.clients import run_blocking
+from tools.ui_memory import ConversationMemory
+
+__all__ = ["SessionStore", "SessionConfigError", "InProcessBackend", "SQLiteBackend", "RedisBackend"]
+
+MAX_HISTORY = 5
+KEEP_PLAIN  = 1 if os.getenv("SESSION_COMPRESS", "1") not in ("0", "false", "no") else None
+
+SESSIONS_LIVE = tracing.register(tracing.Gauge(
+    "chef_sessions_live", "Sessions held by this worker's store.", ("backend",)))
+SESSION_BYTES = tracing.register(tracing.Gauge(
+    "chef_sessions_bytes", "Approximate bytes held by in-process sessions.", ("backend",)))
+SESSION_SIZE = tracing.register(tracing.Histogram(
+    "chef_session_size_bytes", "Size of one session when saved.", ("backend",),
+    buckets=(512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)))
+SESSION_EVICTIONS = tracing.register(tracing.Counter(
+    "chef_session_evictions_total", "Sessions dropped by the store.", ("reason",)))
+
+
+# ───────────────────────────── backends ──────────────────────────────────
+class InProcessBackend:
+    """LRU + idle-TTL + byte-capped dict of live ``ConversationMemory`` objects."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_sessions: int, idle_ttl: float, max_bytes: int):
+        self.max_sessions, self.idle_ttl, self.max_bytes = max_sessions, idle_ttl, max_bytes
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[ConversationMemory, float, int]] = OrderedDict()
+        self._bytes = 0
+
+    def load(self, sid: str) -> ConversationMemory | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            mem, seen, size = entry
+            if now - seen > self.idle_ttl:
+                self._drop(sid, "idle")
+                return None
+            self._data[sid] = (mem, now, size)
+            self._data.move_to_end(sid)
+            return mem
+
+    def save(self, sid: str, mem: ConversationMemory) -> None:
+        size = mem.approx_bytes()
+        SESSION_SIZE.observe(size, self.name)
+        now = time.monotonic()
+        with self._lock:
+            old = self._data.pop(sid, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[sid] = (mem, now, size)
+            self._bytes += size
+            self._evict(now)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            if sid in self._data:
+                self._drop(sid, "deleted")
+
+    def _drop(self, sid: str, reason: str) -> None:
+        _, _, size = self._data.pop(sid)
+        self._bytes -= size
+        SESSION_EVICTIONS.inc(reason)
+
+    def _evict(self, now: float) -> None:
+        # oldest first: expired, then over count / byte budget
+        while self._data:
+            sid, (_, seen, _) = next(iter(self._data.items()))
+            if now - seen > self.idle_ttl:
+                self._drop(sid, "idle")
+            elif len(self._data) > self.max_sessions:
+                self._drop(sid, "lru_count")
+            elif self._bytes > self.max_bytes and len(self._data) > 1:
+                self._drop(sid, "lru_bytes")
+            else:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._data)
+            return {"sessions": n, "bytes": self._bytes,
+                    "bytes_per_session": self._bytes // n if n else 0}
+
+
+class SQLiteBackend:
+    """Sessions as JSON rows in one SQLite file shared by local workers."""
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_sessions: int, idle_ttl: float, max_bytes: int):
+        self.path, self.max_sessions, self.idle_ttl, self.max_bytes = \
+            path, max_sessions, idle_ttl, max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                       " sid TEXT PRIMARY KEY, data TEXT NOT NULL, seen REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_seen ON sessions(seen)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid: str) -> ConversationMemory | None:
+        db = self._conn()
+        row = db.execute("SELECT data, seen FROM sessions WHERE sid=?", (sid,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.idle_ttl:
+            self.delete(sid)
+            SESSION_EVICTIONS.inc("idle")
+            return None
+        db.execute("UPDATE sessions SET seen=? WHERE sid=?", (time.time(), sid))
+        return ConversationMemory.from_dict(json.loads(row[0]))
+
+    def save(self, sid: str, mem: ConversationMemory) -> None:
+        db = self._conn()
+        data = json.dumps(mem.to_dict(), ensure_ascii=False)
+        SESSION_SIZE.observe(len(data.encode("utf-8")), self.name)
+        db.execute("INSERT OR REPLACE INTO sessions(sid, data, seen) VALUES (?,?,?)",
+                   (sid, data, time.time()))
+        self._writes += 1
+        if self._writes % 100 == 0:        # amortise the sweep
+            self._evict(db)
+
+    def delete(self, sid: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE sid=?", (sid,))
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        cur = db.execute("DELETE FROM sessions WHERE seen < ?", (time.time() - self.idle_ttl,))
+        SESSION_EVICTIONS.inc("idle", amount=cur.rowcount)
+        cur = db.execute(
+            "DELETE FROM sessions WHERE sid IN (SELECT sid FROM sessions"
+            " ORDER BY seen DESC LIMIT -1 OFFSET ?)", (self.max_sessions,))
+        SESSION_EVICTIONS.inc("lru_count", amount=cur.rowcount)
+        total = db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sessions").fetchone()[0]
+        while total > self.max_bytes:
+            row = db.execute("SELECT sid, LENGTH(data) FROM sessions ORDER BY seen LIMIT 1").fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM sessions WHERE sid=?", (row[0],))
+            SESSION_EVICTIONS.inc("lru_bytes")
+            total -= row[1]
+
+    def stats(self) -> dict:
+        db = self._conn()
+        n, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions").fetchone()
+        return {"sessions": n, "bytes": size}
+
+
+class _RESPConnection:
+    """Minimal blocking Redis-protocol (RESP2) client — enough for GET/SET/DEL."""
+
+    def __init__(self, host: str, port: int, db: int, password: str | None):
+        self.addr, self.db, self.password = (host, port), db, password
+        self.sock = None
+        self.buf = b""
+
+    def _connect(self) -> None:
+        self.sock = socket.create_connection(self.addr, timeout=5)
+        self.buf = b""
+        if self.password:
+            self._roundtrip("AUTH", self.password)
+        if self.db:
+            self._roundtrip("SELECT", str(self.db))
+
+    def command(self, *parts: str | bytes):
+        if self.sock is None:
+            self._connect()
+        try:
+            return self._roundtrip(*parts)
+        except (OSError, ConnectionError):
+            self.sock = None                 # reconnect once
+            self._connect()
+            return self._roundtrip(*parts)
+
+    def _roundtrip(self, *parts: str | bytes):
+        out = [b"*%d\r\n" % len(parts)]
+        for p in parts:
+            b = p.encode() if isinstance(p, str) else p
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        self.sock.sendall(b"".join(out))
+        return self._read()
+
+    def _line(self) -> bytes:
+        while b"\r\n" not in self.buf:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("redis connection closed")
+            self.buf += chunk
+        line, self.buf = self.buf.split(b"\r\n", 1)
+        return line
+
+    def _read(self):
+        line = self._line()
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(f"redis error: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            while len(self.buf) < n + 2:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("redis connection closed")
+                self.buf += chunk
+            data, self.buf = self.buf[:n], self.buf[n + 2:]
+            return data
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise RuntimeError(f"bad RESP reply: {line!r}")
+
+
+class RedisBackend:
+    """Sessions as JSON strings with a sliding ``EX`` TTL on a RESP server."""
+
+    name = "redis"
+    blocking = True
+    prefix = "chef:session:"
+
+    def __init__(self, url: str, idle_ttl: float):
+        u = urlparse(url)
+        self.idle_ttl = int(idle_ttl)
+        self._args = (u.hostname or "localhost", u.port or 6379,
+                      int((u.path or "/0").lstrip("/") or 0), u.password)
+        self._local = threading.local()
+
+    def _conn(self) -> _RESPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _RESPConnection(*self._args)
+        return conn
+
+    def load(self, sid: str) -> ConversationMemory | None:
+        # GETEX refreshes the idle TTL on read (Redis ≥ 6.2)
+        raw = self._conn().command("GETEX", self.prefix + sid, "EX", str(self.idle_ttl))
+        return None if raw is None else ConversationMemory.from_dict(json.loads(raw))
+
+    def save(self, sid: str, mem: ConversationMemory) -> None:
+        data = json.dumps(mem.to_dict(), ensure_ascii=False).encode("utf-8")
+        SESSION_SIZE.observe(len(data), self.name)
+        self._conn().command("SET", self.prefix + sid, data, "EX", str(self.idle_ttl))
+
+    def delete(self, sid: str) -> None:
+        self._conn().command("DEL", self.prefix + sid)
+
+    def stats(self) -> dict:
+        return {}
+
+
+# ───────────────────────────── the store ─────────────────────────────────
+class SessionConfigError(ValueError):
+    """``SESSION_BACKEND`` is malformed or its backend cannot be opened."""
+
+
+class SessionStore:
+    """Front door used by the agent: ``get`` → mutate → ``put``."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        SESSIONS_LIVE.set_function(lambda: self._gauge("sessions"))
+        SESSION_BYTES.set_function(lambda: self._gauge("bytes"))
+
+    def _gauge(self, field: str) -> dict:
+        stats = self.backend.stats()       # Redis keeps no local accounting
+        return {(self.backend.name,): stats[field]} if field in stats else {}
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        spec = os.getenv("SESSION_BACKEND", "memory")
+        ttl = float(os.getenv("SESSION_TTL", "3600"))
+        max_sessions = int(os.getenv("SESSION_MAX", "10000"))
+        max_bytes = int(os.getenv("SESSION_MAX_BYTES", str(256 * 2**20)))
+        try:
+            if spec.startswith("sqlite:"):
+                u = urlparse(spec)
+                if u.netloc:
+                    raise ValueError("expected sqlite:///absolute/path or sqlite:relative/path")
+                # keep the path's leading "/" (sqlite:////abs works too)
+                path = "/" + u.path.lstrip("/") if u.path.startswith("/") else u.path
+                return cls(SQLiteBackend(path or "sessions.db", max_sessions, ttl, max_bytes))
+            if spec.startswith(("redis://", "rediss://")):
+                return cls(RedisBackend(spec, ttl))
+            if spec != "memory":
+                raise ValueError("expected memory, sqlite:///path or redis://host:port/db")
+            return cls(InProcessBackend(max_sessions, ttl, max_bytes))
+        except (ValueError, OSError, sqlite3.Error) as err:
+            raise SessionConfigError(f"SESSION_BACKEND={spec!r}: {err}") from None
+
+    def get(self, sid: str) -> ConversationMemory:
+        mem = self.backend.load(sid)
+        tracing.record_cache("session", mem is not None)
+        return mem if mem is not None else ConversationMemory(MAX_HISTORY, KEEP_PLAIN)
+
+    def put(self, sid: str, mem: ConversationMemory) -> None:
+        self.backend.save(sid, mem)
+
+    async def aget(self, sid: str) -> ConversationMemory:
+        if self.backend.blocking:
+            return await run_blocking(self.get, sid)
+        return self.get(sid)
+
+    async def aput(self, sid: str, mem: ConversationMemory) -> None:
+        if self.backend.blocking:
+            await run_blocking(self.put, sid, mem)
+        else:
+            self.put(sid, mem)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, **self.backend.stats()}
+
+
+# ─────────────────── local Redis-protocol stand-in ───────────────────────
+async def _serve_resp(host: str, port: int) -> None:
+    """Single-process GET/GETEX/SET/DEL/PING server (dev and CI only)."""
+    import asyncio
+
+    store: dict[bytes, tuple[bytes, float]] = {}
+
+    def alive(key: bytes) -> bytes | None:
+        item = store.get(key)
+        if item is None or (item[1] and item[1] < time.time()):
+            store.pop(key, None)
+            return None
+        return item[0]
+
+    def bulk(v: bytes | None) -> bytes:
+        return b"$-1\r\n" if v is None else b"$%d\r\n%s\r\n" % (len(v), v)
+
+    def ex_deadline(args: list[bytes]) -> float:
+        up = [a.upper() for a in args]
+        return time.time() + int(args[up.index(b"EX") + 1]) if b"EX" in up else 0.0
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:])):
+                    n = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(n + 2))[:-2])
+                cmd, rest = args[0].upper(), args[1:]
+                if cmd == b"PING":
+                    reply = b"+PONG\r\n"
+                elif cmd in (b"SELECT", b"AUTH"):
+                    reply = b"+OK\r\n"
+                elif cmd == b"GET":
+                    reply = bulk(alive(rest[0]))
+                elif cmd == b"GETEX":
+                    v = alive(rest[0])
+                    if v is not None and len(rest) > 1:
+                        store[rest[0]] = (v, ex_deadline(rest[1:]))
+                    reply = bulk(v)
+                elif cmd == b"SET":
+                    store[rest[0]] = (rest[1], ex_deadline(rest[2:]))
+                    reply = b"+OK\r\n"
+                elif cmd == b"DEL":
+                    reply = b":%d\r\n" % sum(store.pop(k, None) is not None for k in rest)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"RESP stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    ap = argparse.ArgumentParser(description="Local Redis-protocol stand-in for SESSION_BACKEND=redis://")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6380)
+    a = ap.parse_args()
+    asyncio.run(_serve_resp(a.host, a.port))
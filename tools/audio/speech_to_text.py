@@ -1,7 +1,7 @@
-import pyaudio
 import wave
 
 def record_audio(filename="recorded.wav", duration=5):
+    import pyaudio          # microphone capture is CLI-only; the server never needs it
     chunk = 1024
     sample_format = pyaudio.paInt16
     channels = 1
@@ -33,18 +33,154 @@ def record_audio(filename="recorded.wav", duration=5):
         wf.setframerate(rate)
         wf.writeframes(b''.join(frames))
 
-import azure.cognitiveservices.speech as speechsdk
+import functools
+import importlib
+
+from tools import tracing
+from tools.limits import upstream
+
+@functools.cache
+def speech_sdk():
+    """The Azure Speech SDK (native library, slow to load) — imported on first use."""
+    return importlib.import_module("azure.cognitiveservices.speech")
 
 def transcribe_audio(filename, speech_key, region) -> str:
+    speechsdk = speech_sdk()
     speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=region)
     audio_config = speechsdk.audio.AudioConfig(filename=filename)
     speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
 
     print("Transcribing...")
-    result = speech_recognizer.recognize_once()
+    with tracing.span("stt"):
+        result = speech_recognizer.recognize_once()
 
     if result.reason == speechsdk.ResultReason.RecognizedSpeech and result.text:
         return result.text
 
     # NoMatch / Canceled → return empty string
     return ""
+
+
+# ───────────────────── in-memory, streaming path (/api/speech) ─────────────────────
+# upload bytes → ffmpeg stdin │ ffmpeg stdout (16 kHz mono s16le) → recognizer push
+# stream, while the recognizer is already listening.  No temp files; at most
+# FFMPEG_MAX_PROCS transcoders run at once per worker.
+import io
+import os
+import subprocess
+import threading
+import time
+
+FFMPEG_BIN       = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFMPEG_MAX_PROCS = int(os.getenv("FFMPEG_MAX_PROCS", "4"))
+PCM_CHUNK        = 3200            # 100 ms of 16 kHz 16-bit mono
+
+_ffmpeg_slots = threading.BoundedSemaphore(FFMPEG_MAX_PROCS)
+
+
+class AudioConversionError(RuntimeError):
+    """ffmpeg could not decode the upload."""
+
+
+class AzureStreamingRecognizer:
+    """One-shot recognition fed through a ``PushAudioInputStream``.
+
+    Any object with ``write(pcm: bytes)``, ``close()`` and ``result() -> str``
+    can stand in for it (see ``benchmarks/speech_pipeline.py``)."""
+
+    def __init__(self, speech_key: str, region: str):
+        speechsdk = speech_sdk()
+        speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=region)
+        fmt = speechsdk.audio.AudioStreamFormat(samples_per_second=16000,
+                                                bits_per_sample=16, channels=1)
+        self._stream = speechsdk.audio.PushAudioInputStream(stream_format=fmt)
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=speech_config,
+            audio_config=speechsdk.audio.AudioConfig(stream=self._stream))
+        self._future = recognizer.recognize_once_async()   # listening from now on
+
+    def write(self, pcm: bytes) -> None:
+        self._stream.write(pcm)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def result(self) -> str:
+        result = self._future.get()
+        if result.reason == speech_sdk().ResultReason.RecognizedSpeech and result.text:
+            return result.text
+        return ""
+
+
+def _wav_pcm(data: bytes) -> bytes | None:
+    """PCM frames if *data* already is 16 kHz mono 16-bit WAV, else ``None``."""
+    try:
+        with wave.open(io.BytesIO(data)) as wf:
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) == (16000, 1, 2):
+                return wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        pass
+    return None
+
+
+def _stream_ffmpeg(data: bytes, sink) -> None:
+    """Decode *data* with ffmpeg, writing PCM chunks to *sink* as they appear."""
+    with _ffmpeg_slots:
+        proc = subprocess.Popen(
+            [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1",
+             "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+
+        def feed():
+            try:
+                proc.stdin.write(data)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            while chunk := proc.stdout.read(PCM_CHUNK):
+                sink(chunk)
+        finally:
+            proc.stdout.close()
+            feeder.join()
+            err = proc.stderr.read()
+            proc.stderr.close()
+            code = proc.wait()
+        if code != 0:
+            raise AudioConversionError(err.decode("utf-8", "replace").strip()
+                                       or f"ffmpeg exited with {code}")
+
+
+def transcribe_bytes(data: bytes, mimetype: str | None = None, *,
+                     speech_key: str | None = None, region: str | None = None,
+                     recognizer=None) -> str:
+    """
+    Transcribe an uploaded recording held in memory.
+
+    16 kHz mono WAV goes straight to the recognizer; anything else (webm/ogg
+    from the browser) is piped through ffmpeg and streamed as it decodes.
+    Raises ``FileNotFoundError`` if ffmpeg is missing and
+    :class:`AudioConversionError` if it cannot decode the upload.
+    """
+    t0 = time.perf_counter()
+    with upstream("speech"):
+        rec = recognizer or AzureStreamingRecognizer(speech_key, region)
+        try:
+            pcm = _wav_pcm(data) if mimetype in (None, "audio/wav", "audio/x-wav") else None
+            with tracing.span("transcode"):
+                if pcm is not None:
+                    rec.write(pcm)
+                else:
+                    _stream_ffmpeg(data, rec.write)
+        finally:
+            rec.close()
+        with tracing.span("stt"):
+            text = rec.result()
+    tracing.observe("speech_total", time.perf_counter() - t0)
+    return text
@@ -1,9 +1,11 @@
 """tools/recipe_rag.py — Retrieval‑Augmented Chinese‑recipe assistant
 
 This module builds/loads the hybrid BM25 + FAISS indexes (with Cohere
-cross‑encoder re‑ranker) once at import‑time, then exposes **`answer_query`** –
-an *async* function that the terminal UI (``tools/ui.py``) calls to answer each
-user question.
+cross‑encoder re‑ranker) on first use – or ahead of traffic, see
+``tools/startup.py`` – then exposes **`answer_query`** – an *async* function
+that the terminal UI (``tools/ui.py``) calls to answer each user question.  The
+loaded version can be swapped at runtime without a restart
+(``indexes.reload()``, see ``tools/rag/index_store.py``).
 
 Running this file directly will drop you into the interactive chat loop that is
 provided by ``tools.ui``.
@@ -17,16 +19,16 @@ from pathlib import Path
 from typing import List
 import datetime
 
-import openai  
-client = openai.AsyncOpenAI()
+import numpy as np
 from pydantic import BaseModel, ConfigDict
-from langchain.schema import Document
-from tools.rag.pdf_parse import DataProcess
-from tools.rag.bm25_retriever import BM25
-from tools.rag.faiss_retriever import FaissRetriever
-from tools.rag.rerank_api import APIReranker
+from tools.rag import chunk_meta, index_store, lexicon, spans
 from tools.youtube_video_recommender import youtube_helper
-from tools.grocery_search import grocery_helper
+from tools import query_cache, query_log, tracing
+from tools.clients import openai_client, run_blocking
+from tools.limits import Overloaded, upstream
+from tools import resilience
+from tools.resilience import guarded
+from tools.singleflight import coalesce
 import re
 from typing import List
 
@@ -35,63 +37,338 @@ logger = logging.getLogger(__name__)
 
 ROOT = Path(__file__).resolve().parents[1]
 PDF_PATH = ROOT / "data" / "how_to_cook.pdf"
-INDEX_DIR = ROOT / "indexes"
-BM25_PATH = INDEX_DIR / "bm25.pkl"
-FAISS_PATH = INDEX_DIR / "faiss"
+INDEX_DIR = Path(os.getenv("CHEF_INDEX_DIR", ROOT / "indexes"))
 
 EMBED_MODEL = "text-embedding-3-large"  # multilingual – handles Chinese well
+RERANK_MODEL = "rerank-multilingual-v3.0"
 top_k_lex = 20
 top_k_dense = 20
 final_k = 6
 
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
-if not (BM25_PATH.exists() and FAISS_PATH.exists()):
-    # First run → build indexes (can take a few minutes depending on PDF size)
-    logger.info("Building BM25 / FAISS indexes – first‑time setup …")
-    dp = DataProcess(PDF_PATH)
-    dp.parse(max_seq=512)
-    texts: List[str] = dp.data
-    
-    bm25_tmp = BM25(texts)
-    bm25_tmp.save(BM25_PATH)
-    
-    fr_tmp = FaissRetriever(texts, model_name=EMBED_MODEL, chunk_size=128)
-    fr_tmp.save(FAISS_PATH)
-    del bm25_tmp, fr_tmp  # free mem before loading normally
+# the served version, loaded (built on first run) by the first indexes.current();
+# requests take one snapshot and keep it, so a hot swap (indexes.reload())
+# never changes an in-flight request
+indexes = index_store.IndexHolder(INDEX_DIR, EMBED_MODEL, RERANK_MODEL, pdf_path=PDF_PATH)
+
+def _drop_stale_retrievals(old: index_store.IndexSet, new: index_store.IndexSet) -> None:
+    # cached candidate IDs are rows of the old version's passage table
+    query_cache.RETRIEVE.discard(lambda key: key[0] == old.version)
+
+indexes.on_swap(_drop_stale_retrievals)
+
+def __getattr__(name: str):
+    # module-level bm25 / faiss / reranker stay usable for scripts (current
+    # version, loaded on access); request code uses snapshots
+    if name in ("bm25", "faiss", "reranker"):
+        return getattr(indexes.current(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def index_version() -> str:
+    return indexes.current().version
 
-logger.info("Loading indexes …")
-bm25 = BM25.load(BM25_PATH)
-faiss = FaissRetriever.load(FAISS_PATH, model_name=EMBED_MODEL)
-reranker = APIReranker(model="rerank-multilingual-v3.0")
+PASSAGE_SEP = "\n\n---\n\n"
+_NUMBERING = re.compile(r"^\d+\. ")
 
 class RagResult(BaseModel):
     content: str
+    ids: List[int] = []                 # chunk IDs of the passages in *content*
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def __str__(self) -> str:  # noqa: DunderStr: show concise preview in logs
         return "✅ RAG result (hidden)"
 
-async def _ingredient_query(question: str) -> RagResult:
-    """Hybrid lexical + dense search followed by Cohere rerank → top passages."""
-    # 1) lexical BM25
-    bm25_hits = [d.page_content for d in bm25.GetBM25TopK(question, top_k_lex)]
-    # 2) dense FAISS
-    faiss_hits = [d[0].page_content for d in faiss.GetTopK(question, top_k_dense)]
-    # 3) merge & deduplicate
-    pool = {t: t for t in bm25_hits + faiss_hits}.values()
-    # 4) Cohere cross‑encoder rerank (blocking ⇒ run in thread)
-    loop = asyncio.get_running_loop()
-    reranked = await loop.run_in_executor(
-        None,
-        lambda: reranker.predict(
-            question, [Document(page_content=p) for p in pool]
-        )[: final_k],
-    )
-    formatted = "\n\n---\n\n".join(
-        f"{i+1}. {d.page_content}" for i, d in enumerate(reranked)
-    )
-    return RagResult(content=formatted)
+async def _embed_call(question: str, idx: index_store.IndexSet) -> np.ndarray:
+    async with upstream("openai"):
+        vec = await run_blocking(idx.faiss.EmbedQuery, question)
+    return np.asarray(vec, dtype=np.float32)
+
+@coalesce("embed", key=lambda question, idx: (idx.version, question))
+async def _embed_query(question: str, idx: index_store.IndexSet) -> np.ndarray | None:
+    """Remote query embedding (blocking client ⇒ run in thread), cached per
+    query; ``None`` when the embedding stage is degraded (→ BM25-only
+    retrieval)."""
+    key = (EMBED_MODEL, question)
+    if (vec := query_cache.EMBED.get(key)) is not None:
+        return vec
+    with tracing.span("embed"):
+        vec = await guarded("embed", lambda: _embed_call(question, idx),
+                            fallback=lambda: None)
+    query_cache.EMBED.put(key, vec)
+    return vec
+
+def _filter(question: str, idx: index_store.IndexSet) -> str | None:
+    """Metadata filter for the constraints the question states ("no pork",
+    "under 20 minutes", "vegetarian" …); ``None`` when there are none or no
+    passage satisfies them (then retrieval is unfiltered)."""
+    where = chunk_meta.constraints(question)
+    if where is None:
+        return None
+    if not idx.chunks.select(where).any():
+        chunk_meta.FILTERS.inc("empty")
+        return None
+    chunk_meta.FILTERS.inc("applied")
+    return where
+
+async def _lexical_hits(question: str, idx: index_store.IndexSet,
+                        where: str | None = None) -> List[int]:
+    """jieba + BM25 scoring is pure-Python CPU work ⇒ keep it off the loop.
+    English ingredient names are scored as the corpus's Chinese terms."""
+    query = lexicon.LEXICON.expand(question)
+    with tracing.span("bm25"):
+        return await run_blocking(
+            lambda: idx.bm25.GetBM25TopKIds(query, top_k_lex, where).tolist())
+
+def _local_dense(question: str, idx: index_store.IndexSet, where: str | None) -> List[int]:
+    """In-process LSA dense search (``tools/rag/lsa.py``): no embedding API call."""
+    with tracing.span("lsa"):
+        vec = idx.lsa.EmbedQuery(lexicon.LEXICON.expand(question))
+        return idx.lsa.GetTopKIdsByVector(vec, top_k_dense, where).tolist()
+
+def _lexically_confident(question: str, bm25_hits: List[int],
+                         idx: index_store.IndexSet) -> bool:
+    """Whether the top BM25 passages are recipes and each has one that
+    contains every ingredient / dish the question names
+    (``tools/rag/lexicon.py``)."""
+    if not lexicon.SHORTCUT or not bm25_hits:
+        return False
+    top = bm25_hits[:final_k]
+    if not idx.chunks.select("recipe")[top].all():
+        return False
+    return lexicon.LEXICON.confident(question, idx.chunks.texts(top))
+
+def _lexical_answer(question: str, bm25_hits: List[int],
+                    idx: index_store.IndexSet) -> RagResult | None:
+    """The BM25 ranking as the answer when it is confident — no embedding,
+    FAISS or rerank call; ``None`` otherwise."""
+    if not _lexically_confident(question, bm25_hits, idx):
+        return None
+    return _context(bm25_hits, idx)
+
+async def _candidates(question: str, idx: index_store.IndexSet) -> tuple[List[int], List[int]]:
+    """BM25 and FAISS chunk IDs for *question* — both restricted to the
+    passages matching its stated constraints — cached per index version
+    (results of a degraded embedding stage are not cached).  No FAISS IDs
+    when BM25 answers alone (:func:`_lexical_answer`)."""
+    key = (idx.version, question)
+    if (hit := query_cache.RETRIEVE.get(key)) is not None:
+        return hit
+    where = _filter(question, idx)
+    lexical_hits = None
+    if lexicon.SHORTCUT and lexicon.LEXICON.eligible(question):
+        # BM25 first: when it answers alone, the dense stages never run
+        lexical_hits = await _lexical_hits(question, idx, where)
+        if _lexically_confident(question, lexical_hits, idx):
+            lexicon.ANSWERS.inc("lexical")
+            query_cache.RETRIEVE.put(key, (lexical_hits, []))
+            return lexical_hits, []
+    lexicon.ANSWERS.inc("hybrid")
+
+    async def lexical() -> List[int]:
+        if lexical_hits is not None:
+            return lexical_hits
+        return await _lexical_hits(question, idx, where)
+
+    if idx.lsa is not None and idx.faiss is idx.lsa:       # DENSE_BACKEND=lsa
+        hits = await asyncio.gather(lexical(), run_blocking(_local_dense, question, idx, where))
+        query_cache.RETRIEVE.put(key, tuple(hits))
+        return tuple(hits)
+    # 1) lexical BM25 runs while 2) the query is embedded remotely
+    bm25_hits, q_vec = await asyncio.gather(lexical(), _embed_query(question, idx))
+    if q_vec is None:
+        if idx.lsa is None:
+            return bm25_hits, []
+        # embedding stage degraded (slow or failing API, open breaker): the
+        # in-process index stands in; the remote one is tried again next time
+        return bm25_hits, await run_blocking(_local_dense, question, idx, where)
+    with tracing.span("faiss"):
+        faiss_hits = idx.faiss.GetTopKIdsByVector(q_vec, top_k_dense, where).tolist()
+    query_cache.RETRIEVE.put(key, (bm25_hits, faiss_hits))
+    return bm25_hits, faiss_hits
+
+@coalesce("retrieve", key=lambda question, idx: (idx.version, question))
+async def _ingredient_query(question: str, idx: index_store.IndexSet) -> RagResult:
+    """Hybrid lexical + dense search followed by Cohere rerank → top passages
+    (BM25 alone when it answers the question confidently)."""
+    bm25_hits, faiss_hits = await _candidates(question, idx)
+    if not faiss_hits and (rag := _lexical_answer(question, bm25_hits, idx)) is not None:
+        return rag
+    return await _rerank_passages(question, bm25_hits, faiss_hits, idx)
+
+async def _rerank_passages(question: str, bm25_hits: List[int], faiss_hits: List[int],
+                           idx: index_store.IndexSet) -> RagResult:
+    # 3) merge & deduplicate chunk IDs (first occurrence keeps its place)
+    pool = list(dict.fromkeys([*bm25_hits, *faiss_hits]))
+    # 4) Cohere cross‑encoder rerank (blocking ⇒ run in thread); candidate
+    #    text is decoded once, for the payload, and coalesced by chunk ID
+    texts = idx.chunks.texts(pool)
+    with tracing.span("rerank"):
+        order = await run_blocking(
+            lambda: idx.reranker.rank(question, texts, key=(idx.chunks.key, tuple(pool)))
+        )
+    return await run_blocking(_context, [pool[i] for i in order], idx)
+
+def _context(ranked: List[int], idx: index_store.IndexSet) -> RagResult:
+    """The prompt passages for chunk IDs ranked best first: the top
+    ``final_k`` windows, with overlapping ones merged into contiguous spans
+    and the tokens that saves spent on the next distinct passages of the
+    ranking (``tools/rag/spans.py``; ``CONTEXT_MERGE=0``: as ranked)."""
+    top = ranked[:final_k]
+    if not spans.MERGE:
+        return RagResult(content=_format_passages(idx.chunks.texts(top)), ids=top)
+    with tracing.span("context"):
+        raw = sum(spans.count_tokens(t) for t in idx.chunks.texts(top))
+        picked = spans.assemble(ranked, idx.chunks, spans.BUDGET or raw)
+    spans.CONTEXT_TOKENS.observe(raw, "raw")
+    spans.CONTEXT_TOKENS.observe(sum(s.tokens for s in picked), "merged")
+    if extra := sum(not set(top).intersection(s.ids) for s in picked):
+        spans.PASSAGES.inc("extra", amount=extra)
+    return RagResult(content=_format_passages(s.text for s in picked),
+                     ids=[i for s in picked for i in s.ids])
+
+def _format_passages(passages) -> str:
+    return PASSAGE_SEP.join(f"{i+1}. {p}" for i, p in enumerate(passages))
+
+def chunk_ids(context: str, idx: index_store.IndexSet | None = None) -> List[int]:
+    """Chunk IDs of the passages in a formatted RAG context (compact session
+    storage): a merged span as the windows it covers; passages not in the
+    passage table are dropped.  IDs are only meaningful for the index
+    version they were taken from."""
+    chunks = (idx or indexes.current()).chunks
+    ids = []
+    for part in context.split(PASSAGE_SEP):
+        ids.extend(spans.window_ids(_NUMBERING.sub("", part, count=1), chunks))
+    return ids
+
+def chunk_context(ids, version: str | None = None) -> str | None:
+    """Rehydrate :func:`chunk_ids` into the formatted context again; ``None``
+    when they belong to another index *version* than the one being served."""
+    idx = indexes.current()
+    if version is not None and version != idx.version:
+        return None
+    if not spans.MERGE:
+        return _format_passages(idx.chunks.texts(ids))
+    return _format_passages(spans.texts(ids, idx.chunks))
+
+def warm_caches(questions: List[str], concurrency: int = 8) -> int:
+    """Run retrieval + rerank for *questions* (already :func:`query_log.normalize`-d)
+    so the embedding / retrieval / rerank caches hold their results before
+    traffic arrives; returns how many were answered without a degraded stage.
+    Bounded by ``QUERY_WARM_SECONDS`` — past it, the remaining questions
+    degrade immediately and are left uncached.  Spins up its own event loop
+    and thread pools: call it in the process that will serve (never before
+    ``fork()``)."""
+    idx = indexes.current()
+
+    async def run():
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(question: str) -> bool:
+            async with sem:
+                try:
+                    await _ingredient_query(question, idx)
+                except Exception:
+                    logger.exception("cache warm-up query %r failed", question)
+                    return False
+                return (idx.version, question) in query_cache.RETRIEVE
+
+        return sum(await asyncio.gather(*(one(q) for q in questions)))
+
+    with resilience.budget(float(os.getenv("QUERY_WARM_SECONDS", "30"))):
+        return asyncio.run(run())
+
+# ───────────────────────────── bulk (many pantries) ────────────────────────────
+async def _embed_many(questions: List[str],
+                      idx: index_store.IndexSet) -> List[List[float]] | None:
+    async def call():
+        async with upstream("openai"):
+            return await run_blocking(idx.faiss.EmbedQueries, questions)
+
+    with tracing.span("embed"):
+        return await guarded("embed", call, fallback=lambda: None)
+
+async def _retrieve_many(questions: List[str],
+                         idx: index_store.IndexSet) -> List[tuple[List[int], List[int]]]:
+    """BM25 + FAISS candidate chunk IDs for every question: one embedding
+    request for the whole batch, and one vectorized BM25 pass and one FAISS
+    search per distinct metadata filter (usually one: unfiltered)."""
+    groups: dict[str | None, List[int]] = {}
+    for i, q in enumerate(questions):
+        groups.setdefault(_filter(q, idx), []).append(i)
+    expanded = [lexicon.LEXICON.expand(q) for q in questions]
+
+    def lexical():
+        out: List[List[int]] = [[] for _ in questions]
+        with tracing.span("bm25"):
+            for where, pos in groups.items():
+                rows = idx.bm25.GetBM25TopKIdsBatch([expanded[i] for i in pos], top_k_lex,
+                                                    where).tolist()
+                for i, row in zip(pos, rows):
+                    out[i] = [c for c in row if c >= 0]     # sharded: -1 padded
+        return out
+
+    def dense_search(retriever, vectors):
+        x = np.asarray(vectors, dtype=np.float32)
+        out: List[List[int]] = [[] for _ in questions]
+        for where, pos in groups.items():
+            ids, _ = retriever.GetTopKIdsByVectors(x[pos], top_k_dense, where)
+            for i, row in zip(pos, ids.tolist()):
+                out[i] = [c for c in row if c >= 0]
+        return out
+
+    def local_search():
+        with tracing.span("lsa"):
+            return dense_search(idx.lsa, idx.lsa.EmbedQueries(expanded))
+
+    lexical_task = asyncio.ensure_future(run_blocking(lexical))
+    if idx.lsa is not None and idx.faiss is idx.lsa:       # DENSE_BACKEND=lsa
+        return list(zip(await lexical_task, await run_blocking(local_search)))
+    vectors = await _embed_many(questions, idx)
+    lex = await lexical_task
+    dense = [[] for _ in questions]
+    if vectors is not None:
+        with tracing.span("faiss"):
+            dense = await run_blocking(dense_search, idx.faiss, vectors)
+    elif idx.lsa is not None:                               # embedding stage degraded
+        dense = await run_blocking(local_search)
+    return list(zip(lex, dense))
+
+async def answer_many(questions: List[str], concurrency: int = 8):
+    """
+    Answer many independent questions (pantries); async-yields
+    ``(index, answer)`` — or ``(index, exception)`` — as each one completes.
+
+    Retrieval is batched up front; rerank + generation then run per question,
+    at most *concurrency* at a time, each under its own request budget.  No
+    gatekeeper or chat history: every pantry is a fresh RAG question.
+    """
+    idx = indexes.current()               # one index version for the whole batch
+    with resilience.budget():
+        candidates = await _retrieve_many(questions, idx)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            with resilience.budget():
+                try:
+                    question, (bm25_hits, faiss_hits) = questions[i], candidates[i]
+                    rag = None
+                    # as interactively: BM25 alone only for an eligible question
+                    # whose dense stage came back empty
+                    if (not faiss_hits and lexicon.SHORTCUT
+                            and lexicon.LEXICON.eligible(question)):
+                        rag = _lexical_answer(question, bm25_hits, idx)
+                    if rag is None:
+                        rag = await _rerank_passages(question, bm25_hits, faiss_hits, idx)
+                    answer, _ = await answer_query(question, None, rag.content)
+                    return i, answer
+                except Exception as err:            # one bad pantry must not sink the batch
+                    logger.exception("bulk item %d failed", i)
+                    return i, err
+
+    for fut in asyncio.as_completed([one(i) for i in range(len(questions))]):
+        yield await fut
 
 # ───────────────────────────── topic detector ────────────────────────────
 TOPIC_PAT = re.compile(r"(?:recipe for|make|cook|买|做)\s+([\w\u4e00-\u9fff\s\-]+)",
@@ -114,8 +391,8 @@ def detect_topic(user_msg: str, ctx: str) -> str | None:
 def filter_passages(topic: str, context: str) -> str:
     if not topic:
         return context
-    keep = [p for p in context.split("\n\n---\n\n") if topic.lower() in p.lower()]
-    return "\n\n---\n\n".join(keep) or context
+    keep = [p for p in context.split(PASSAGE_SEP) if topic.lower() in p.lower()]
+    return PASSAGE_SEP.join(keep) or context
 
 async def answer_query(
     question: str,
@@ -128,7 +405,9 @@ async def answer_query(
     if precomputed_context is not None:
         context = precomputed_context
     else:
-        rag_result = await _ingredient_query(question)
+        with tracing.span("retrieve"):
+            rag_result = await _ingredient_query(query_log.normalize(question),
+                                                 indexes.current())
         context = rag_result.content
 
     # (2) Compose system / user messages for OpenAI chat completion
@@ -208,14 +487,23 @@ async def answer_query(
             ),
         })
     
-    # (3) Call OpenAI – run sync client in executor so we remain async
+    # (3) Call OpenAI – pooled async client bound to the running loop
+    async def _generate():
+        async with upstream("openai"):
+            return await openai_client().chat.completions.create(  
+                model="gpt-4o",
+                messages=prompt_messages,
+                temperature=0.2,
+            )
+
     try:
-        completion = await client.chat.completions.create(  
-            model="gpt-4o",
-            messages=prompt_messages,
-            temperature=0.2,
-        )
+        # bounded by what is left of the request budget; hedged past its p95
+        with tracing.span("generate"):
+            completion = await guarded("generate", _generate)
+        tracing.record_usage("generate", "gpt-4o", completion.usage)
         answer = completion.choices[0].message.content.strip()
+    except Overloaded:
+        raise                               # shed → 503 + Retry-After, not an apology
     except Exception as err:
         logger.exception("OpenAI generation failed: %s", err)
         answer = (
@@ -227,7 +515,8 @@ async def answer_query(
     if m:
         dish_name = m.group(1).strip()
         try:
-            vids = youtube_helper.search_youtube_recipes(dish_name, max_results=5)
+            vids = await run_blocking(
+                youtube_helper.search_youtube_recipes, dish_name, max_results=5)
             links = "\n".join(f"- {v['title']}: {v['url']}" for v in vids)
             replacement = (
                 f"Here are some useful YouTube tutorials for **{dish_name}**:\n"
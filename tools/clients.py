@@ -0,0 +1,121 @@
+"""tools/clients.py — shared, pooled upstream clients and the blocking-call pool.
+
+* :func:`openai_client` — one ``openai.AsyncOpenAI`` per running event loop
+  (httpx connection pools are bound to the loop that opened them), so the
+  long-lived serving loop reuses a single keep-alive pool.
+* :func:`openai_sync_client` / :func:`httpx_sync_client` — thread-safe pooled
+  clients for SDK calls that only exist in blocking form.
+* :func:`http_session` — pooled ``requests.Session`` for Google Maps.
+* :func:`youtube_service` — cached YouTube discovery client (one per thread,
+  ``httplib2`` is not thread-safe).
+* :func:`run_blocking` — run a blocking callable on a bounded thread pool
+  without losing the caller's trace context.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+
+from tools import profiling
+
+__all__ = [
+    "openai_client", "openai_sync_client", "httpx_sync_client",
+    "http_session", "youtube_service", "run_blocking", "BLOCKING_POOL",
+]
+
+MAX_CONNECTIONS  = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "64"))
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "16"))
+HTTP_TIMEOUT     = httpx.Timeout(float(os.getenv("UPSTREAM_TIMEOUT", "60")), connect=5.0)
+
+_LIMITS = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                       max_keepalive_connections=MAX_CONNECTIONS,
+                       keepalive_expiry=30.0)
+
+BLOCKING_POOL = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS,
+                                   thread_name_prefix="chef-blocking")
+
+_lock = threading.Lock()
+_async_openai: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = \
+    weakref.WeakKeyDictionary()
+_sync_openai: openai.OpenAI | None = None
+_sync_httpx: httpx.Client | None = None
+_session = None
+_local = threading.local()
+
+
+def openai_client() -> openai.AsyncOpenAI:
+    """Pooled async OpenAI client for the *current* event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_openai.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                http_client=httpx.AsyncClient(limits=_LIMITS, timeout=HTTP_TIMEOUT))
+            _async_openai[loop] = client
+        return client
+
+
+def openai_sync_client() -> openai.OpenAI:
+    global _sync_openai
+    with _lock:
+        if _sync_openai is None:
+            _sync_openai = openai.OpenAI(http_client=httpx.Client(
+                limits=_LIMITS, timeout=HTTP_TIMEOUT))
+        return _sync_openai
+
+
+def httpx_sync_client() -> httpx.Client:
+    """Shared blocking httpx pool (handed to the Cohere SDK)."""
+    global _sync_httpx
+    with _lock:
+        if _sync_httpx is None:
+            _sync_httpx = httpx.Client(limits=_LIMITS, timeout=HTTP_TIMEOUT)
+        return _sync_httpx
+
+
+def http_session():
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def youtube_service(api_key: str):
+    svc = getattr(_local, "youtube", None)
+    if svc is None or getattr(_local, "youtube_key", None) != api_key:
+        from googleapiclient.discovery import build
+        svc = build("youtube", "v3", developerKey=api_key, cache_discovery=False)
+        _local.youtube, _local.youtube_key = svc, api_key
+    return svc
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on :data:`BLOCKING_POOL` (trace- and
+    profile-aware)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        BLOCKING_POOL, functools.partial(ctx.run, profiling.bound(fn), *args, **kwargs))
+
+
+async def aclose() -> None:
+    """Close the pool belonging to the current loop (ASGI shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_openai.pop(loop, None)
+    if client is not None:
+        await client.close()
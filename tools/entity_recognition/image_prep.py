@@ -0,0 +1,118 @@
+"""
+In-memory preprocessing for the vision call: downscale + JPEG recompress,
+plus a perceptual-hash (dHash) cache of detection results.
+
+Phone photos are 3–8 MB; gpt-4o resizes them server-side anyway, so sending
+the full resolution only costs upload time and base64 bandwidth.  Re-uploads
+and near-duplicate shots (same fridge, a second later) hash to within a few
+bits of each other and reuse the previous detection.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+__all__ = ["prepare_image", "dhash", "DetectionCache", "ImageDecodeError"]
+
+_DHASH_MASK  = (1 << 64) - 1
+MAX_PIXELS   = int(os.getenv("VISION_MAX_PIXELS", str(1024 * 768)))
+JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "82"))
+
+
+class ImageDecodeError(ValueError):
+    """The upload is not an image PIL can decode (or is truncated)."""
+
+
+def prepare_image(data: bytes, max_pixels: int = MAX_PIXELS,
+                  quality: int = JPEG_QUALITY) -> tuple[bytes, int]:
+    """
+    Return ``(jpeg_bytes, phash)`` for the upload *data*, downscaled so that
+    ``width * height <= max_pixels`` (aspect ratio kept, EXIF rotation applied).
+    *phash* is a 64-bit dHash with a coarse colour signature in the high bits.
+    Raises :class:`ImageDecodeError` if *data* is not a readable image.
+    """
+    try:
+        return _prepare(data, max_pixels, quality)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as err:
+        raise ImageDecodeError(str(err) or type(err).__name__) from err
+
+
+def _prepare(data: bytes, max_pixels: int, quality: int) -> tuple[bytes, int]:
+    img = Image.open(io.BytesIO(data))
+    w, h = img.size
+    scale = min(1.0, (max_pixels / float(w * h)) ** 0.5)
+    target = (max(1, int(w * scale)), max(1, int(h * scale)))
+    # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale — much cheaper than full decode
+    img.draft("RGB", target)
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    if img.size[0] * img.size[1] > max_pixels:
+        w, h = img.size
+        scale = (max_pixels / float(w * h)) ** 0.5
+        img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))),
+                         Image.LANCZOS)
+    phash = (color_signature(img) << 64) | dhash(img)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), phash
+
+
+def dhash(img: Image.Image, size: int = 8) -> int:
+    """64-bit difference hash: robust to rescaling / recompression."""
+    small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = small.load()
+    bits = 0
+    for y in range(size):
+        for x in range(size):
+            bits = (bits << 1) | (px[x, y] > px[x + 1, y])
+    return bits
+
+
+def color_signature(img: Image.Image) -> int:
+    """Mean colour of each image quadrant, 3 bits per channel (36 bits).
+    dHash only sees luminance structure; this keeps same-layout photos of
+    differently coloured food apart."""
+    small = img.resize((2, 2), Image.BOX)
+    sig = 0
+    for r, g, b in small.getdata():
+        sig = (sig << 9) | (r >> 5) << 6 | (g >> 5) << 3 | (b >> 5)
+    return sig
+
+
+class DetectionCache:
+    """
+    LRU of ``phash → detection`` where a lookup also matches any stored hash
+    with the same colour signature and a dHash within *max_distance* bits
+    (near-duplicate photos).
+    """
+
+    def __init__(self, capacity: int = 1024, max_distance: int = 4):
+        self.capacity, self.max_distance = capacity, max_distance
+        self._lock = threading.Lock()
+        self._data: OrderedDict[int, str] = OrderedDict()
+
+    def get(self, phash: int) -> str | None:
+        with self._lock:
+            if phash in self._data:
+                self._data.move_to_end(phash)
+                return self._data[phash]
+            best, best_d = None, self.max_distance + 1
+            for h in self._data:
+                if h >> 64 != phash >> 64:
+                    continue
+                d = ((h ^ phash) & _DHASH_MASK).bit_count()
+                if d < best_d:
+                    best, best_d = h, d
+            if best is None:
+                return None
+            self._data.move_to_end(best)
+            return self._data[best]
+
+    def put(self, phash: int, detection: str) -> None:
+        with self._lock:
+            self._data[phash] = detection
+            self._data.move_to_end(phash)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
@@ -1,58 +1,176 @@
 import os
+import re
+import json
+import asyncio
+import logging
 import openai
 import base64
 
+from tools import tracing
+from tools.clients import openai_client, openai_sync_client, run_blocking
+from tools.limits import upstream
+from tools.resilience import guarded, guarded_sync
+from tools.entity_recognition.image_prep import DetectionCache, ImageDecodeError, prepare_image
+
+logger = logging.getLogger(__name__)
+
 # 1. Set your API key in the environment variable OPENAI_API_KEY
 openai.api_key = os.environ.get("OPENAI_API_KEY")
 
-# 2. Read and encode your image
-def ingredients_detector(image_path: str) -> str:
-    """
-    Detects ingredients in the image using OpenAI's vision-enabled chat model.
-    
-    Args:
-        image_path (str): Path to the image file.
-        
-    Returns:
-        str: The assistant's response regarding the detected ingredients.
-    """
-    # Read the image and encode it in base64
-    with open(image_path, "rb") as f:
-        b64_image = base64.b64encode(f.read()).decode("utf-8")
+VISION_MODEL  = "gpt-4o"
+VISION_DETAIL = os.getenv("VISION_DETAIL", "auto")   # "low" = flat 85 tokens/image
 
-    # Build the messages payload
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a vision-enabled culinary assistant.\n"
-                "• Detect every visible food ingredient in the image.\n"
-                "• Return **only** a JSON array, no extra text. Each element must be a string.\n"
-                "  Example output: [\"egg\", \"green bell pepper\", \"sesame oil\"]\n"
-                "• If nothing is clearly recognizable, return an empty JSON array: []."
-            ),
-        },
+# detections keyed by perceptual hash — re-uploads / near-duplicates skip the model
+_cache = DetectionCache(capacity=int(os.getenv("VISION_CACHE_SIZE", "1024")))
+
+_SYSTEM_PROMPT = (
+    "You are a vision-enabled culinary assistant.\n"
+    "• Detect every visible food ingredient in the image.\n"
+    "• Return **only** a JSON array, no extra text. Each element must be a string.\n"
+    "  Example output: [\"egg\", \"green bell pepper\", \"sesame oil\"]\n"
+    "• If nothing is clearly recognizable, return an empty JSON array: []."
+)
+
+def _messages(jpeg: bytes) -> list[dict]:
+    b64_image = base64.b64encode(jpeg).decode("utf-8")
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
         {
             "role": "user",
             "content": [
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{b64_image}"
+                        "url": f"data:image/jpeg;base64,{b64_image}",
+                        "detail": VISION_DETAIL,
                     }
                 }
             ]
         }
     ]
 
+def _prepare(data: bytes) -> tuple[bytes, int]:
+    with tracing.span("image_prep"):
+        return prepare_image(data)
+
+def detect_ingredients(data: bytes) -> str:
+    """
+    Detect ingredients in raw image bytes (blocking).
+
+    The image is downscaled/recompressed in memory and looked up in the
+    perceptual-hash cache before calling the vision model.
+
+    Returns:
+        str: The model's JSON array of ingredient names.
+    """
+    jpeg, phash = _prepare(data)
+    if (hit := _cache.get(phash)) is not None:
+        tracing.record_cache("vision", True)
+        return hit
+    tracing.record_cache("vision", False)
 
     # Call the vision-enabled chat model
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=messages
-    )
+    def call():
+        with upstream("openai"):
+            return openai_sync_client().chat.completions.create(
+                model=VISION_MODEL,
+                messages=_messages(jpeg)
+            )
+
+    with tracing.span("vision"):
+        response = guarded_sync("vision", call)
+    tracing.record_usage("vision", VISION_MODEL, response.usage)
+    answer = response.choices[0].message.content
+    _cache.put(phash, answer)
+    return answer
+
+async def adetect_ingredients(data: bytes) -> str:
+    """Async :func:`detect_ingredients`: image work on the blocking pool,
+    the vision call on the loop's pooled client — no worker thread is held."""
+    jpeg, phash = await run_blocking(_prepare, data)
+    if (hit := _cache.get(phash)) is not None:
+        tracing.record_cache("vision", True)
+        return hit
+    tracing.record_cache("vision", False)
+
+    async def call():
+        async with upstream("openai"):
+            return await openai_client().chat.completions.create(
+                model=VISION_MODEL,
+                messages=_messages(jpeg)
+            )
+
+    with tracing.span("vision"):
+        response = await guarded("vision", call)
+    tracing.record_usage("vision", VISION_MODEL, response.usage)
+    answer = response.choices[0].message.content
+    _cache.put(phash, answer)
+    return answer
+
+_JSON_ARRAY = re.compile(r"\[.*?\]", re.S)
 
-    # Extract and return the assistant’s answer
-    return response.choices[0].message.content
+def parse_detection(text: str) -> list[str]:
+    """Model reply → list of ingredient names (tolerates ```json fences / prose)."""
+    m = _JSON_ARRAY.search(text or "")
+    if not m:
+        return []
+    try:
+        items = json.loads(m.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [str(i).strip() for i in items if str(i).strip()]
 
+def _singular(name: str) -> str:
+    name = " ".join(name.lower().split())
+    if name.endswith("ies"):
+        return name[:-3] + "y"
+    if name.endswith(("oes", "ches", "shes", "xes")):
+        return name[:-2]
+    if name.endswith("s") and not name.endswith("ss"):
+        return name[:-1]
+    return name
 
+def merge_detections(texts: list[str]) -> list[str]:
+    """Union of several detections, case/space/plural-insensitive, first spelling wins."""
+    merged: dict[str, str] = {}
+    for text in texts:
+        for item in parse_detection(text):
+            merged.setdefault(_singular(item), item)
+    return list(merged.values())
+
+async def adetect_many(images: list[bytes], concurrency: int = 4) -> list[str]:
+    """Run :func:`adetect_ingredients` over *images*, at most *concurrency* at
+    once; the detections of the images that succeeded.  Failed images (not an
+    image, vision timeout …) are logged and skipped; only when every one
+    fails is an error raised — :class:`ImageDecodeError` if none was readable."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(data: bytes) -> str:
+        async with sem:
+            return await adetect_ingredients(data)
+
+    results = await asyncio.gather(*(one(d) for d in images), return_exceptions=True)
+    detections = [r for r in results if not isinstance(r, BaseException)]
+    failed = [(i, r) for i, r in enumerate(results) if isinstance(r, BaseException)]
+    for i, err in failed:
+        logger.warning("image %d of %d skipped: %s: %s", i + 1, len(images),
+                       type(err).__name__, err)
+    if failed and not detections:
+        # an upstream failure says more than "not an image" about the others
+        raise next((e for _, e in failed if not isinstance(e, ImageDecodeError)),
+                   failed[0][1])
+    return detections
+
+# 2. Read and encode your image
+def ingredients_detector(image_path: str) -> str:
+    """
+    Detects ingredients in the image using OpenAI's vision-enabled chat model.
+    
+    Args:
+        image_path (str): Path to the image file.
+        
+    Returns:
+        str: The assistant's response regarding the detected ingredients.
+    """
+    with open(image_path, "rb") as f:
+        return detect_ingredients(f.read())
@@ -1,12 +1,14 @@
 # tools/gatekeeper.py
 import os, json, datetime
 from pathlib import Path
-import openai
-import tiktoken
+
+from tools import tracing
+from tools.clients import openai_client
+from tools.limits import upstream
+from tools.resilience import guarded
+from tools.singleflight import coalesce
 
 GK_MODEL   = os.getenv("GK_MODEL", "gpt-4o-mini")
-client     = openai.AsyncOpenAI()
-enc        = tiktoken.encoding_for_model(GK_MODEL)
 
 _PROMPT_HEADER = """\
 You are a binary classifier. Decide whether the assistant must refresh
@@ -44,18 +46,29 @@ Your response should exactly: RAG or NO_RAG
 • Do not use any other language.
 """
 
+async def _classify(focus: str, new_msg: str):
+    async with upstream("openai"):
+        return await openai_client().chat.completions.create(
+            model=GK_MODEL,
+            messages=[
+                {"role": "system", "content": _PROMPT_HEADER},
+                {"role": "user",
+                 "content": f"CURRENT_FOCUS: {focus}\n\nLATEST_USER:\n{new_msg}"}],
+            temperature=0,
+            max_tokens=3,
+        )
+
+@coalesce("gatekeeper", key=lambda focus, new_msg, session_id="anon": (focus, new_msg))
 async def need_rag(focus: str, new_msg: str,
                    session_id: str | None = "anon") -> tuple[bool, str]:
     """Returns (need_rag_flag, 'RAG' | 'NO_RAG')."""
-    resp = await client.chat.completions.create(
-        model=GK_MODEL,
-        messages=[
-            {"role": "system", "content": _PROMPT_HEADER},
-            {"role": "user",
-             "content": f"CURRENT_FOCUS: {focus}\n\nLATEST_USER:\n{new_msg}"}],
-        temperature=0,
-        max_tokens=3,
-    )
+    with tracing.span("gatekeeper"):
+        resp = await guarded("gatekeeper", lambda: _classify(focus, new_msg),
+                             fallback=lambda: None)
+    if resp is None:
+        # degraded: retrieving again is safer than answering from stale context
+        return True, "RAG"
+    tracing.record_usage("gatekeeper", GK_MODEL, resp.usage)
     token = resp.choices[0].message.content.strip().upper()
 
     return token == "RAG", token
\ No newline at end of file
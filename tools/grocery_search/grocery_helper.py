@@ -1,21 +1,34 @@
-import requests
 import json
 import os
 
-api_key = os.environ.get("GOOGLEMAP_API")
-if not api_key:
-    raise EnvironmentError("Environment variable 'GOOGLEMAP_API' not set.")
+from tools import tracing
+from tools.clients import http_session
+from tools.limits import upstream
+from tools.resilience import guarded_sync
+from tools.singleflight import coalesce
+
+def _api_key():
+    # checked on first use, not at import, so the server starts without it
+    api_key = os.environ.get("GOOGLEMAP_API")
+    if not api_key:
+        raise EnvironmentError("Environment variable 'GOOGLEMAP_API' not set.")
+    return api_key
+
+def _get_json(url):
+    with upstream("maps"):
+        return http_session().get(url, timeout=10).json()
 
 def get_lat_lng_from_zip(zipcode):
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={zipcode}&key={api_key}"
-    response = requests.get(url)
-    res_json = response.json()
+    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={zipcode}&key={_api_key()}"
+    with tracing.span("geocode"):
+        res_json = guarded_sync("geocode", lambda: _get_json(url))
     if res_json['status'] == 'OK':
         location = res_json['results'][0]['geometry']['location']
         return location['lat'], location['lng']
     else:
         raise ValueError(f"Can't locate zipcode {zipcode}. Error：{res_json['status']}")
 
+@coalesce("places", key=lambda zipcode, item_list, radius=1500: (zipcode, tuple(item_list), radius))
 def search_grocery_store_nearby(zipcode, item_list, radius=1500):
     lat, lng = get_lat_lng_from_zip(zipcode)
     results_by_item = {}
@@ -23,10 +36,11 @@ def search_grocery_store_nearby(zipcode, item_list, radius=1500):
     for item in item_list:
         url = (
             f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?"
-            f"location={lat},{lng}&radius={radius}&keyword={item}+grocery&key={api_key}"
+            f"location={lat},{lng}&radius={radius}&keyword={item}+grocery&key={_api_key()}"
         )
-        response = requests.get(url)
-        res_json = response.json()
+        with tracing.span("places"):
+            # degraded: an item whose lookup fails just lists no stores
+            res_json = guarded_sync("places", lambda: _get_json(url), fallback=dict)
         results = []
         for place in res_json.get('results', []):
             results.append({
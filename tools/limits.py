@@ -0,0 +1,289 @@
+"""tools/limits.py — concurrency limits, token buckets and load shedding.
+
+A :class:`Limiter` is a FIFO semaphore (optionally combined with a token
+bucket) that works from threads *and* from coroutines on any event loop, so
+one limit covers the Flask handler threads, the shared agent loop and the
+blocking pool alike::
+
+    with limits.upstream("cohere"):             # blocking SDK call
+        client.rerank(...)
+
+    async with limits.upstream("openai"):       # async client
+        await openai_client().chat.completions.create(...)
+
+Waiting is bounded: a limiter with ``max_waiting`` rejects immediately once
+that many callers are queued, and every wait gives up after ``timeout``
+seconds.  Both raise :class:`Overloaded`, which the servers turn into a fast
+``503`` with ``Retry-After`` instead of a slow upstream failure.
+
+Per-upstream limits come from ``UPSTREAM_LIMITS``, a comma separated list of
+``name=concurrency[:requests_per_second]``, e.g.
+``"openai=32,cohere=8:10,youtube=4,maps=8,speech=8"``.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from tools import tracing
+
+__all__ = ["Overloaded", "RateLimited", "Limiter", "TokenBucket", "KeyedRateLimiter",
+           "upstream"]
+
+DEFAULT_UPSTREAM_LIMITS = "openai=32,cohere=8,youtube=4,maps=8,speech=8"
+UPSTREAM_WAIT = float(os.getenv("UPSTREAM_WAIT", "10"))
+
+INFLIGHT = tracing.register(tracing.Gauge(
+    "chef_limit_inflight", "Calls holding a slot.", ("limiter",)))
+WAITING = tracing.register(tracing.Gauge(
+    "chef_limit_waiting", "Calls queued for a slot.", ("limiter",)))
+WAIT_SECONDS = tracing.register(tracing.Histogram(
+    "chef_limit_wait_seconds", "Time spent queued before getting a slot.", ("limiter",)))
+SHED = tracing.register(tracing.Counter(
+    "chef_limit_shed_total", "Calls rejected instead of queued.", ("limiter", "reason")))
+
+
+class Overloaded(RuntimeError):
+    """A limit is saturated; retry after :attr:`retry_after` seconds (→ 503)."""
+
+    status = 503
+
+    def __init__(self, limiter: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"{limiter}: {reason}")
+        self.limiter, self.reason = limiter, reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimited(Overloaded):
+    """A caller exceeded its own rate (→ 429)."""
+
+    status = 429
+
+
+class TokenBucket:
+    """*rate* tokens per second, at most *burst* banked.  Not thread-safe on
+    its own — callers hold their own lock."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens, self.stamp = self.burst, time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token; return how long the caller must wait for it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens += 1
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self.loop = loop
+        if loop is None:
+            self.event, self.future = threading.Event(), None
+        else:
+            self.event, self.future = None, loop.create_future()
+
+    def wake(self) -> bool:
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(
+                lambda f=self.future: f.done() or f.set_result(None))
+        except RuntimeError:                 # loop closed — skip this waiter
+            return False
+        return True
+
+
+class Limiter:
+    """
+    At most *concurrency* holders; with *rate*, also at most *rate* starts
+    per second.  Slots are handed to waiters in arrival order.
+    """
+
+    def __init__(self, name: str, concurrency: int, rate: float = 0.0,
+                 burst: float | None = None, max_waiting: int | None = None,
+                 timeout: float = UPSTREAM_WAIT):
+        self.name, self.concurrency = name, concurrency
+        self.max_waiting, self.timeout = max_waiting, timeout
+        self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: deque[_Waiter] = deque()
+        INFLIGHT.set_function(lambda: {(self.name,): self._active})
+        WAITING.set_function(lambda: {(self.name,): len(self._waiters)})
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    # ── internals ──
+    def _reject(self, reason: str, retry_after: float) -> Overloaded:
+        SHED.inc(self.name, reason)
+        return Overloaded(self.name, reason, retry_after)
+
+    def _reserve_token(self, timeout: float) -> float:
+        if self._bucket is None:
+            return 0.0
+        delay = self._bucket.reserve()
+        if delay > timeout:
+            self._bucket.refund()
+            raise self._reject("rate", delay)
+        return delay
+
+    def _enter(self, waiter_factory, timeout: float) -> tuple[float, _Waiter | None]:
+        """Reserve a start token, then take a free slot (waiter ``None``) or
+        enqueue.  Returns ``(token delay, waiter)``."""
+        with self._lock:
+            delay = self._reserve_token(timeout)
+            if self._active < self.concurrency and not self._waiters:
+                self._active += 1
+                return delay, None
+            if self.max_waiting is not None and len(self._waiters) >= self.max_waiting:
+                if self._bucket is not None:
+                    self._bucket.refund()
+                raise self._reject("queue_full", self.timeout)
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return delay, waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that gave up; ``False`` if it was already handed a slot."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft().wake():
+                    return                   # slot passes straight to the waiter
+            self._active -= 1
+
+    # ── blocking API ──
+    def acquire(self, timeout: float | None = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        t0 = time.monotonic()
+        delay, waiter = self._enter(_Waiter, timeout)
+        if delay:
+            time.sleep(delay)
+        if waiter is not None:
+            left = max(0.0, timeout - (time.monotonic() - t0))
+            if not waiter.event.wait(left) and self._abandon(waiter):
+                raise self._reject("timeout", self.timeout)
+        WAIT_SECONDS.observe(time.monotonic() - t0, self.name)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    # ── async API ──
+    async def acquire_async(self, timeout: float | None = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        t0 = time.monotonic()
+        delay, waiter = self._enter(lambda: _Waiter(loop), timeout)
+        if delay:
+            await asyncio.sleep(delay)
+        if waiter is not None:
+            left = max(0.0, timeout - (time.monotonic() - t0))
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), left)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as err:
+                if self._abandon(waiter):
+                    if isinstance(err, asyncio.TimeoutError):
+                        raise self._reject("timeout", self.timeout) from None
+                    raise
+                # lost the race: the slot was handed over while we gave up
+                if isinstance(err, asyncio.CancelledError):
+                    self.release()
+                    raise
+        WAIT_SECONDS.observe(time.monotonic() - t0, self.name)
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class KeyedRateLimiter:
+    """
+    One :class:`TokenBucket` per key (e.g. session ID), LRU-bounded to
+    *max_keys*.  :meth:`check` raises :class:`RateLimited` when a key is out
+    of tokens — it never waits.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float | None = None,
+                 max_keys: int = 100_000):
+        self.name, self.rate, self.burst, self.max_keys = name, rate, burst, max_keys
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def check(self, key: str) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            delay = bucket.reserve()
+            if delay > 0:
+                bucket.refund()
+                SHED.inc(self.name, "rate")
+                raise RateLimited(self.name, "rate", delay)
+
+
+# ───────────────────────────── per-upstream limits ────────────────────────────
+def _parse_limits(spec: str) -> dict[str, tuple[int, float]]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = item.partition("=")
+        conc, _, rate = value.partition(":")
+        out[name.strip()] = (int(conc), float(rate or 0))
+    return out
+
+
+_UPSTREAM_SPEC = {**_parse_limits(DEFAULT_UPSTREAM_LIMITS),
+                  **_parse_limits(os.getenv("UPSTREAM_LIMITS", ""))}
+_upstreams: dict[str, Limiter] = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name: str) -> Limiter:
+    """The process-wide :class:`Limiter` for upstream *name* (see module doc)."""
+    with _upstreams_lock:
+        lim = _upstreams.get(name)
+        if lim is None:
+            conc, rate = _UPSTREAM_SPEC.get(name, (64, 0.0))
+            lim = _upstreams[name] = Limiter(f"upstream.{name}", conc, rate=rate)
+        return lim
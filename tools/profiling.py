@@ -0,0 +1,292 @@
+"""tools/profiling.py — opt-in, per-request wall-clock sampling profiler.
+
+A profiled request is sampled every ``PROFILE_INTERVAL_MS`` (5 ms) by one
+background thread, which runs only while some request is being profiled:
+
+* threads running the request's blocking work (:func:`bound` — every
+  :func:`tools.clients.run_blocking` call — jieba, BM25, FAISS, rerank,
+  SDK calls) contribute their current stack;
+* the event loop thread contributes its stack while one of the request's
+  tasks is running on it (tasks are recognised with a task factory,
+  installed on a loop by its first profiled request);
+* when neither is the case, the request is waiting — the samples are the
+  await chains of its suspended tasks (ending in ``(await <type>)``: an
+  upstream call, a lock, a semaphore), or under Flask, failing that, the
+  request thread's stack.
+
+So the samples of a profile cover its wall-clock time, split between
+Python work (gatekeeper regexes, BM25, JSON in ``answer_query``) and
+waiting; branches running in parallel (BM25 in a thread while the query
+embedding is awaited) each count.  Finished profiles go to a ring buffer of ``PROFILE_KEEP`` (32)
+and are downloaded as collapsed stacks (``frame;frame;frame count``, the
+input of ``flamegraph.pl``, speedscope and most flame-graph viewers)::
+
+    curl localhost:5000/api/admin/profiles -H "X-Admin-Token: $CHEF_ADMIN_TOKEN"
+    curl "localhost:5000/api/admin/profiles/folded?id=<trace id>" \
+         -H "X-Admin-Token: $CHEF_ADMIN_TOKEN" | flamegraph.pl > request.svg
+
+A request is profiled when it carries ``X-Profile: 1`` together with a
+valid admin token, or at random with probability ``PROFILE_SAMPLE_RATE``
+(0 — off); at most ``PROFILE_MAX_ACTIVE`` (4) at a time.  Profiles are
+keyed by the request's trace ID.  When no request is profiled the cost is
+a context-variable lookup per blocking call and per task created.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextvars
+import functools
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from tools import tracing
+
+__all__ = ["Profile", "begin", "end", "attach", "bound", "profiles", "get", "folded",
+           "SAMPLE_RATE"]
+
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1e3
+KEEP = int(os.getenv("PROFILE_KEEP", "32"))
+MAX_ACTIVE = int(os.getenv("PROFILE_MAX_ACTIVE", "4"))
+MAX_DEPTH = 128
+
+PROFILES = tracing.register(tracing.Counter(
+    "chef_profiles_total", "Requests selected for profiling, by whether a profile was "
+    "captured or skipped (too many at once).", ("result",)))
+
+
+@dataclass(eq=False)
+class Profile:
+    id: str                                   # the request's trace ID
+    name: str                                 # route
+    started: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    interval: float = INTERVAL
+    samples: collections.Counter = field(default_factory=collections.Counter)
+    # attribution while running
+    root_thread: int | None = None
+    threads: collections.Counter = field(default_factory=collections.Counter)   # ident → depth
+    tasks: weakref.WeakSet = field(default_factory=weakref.WeakSet)
+    loops: dict = field(default_factory=dict)                                 # loop → thread ident
+
+    def summary(self) -> dict:
+        return {"id": self.id, "name": self.name, "started": self.started,
+                "seconds": round(self.seconds, 4), "interval_ms": self.interval * 1e3,
+                "samples": sum(self.samples.values()), "stacks": len(self.samples)}
+
+    def _sample(self, frames: dict) -> None:
+        stacks = [_stack(frames[t]) for t in list(self.threads) if t in frames]
+        for loop, ident in list(self.loops.items()):
+            task = _running_task(loop)
+            if task is not None and task in self.tasks and ident in frames:
+                stacks.append(_stack(frames[ident]))
+        # suspended tasks: what they wait on (threads they wait for are sampled above)
+        for task in list(self.tasks):
+            if not task.done() and (s := _await_stack(task)) and s[-1] not in _JOINS \
+                    and _BLOCKING not in s:
+                stacks.append(s)
+        if not stacks and self.root_thread in frames:
+            stacks.append(_stack(frames[self.root_thread]))
+        for s in stacks:
+            self.samples[s] += 1
+
+
+_current: contextvars.ContextVar[Profile | None] = contextvars.ContextVar(
+    "chef_profile", default=None)
+_lock = threading.Lock()
+_active: set[Profile] = set()
+_done: collections.deque[Profile] = collections.deque(maxlen=KEEP)
+_sampler: threading.Thread | None = None
+_factories: weakref.WeakSet = weakref.WeakSet()        # loops with the task factory
+_names: dict = {}                                      # code object → frame label
+# awaiting other tasks of the request: those are sampled instead
+_JOINS = frozenset(("(await _GatheringFuture)", "(await Task)"))
+_BLOCKING = "clients:run_blocking"
+
+
+# ───────────────────────────── stacks ────────────────────────────────────
+def _label(code) -> str:
+    name = _names.get(code)
+    if name is None:
+        name = _names[code] = f"{Path(code.co_filename).stem}:{code.co_qualname}"
+    return name
+
+
+def _stack(frame) -> tuple[str, ...]:
+    out = []
+    while frame is not None and len(out) < MAX_DEPTH:
+        out.append(_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(out))
+
+
+def _await_stack(task: asyncio.Task) -> tuple[str, ...]:
+    """Root → leaf coroutine frames of a suspended *task*, then what it
+    awaits (``(ready)``: runnable, queued on the loop); empty while it runs."""
+    out, aw = [], task.get_coro()
+    while aw is not None and len(out) < MAX_DEPTH:
+        if getattr(aw, "cr_running", False) or getattr(aw, "ag_running", False):
+            return ()
+        frame = getattr(aw, "cr_frame", None) or getattr(aw, "ag_frame", None)
+        if frame is None:
+            break
+        out.append(_label(frame.f_code))
+        aw = getattr(aw, "cr_await", None) or getattr(aw, "ag_await", None)
+    waiter = getattr(task, "_fut_waiter", None)
+    out.append("(ready)" if waiter is None else f"(await {type(waiter).__name__})")
+    return tuple(out)
+
+
+def _running_task(loop) -> asyncio.Task | None:
+    # the loop's current task, read from another thread (a dict lookup)
+    return getattr(asyncio.tasks, "_current_tasks", {}).get(loop)
+
+
+# ───────────────────────────── sampler ───────────────────────────────────
+def _run_sampler() -> None:
+    global _sampler
+    while True:
+        with _lock:
+            active = list(_active)
+            if not active:
+                _sampler = None
+                return
+        frames = sys._current_frames()
+        with _lock:                                # attribution changes under the lock
+            for p in active:
+                p._sample(frames)
+        del frames
+        time.sleep(INTERVAL)
+
+
+def _task_factory(previous):
+    def factory(loop, coro, **kwargs):
+        task = (previous(loop, coro, **kwargs) if previous is not None
+                else asyncio.Task(coro, loop=loop, **kwargs))
+        if (p := _current.get()) is not None:      # created in a profiled request
+            with _lock:
+                p.tasks.add(task)
+        return task
+    return factory
+
+
+def attach() -> None:
+    """Count the running task (and its loop) as part of the current
+    context's profile — for work scheduled on a loop from another thread
+    (``server.agent`` under Flask)."""
+    p = _current.get()
+    if p is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if loop not in _factories:
+        loop.set_task_factory(_task_factory(loop.get_task_factory()))
+        _factories.add(loop)
+    with _lock:
+        p.loops[loop] = threading.get_ident()
+        if (task := asyncio.current_task()) is not None:
+            p.tasks.add(task)
+
+
+def bound(fn):
+    """*fn*, counting the thread it runs on as part of the current profile
+    for the duration of the call (*fn* itself when nothing is profiled)."""
+    p = _current.get()
+    if p is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        with _lock:
+            p.threads[ident] += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with _lock:
+                p.threads[ident] -= 1
+                if p.threads[ident] <= 0:
+                    del p.threads[ident]
+    return run
+
+
+# ───────────────────────────── requests ──────────────────────────────────
+def begin(name: str, requested: bool = False) -> contextvars.Token | None:
+    """Start profiling the current request (trace) when *requested* or
+    picked by ``PROFILE_SAMPLE_RATE``; returns a token for :func:`end`."""
+    global _sampler
+    if not requested and not (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE):
+        return None
+    p = Profile(id=tracing.current_trace_id() or f"{time.time():.6f}", name=name)
+    with _lock:
+        if len(_active) >= MAX_ACTIVE:
+            PROFILES.inc("skipped")
+            return None
+        _active.add(p)
+    token = _current.set(p)
+    try:
+        asyncio.get_running_loop()
+        attach()
+    except RuntimeError:                           # WSGI: the request's own thread
+        p.root_thread = threading.get_ident()
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_run_sampler, name="chef-profiler",
+                                        daemon=True)
+            _sampler.start()
+    PROFILES.inc("captured")
+    return token
+
+
+def end(token: contextvars.Token | None) -> None:
+    if token is None:
+        return
+    p = token.var.get()
+    try:
+        _current.reset(token)
+    except ValueError:                             # token minted in another context
+        _current.set(None)
+    if p is None:
+        return
+    with _lock:
+        p.seconds = time.time() - p.started
+        p.root_thread = None
+        p.threads.clear()
+        p.loops.clear()
+        _active.discard(p)
+        _done.append(p)
+
+
+# ───────────────────────────── download ──────────────────────────────────
+def profiles() -> list[dict]:
+    """Summaries of the buffered profiles, newest first."""
+    with _lock:
+        return [p.summary() for p in reversed(_done)]
+
+
+def get(profile_id: str) -> Profile | None:
+    with _lock:
+        return next((p for p in reversed(_done) if p.id == profile_id), None)
+
+
+def folded(profile_id: str | None = None) -> str | None:
+    """Collapsed stacks of one profile, or of every buffered profile merged
+    (*profile_id* ``None``); ``None`` when there is no such profile."""
+    if profile_id is None:
+        with _lock:
+            merged = sum((p.samples for p in _done), collections.Counter())
+    else:
+        p = get(profile_id)
+        if p is None:
+            return None
+        merged = p.samples
+    return "".join(f"{';'.join(stack)} {n}\n" for stack, n in merged.most_common())
@@ -0,0 +1,88 @@
+"""tools/query_cache.py — in-process result caches for the retrieval stages.
+
+Three bounded LRUs, filled by live traffic and by the startup warm-up from
+the query log (``tools/query_log.py``):
+
+* :data:`EMBED` — ``(model, query) → float32 vector``; independent of the
+  index version, so it survives a hot swap.
+* :data:`RETRIEVE` — ``(index version, query) → (BM25 IDs, FAISS IDs)``;
+  entries of the old version are dropped when a new one is swapped in.
+  No FAISS IDs: BM25 answered alone (the lexicon shortcut in ``chef_agent``).
+* :data:`RERANK` — ``(model, query, candidates) → order``; candidates are
+  identified by the chunk store's content key plus the chunk IDs, so a new
+  version with other passages simply never matches the old entries.
+
+Only real upstream answers are stored: a degraded stage (BM25-only
+retrieval, fused order instead of a rerank) is retried on the next request.
+Sizes come from ``EMBED_CACHE_SIZE`` / ``RETRIEVE_CACHE_SIZE`` /
+``RERANK_CACHE_SIZE`` (entries, ``0`` disables the cache).  Values are
+shared between requests — treat them as read-only.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from tools import tracing
+
+__all__ = ["LRUCache", "EMBED", "RETRIEVE", "RERANK"]
+
+CACHE_ENTRIES = tracing.register(tracing.Gauge(
+    "chef_query_cache_entries", "Entries held by the retrieval result caches.", ("cache",)))
+
+
+class LRUCache:
+    """Thread-safe LRU of at most *capacity* entries; lookups are counted in
+    ``chef_cache_events_total{cache=name}``."""
+
+    def __init__(self, name: str, capacity: int):
+        self.name, self.capacity = name, capacity
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable):
+        """The cached value or ``None``."""
+        if self.capacity <= 0:
+            return None
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+        tracing.record_cache(self.name, value is not None)
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        if self.capacity <= 0 or value is None:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def discard(self, stale: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key satisfies *stale*; returns how many."""
+        with self._lock:
+            keys = [k for k in self._data if stale(k)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:       # not counted as a lookup
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+EMBED = LRUCache("embed", int(os.getenv("EMBED_CACHE_SIZE", "1024")))
+RETRIEVE = LRUCache("retrieve", int(os.getenv("RETRIEVE_CACHE_SIZE", "4096")))
+RERANK = LRUCache("rerank", int(os.getenv("RERANK_CACHE_SIZE", "4096")))
+
+CACHE_ENTRIES.set_function(lambda: {(c.name,): len(c) for c in (EMBED, RETRIEVE, RERANK)})
@@ -0,0 +1,253 @@
+"""tools/query_log.py — append-only query log, offline report, cache warm-up list.
+
+Every chat turn appends one JSON line to ``QUERY_LOG`` (default
+``logs/queries.jsonl``; ``off`` disables it)::
+
+    {"ts": 1760000000.1, "q": "鸡蛋 青椒", "verdict": "RAG", "retrieved": true,
+     "version": "20250601-0930", "ids": [812, 77, …], "ms": {"gatekeeper": 412.0, …}}
+
+``q`` is the :func:`normalize`-d query that retrieval ran on (and that the
+result caches are keyed by); ``ms`` are the request's stage latencies from
+its trace.  :func:`record` only appends to an in-memory batch — a daemon
+writer thread serialises the batch and appends it with one ``write()`` every
+``QUERY_LOG_FLUSH_SECONDS`` (or once ``QUERY_LOG_BATCH`` records are
+waiting), so a slow disk never delays a request.  When more than
+``QUERY_LOG_MAX_PENDING`` records are waiting, new ones are dropped and
+counted.  The file is opened ``O_APPEND``: every worker writes whole
+batches to the same file.  Past ``QUERY_LOG_MAX_BYTES`` it is rotated to
+``<name>.1`` (one generation is kept).
+
+The log feeds the offline report and :func:`top_queries`, which the
+``queries`` warm-up subsystem (``tools/startup.py``) replays through the
+retrieval caches (``tools/query_cache.py``) before a worker takes traffic::
+
+    python -m tools.query_log report              # repeat rate, cache hit-rate potential
+    python -m tools.query_log report --capacity 128 1024 --top 30 --json
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from tools import tracing
+
+__all__ = ["QueryLog", "normalize", "record", "read", "top_queries", "report", "LOG"]
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+QUERY_LOG     = os.getenv("QUERY_LOG", str(ROOT / "logs" / "queries.jsonl"))
+FLUSH_SECONDS = float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "2"))
+BATCH         = int(os.getenv("QUERY_LOG_BATCH", "256"))
+MAX_PENDING   = int(os.getenv("QUERY_LOG_MAX_PENDING", "10000"))
+MAX_BYTES     = int(os.getenv("QUERY_LOG_MAX_BYTES", str(64 << 20)))
+
+RECORDS = tracing.register(tracing.Counter(
+    "chef_query_log_records_total", "Query log records by outcome.", ("result",)))
+
+# stages whose time a retrieval cache hit saves
+RETRIEVAL_STAGES = ("bm25", "embed", "faiss", "lsa", "rerank")
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(query: str) -> str:
+    """Cache / log key of a query: NFKC (full-width → ASCII), case-folded,
+    whitespace collapsed."""
+    return _SPACE.sub(" ", unicodedata.normalize("NFKC", query).casefold()).strip()
+
+
+class QueryLog:
+    """Batched, non-blocking JSONL appender (one writer thread per process)."""
+
+    def __init__(self, path, flush_seconds: float = FLUSH_SECONDS, batch: int = BATCH,
+                 max_pending: int = MAX_PENDING, max_bytes: int = MAX_BYTES):
+        self.path = Path(path)
+        self.flush_seconds, self.batch = flush_seconds, batch
+        self.max_pending, self.max_bytes = max_pending, max_bytes
+        self._lock = threading.Lock()
+        self._pending: list[dict] = []
+        self._wake = threading.Event()
+        self._writer_pid = 0                  # writer thread is started lazily, per process
+        self._fd: int | None = None
+
+    def record(self, entry: dict) -> None:
+        """Queue *entry* for the next batch; never blocks on I/O."""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                RECORDS.inc("dropped")
+                return
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                self._fd = None               # a descriptor inherited over fork() is shared
+                threading.Thread(target=self._run, name="query-log", daemon=True).start()
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything queued so far (also called at exit)."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        data = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for e in batch).encode("utf-8")
+        try:
+            os.write(self._open(), data)
+        except OSError:
+            logger.exception("query log write to %s failed; %d records lost",
+                             self.path, len(batch))
+            RECORDS.inc("dropped", amount=len(batch))
+            self._fd = None
+            return
+        RECORDS.inc("written", amount=len(batch))
+
+    def _open(self) -> int:
+        fd = self._fd
+        if fd is not None:
+            try:
+                st = os.fstat(fd)
+                live = st.st_ino == os.stat(self.path).st_ino
+            except OSError:                   # removed under us
+                live = False
+            if live and st.st_size < self.max_bytes:
+                return fd
+            if live:                          # not live: another worker already rotated it
+                try:
+                    os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+                except OSError:
+                    pass
+            os.close(fd)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        return self._fd
+
+
+LOG: QueryLog | None = None if QUERY_LOG.lower() in ("", "0", "off", "none") \
+    else QueryLog(QUERY_LOG)
+if LOG is not None:
+    atexit.register(LOG.flush)
+
+
+def record(query: str, verdict: str | None, retrieved: bool, version: str | None,
+           ids=()) -> None:
+    """Log one chat turn; stage latencies come from the current trace."""
+    if LOG is None:
+        return
+    trace = tracing.current_trace()
+    ms = {k: round(v * 1e3, 1) for k, v in trace.stage_seconds().items()} if trace else {}
+    LOG.record({"ts": round(time.time(), 3), "q": normalize(query), "verdict": verdict,
+                "retrieved": retrieved, "version": version, "ids": [int(i) for i in ids],
+                "ms": ms})
+
+
+# ───────────────────────────── offline side ──────────────────────────────
+def read(path=None):
+    """Yield the records of *path* (default ``QUERY_LOG``), oldest first,
+    including the rotated generation; malformed lines are skipped."""
+    path = Path(path or QUERY_LOG)
+    for p in (path.with_name(path.name + ".1"), path):
+        if not p.exists():
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def top_queries(n: int, path=None) -> list[str]:
+    """The *n* most frequent retrieval queries (most recent first on ties)."""
+    counts: Counter[str] = Counter()
+    last: dict[str, int] = {}
+    for i, rec in enumerate(read(path)):
+        if rec.get("retrieved") and rec.get("q"):
+            counts[rec["q"]] += 1
+            last[rec["q"]] = i
+    return sorted(counts, key=lambda q: (-counts[q], -last[q]))[:n]
+
+
+def _lru_hits(keys: list, capacity: int) -> int:
+    seen: OrderedDict = OrderedDict()
+    hits = 0
+    for k in keys:
+        if k in seen:
+            hits += 1
+            seen.move_to_end(k)
+        else:
+            seen[k] = None
+            if len(seen) > capacity:
+                seen.popitem(last=False)
+    return hits
+
+
+def report(path=None, capacities=(256, 1024, 4096), top: int = 20) -> dict:
+    """Repeat rate and the hit rate a retrieval cache of each size would have
+    had on the logged traffic (keyed like ``query_cache.RETRIEVE``)."""
+    records = list(read(path))
+    queries = [r.get("q", "") for r in records]
+    retrieval = [r for r in records if r.get("retrieved")]
+    keys = [(r.get("version"), r.get("q")) for r in retrieval]
+    seen, saved_ms = set(), 0.0
+    for r, k in zip(retrieval, keys):
+        if k in seen:
+            saved_ms += sum(r.get("ms", {}).get(s, 0.0) for s in RETRIEVAL_STAGES)
+        seen.add(k)
+    n = len(keys) or 1
+    return {
+        "records": len(records),
+        "distinct": len(set(queries)),
+        "repeat_rate": round(1 - len(set(queries)) / len(records), 4) if records else 0.0,
+        "verdicts": dict(Counter(str(r.get("verdict")) for r in records)),
+        "retrievals": len(keys),
+        "hit_rate": {"unbounded": round(_lru_hits(keys, len(keys) + 1) / n, 4),
+                     **{str(c): round(_lru_hits(keys, c) / n, 4) for c in capacities}},
+        "saved_retrieval_seconds": round(saved_ms / 1e3, 2),
+        "top": Counter(q for _, q in keys).most_common(top),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Query log tools.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("report", help="repeat rate and cache hit-rate potential")
+    rp.add_argument("--path", default=QUERY_LOG)
+    rp.add_argument("--capacity", type=int, nargs="+", default=[256, 1024, 4096],
+                    help="retrieval cache sizes to simulate (LRU)")
+    rp.add_argument("--top", type=int, default=20, help="most frequent queries to list")
+    rp.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    rep = report(args.path, args.capacity, args.top)
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+        raise SystemExit(0)
+    print(f"{rep['records']} turns, {rep['distinct']} distinct queries, "
+          f"repeat rate {rep['repeat_rate']:.1%}")
+    print("verdicts: " + ", ".join(f"{k} {v}" for k, v in rep["verdicts"].items()))
+    print(f"{rep['retrievals']} retrievals; retrieval cache hit rate by size:")
+    for size, rate in rep["hit_rate"].items():
+        print(f"  {size:>10} {rate:7.1%}")
+    print(f"retrieval time a cache would have saved: {rep['saved_retrieval_seconds']:.1f} s")
+    print("most frequent retrieval queries:")
+    for q, c in rep["top"]:
+        print(f"  {c:6d}  {q}")
@@ -4,10 +4,143 @@
 
 from langchain_community.retrievers import BM25Retriever
 from langchain.schema import Document
-from .pdf_parse import DataProcess
+from pathlib import Path
+import numpy as np
 import jieba
+import json
+import os
+import shutil
 import pickle, gzip
 
+from .chunk_meta import ChunkMeta
+from .chunk_store import ChunkStore
+
+
+class CompactBM25(object):
+    """
+    Okapi BM25 as flat numpy arrays (CSR postings with pre-computed weights).
+
+    The langchain/rank_bm25 retriever keeps one Python dict per document; every
+    query touches all of them, which bumps refcounts and un-shares copy-on-write
+    pages in forked workers.  Here the whole index is five arrays that no query
+    writes to, so it can be preloaded before fork or ``np.load(mmap_mode="r")``
+    by every worker against the same page cache.  Scores are identical to
+    ``BM25Okapi.get_scores``.
+    """
+
+    FILES = ("terms", "indptr", "rows", "weights")
+
+    def __init__(self, terms, indptr, rows, weights, n_docs):
+        self.terms = terms          # sorted unicode array, term → column via searchsorted
+        self.indptr = indptr        # int64[n_terms + 1]
+        self.rows = rows            # int32[nnz]   document row of each posting
+        self.weights = weights      # float32[nnz] idf·tf·(k1+1)/(tf+k1·(1-b+b·dl/avgdl))
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_okapi(cls, okapi):
+        postings: dict[str, list[tuple[int, int]]] = {}
+        for row, freqs in enumerate(okapi.doc_freqs):
+            for term, tf in freqs.items():
+                postings.setdefault(term, []).append((row, tf))
+        terms = sorted(postings)
+        doc_len = np.asarray(okapi.doc_len, dtype=np.float64)
+        norm = okapi.k1 * (1 - okapi.b + okapi.b * doc_len / okapi.avgdl)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows, weights = [], []
+        for i, term in enumerate(terms):
+            r = np.fromiter((p[0] for p in postings[term]), dtype=np.int32)
+            tf = np.fromiter((p[1] for p in postings[term]), dtype=np.float64)
+            w = (okapi.idf.get(term) or 0) * tf * (okapi.k1 + 1) / (tf + norm[r])
+            rows.append(r)
+            weights.append(w.astype(np.float32))
+            indptr[i + 1] = indptr[i] + len(r)
+        return cls(np.array(terms) if terms else np.array([], dtype="<U1"), indptr,
+                   np.concatenate(rows) if rows else np.zeros(0, np.int32),
+                   np.concatenate(weights) if weights else np.zeros(0, np.float32),
+                   okapi.corpus_size)
+
+    def _column(self, term: str) -> int:
+        i = int(np.searchsorted(self.terms, term))
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def scores(self, tokens) -> np.ndarray:
+        score = np.zeros(self.n_docs, dtype=np.float32)
+        for t in tokens:                        # duplicates count, as in rank_bm25
+            c = self._column(t)
+            if c >= 0:
+                s, e = self.indptr[c], self.indptr[c + 1]
+                np.add.at(score, self.rows[s:e], self.weights[s:e])
+        return score
+
+    def topk(self, tokens, k: int, return_scores: bool = False, allow=None):
+        """Row indices of the *k* best documents, best first (and their
+        scores with *return_scores*).  With *allow* (``bool[n_docs]``) only
+        those rows are ranked."""
+        score = self.scores(tokens)
+        cand = np.flatnonzero(allow) if allow is not None else None
+        k = min(k, self.n_docs if cand is None else len(cand))
+        if k <= 0:
+            rows = np.zeros(0, dtype=np.int64)
+            return (rows, np.zeros(0, np.float32)) if return_scores else rows
+        sub = score if cand is None else score[cand]
+        part = np.argpartition(-sub, k - 1)[:k]
+        part = part[np.argsort(-sub[part], kind="stable")]
+        rows = part if cand is None else cand[part]
+        return (rows, score[rows]) if return_scores else rows
+
+    def scores_batch(self, token_lists) -> np.ndarray:
+        """``float32[len(token_lists), n_docs]`` — all queries in one ``bincount``."""
+        n_q = len(token_lists)
+        idx, w = [], []
+        for q, tokens in enumerate(token_lists):
+            for t in tokens:
+                c = self._column(t)
+                if c >= 0:
+                    s, e = self.indptr[c], self.indptr[c + 1]
+                    idx.append(self.rows[s:e].astype(np.int64) + q * self.n_docs)
+                    w.append(self.weights[s:e])
+        if not idx:
+            return np.zeros((n_q, self.n_docs), dtype=np.float32)
+        flat = np.bincount(np.concatenate(idx), weights=np.concatenate(w),
+                           minlength=n_q * self.n_docs)
+        return flat.astype(np.float32).reshape(n_q, self.n_docs)
+
+    def topk_batch(self, token_lists, k: int, return_scores: bool = False, allow=None):
+        """``int[len(token_lists), k]`` row indices, best first per query
+        (and their scores with *return_scores*); *allow* as in :meth:`topk`,
+        shared by every query."""
+        score = self.scores_batch(token_lists)
+        cand = np.flatnonzero(allow) if allow is not None else None
+        if cand is not None:
+            score = score[:, cand]
+        k = min(k, score.shape[1])
+        if k <= 0 or not len(score):
+            rows = np.zeros((len(score), 0), dtype=np.int64)
+            return (rows, np.zeros(rows.shape, np.float32)) if return_scores else rows
+        part = np.argpartition(-score, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(score, part, axis=1), axis=1, kind="stable")
+        cols = np.take_along_axis(part, order, axis=1)
+        best = np.take_along_axis(score, cols, axis=1)
+        rows = cols if cand is None else cand[cols]
+        return (rows, best) if return_scores else rows
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.FILES:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        (directory / "meta.json").write_text(json.dumps({"n_docs": int(self.n_docs)}))
+
+    @classmethod
+    def load(cls, directory, mmap: bool = True):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        arrays = [np.load(directory / f"{name}.npy", mmap_mode=mode) for name in cls.FILES]
+        meta = json.loads((directory / "meta.json").read_text())
+        return cls(*arrays, n_docs=meta["n_docs"])
+
+
 class BM25(object):
 
     def __init__(self, documents):
@@ -21,37 +154,111 @@ class BM25(object):
             tokens = " ".join(jieba.cut_for_search(line))
             docs.append(Document(page_content=tokens, metadata={"id": idx}))
             words = line.split("\t")
-            full_docs.append(Document(page_content=words[0], metadata={"id": idx}))
+            full_docs.append(words[0])
         self.documents = docs
-        self.full_documents = full_docs
+        self.chunks = ChunkStore.from_texts(full_docs)
         self.retriever = self._init_bm25()
 
     def _init_bm25(self):
         return BM25Retriever.from_documents(self.documents)
 
+    def _allow(self, where):
+        return None if where is None else self.chunks.select(where)
+
+    def GetBM25TopKIds(self, query, topk, where=None) -> np.ndarray:
+        """Chunk IDs of the *topk* best passages, best first; *where* (a
+        ``chunk_meta`` filter expression or ``bool[n]`` mask) restricts the
+        ranking to matching passages."""
+        tokens = " ".join(jieba.cut_for_search(query)).split()
+        # posting rows are chunk IDs (both skip the same short lines)
+        return self.index.topk(tokens, topk, allow=self._allow(where))
+
+    def GetBM25TopKIdsBatch(self, queries, topk, where=None) -> np.ndarray:
+        """:meth:`GetBM25TopKIds` for many queries, scored in one vectorized pass."""
+        tokens = [" ".join(jieba.cut_for_search(q)).split() for q in queries]
+        return self.index.topk_batch(tokens, topk, allow=self._allow(where))
+
     def GetBM25TopK(self, query, topk):
-        self.retriever.k = topk
-        query = " ".join(jieba.cut_for_search(query))
-        ans_docs = self.retriever.invoke(query)
-        ans = []
-        for line in ans_docs:
-            ans.append(self.full_documents[line.metadata["id"]])
-        return ans
+        return [self._document(r) for r in self.GetBM25TopKIds(query, topk)]
+
+    def GetBM25TopKBatch(self, queries, topk):
+        return [[self._document(r) for r in rows]
+                for rows in self.GetBM25TopKIdsBatch(queries, topk)]
+
+    def _document(self, row) -> Document:
+        return Document(page_content=self.chunks.text(row), metadata={"id": int(row)})
+
+    @property
+    def full_documents(self) -> list[Document]:
+        """Every passage as a ``Document`` (materialized on each access —
+        request code works on chunk IDs and :attr:`chunks`)."""
+        return [self._document(r) for r in range(len(self.chunks))]
+
+    @property
+    def index(self) -> CompactBM25:
+        if getattr(self, "_index", None) is None:
+            self._index = CompactBM25.from_okapi(self.retriever.vectorizer)
+        return self._index
+
+    @staticmethod
+    def compact_dir(path) -> Path:
+        """``indexes/bm25.pkl`` → ``indexes/bm25_csr/``"""
+        path = Path(path)
+        return path.with_name(path.stem + "_csr")
+
+    @staticmethod
+    def chunk_dir(path) -> Path:
+        """``indexes/bm25.pkl`` → ``indexes/chunks/`` (the shared passage table)"""
+        return Path(path).with_name("chunks")
 
     def save(self, path):
         with gzip.open(path, "wb") as f:
             pickle.dump(self.retriever, f)
             pickle.dump(self.full_documents, f)
+        self.save_compact(self.compact_dir(path))
+
+    def save_compact(self, directory):
+        """Write the flat layout (and the chunk store beside it); staged then
+        renamed so racing workers are safe."""
+        directory = Path(directory)
+        staging = directory.with_name(f"{directory.name}.tmp{os.getpid()}")
+        self.index.save(staging)
+        try:
+            os.replace(staging, directory)
+        except OSError:                       # another worker won the race
+            shutil.rmtree(staging, ignore_errors=True)
+        chunks = directory.with_name("chunks")
+        if not ChunkStore.exists(chunks):
+            self.chunks.save(chunks)
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, mmap: bool = True):
+        """
+        Prefer the flat ``*_csr/`` layout and ``chunks/`` next to *path*
+        (memory-mapped, shared by all workers); fall back to the pickle and
+        build the arrays from it.
+        """
+        obj = object.__new__(cls)
+        obj.documents = None
+        compact, chunks = cls.compact_dir(path), cls.chunk_dir(path)
+        if (compact / "meta.json").exists():
+            if not ChunkStore.exists(chunks):
+                # one-off migration: earlier flat layouts kept the texts as JSON
+                texts = json.loads((compact / "texts.json").read_text(encoding="utf-8"))
+                ChunkStore.from_texts(texts).save(chunks)
+            obj.retriever = None
+            obj._index = CompactBM25.load(compact, mmap=mmap)
+            obj.chunks = ChunkStore.load(chunks, mmap=mmap)
+            if not ChunkMeta.exists(chunks):
+                obj.chunks.meta.save(chunks)  # one-off migration: tables without metadata
+            return obj
         with gzip.open(path, "rb") as f:
             retriever = pickle.load(f)
             full_docs = pickle.load(f)
-        obj = object.__new__(cls)
         obj.retriever = retriever
-        obj.full_documents = full_docs
-        obj.documents = None      
+        obj.chunks = ChunkStore.from_texts(d.page_content for d in full_docs)
+        obj._index = CompactBM25.from_okapi(retriever.vectorizer)
+        obj.retriever.vectorizer = None       # per-doc dicts no longer needed
         return obj
 
 if __name__ == "__main__":
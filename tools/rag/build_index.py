@@ -1,37 +1,23 @@
 #!/usr/bin/env python
 """
 One-shot script: build local BM25 + FAISS indexes from the Chinese-cuisine PDF.
-Run **once**, or whenever the PDF changes.
+Run **once**, or whenever the PDF changes: each build lands in a new versioned
+directory under ``indexes/`` and becomes ``current`` in ``indexes/manifest.json``
+(running servers pick it up via ``/api/admin/reload`` or ``INDEX_WATCH_SECONDS``).
 """
 
 from pathlib import Path
-from langchain.schema import Document
-from tools.rag.pdf_parse import DataProcess
-from tools.rag.bm25_retriever import BM25
-from tools.rag.faiss_retriever import FaissRetriever
+from tools.rag import index_store
 
 ROOT = Path(__file__).resolve().parents[2]
 PDF_PATH = ROOT / "data" / "how_to_cook.pdf"
 OUT = Path("./indexes")          # folder to keep artifacts
 OUT.mkdir(parents=True, exist_ok=True)
 
-bm25_path = OUT / "bm25.pkl"
-faiss_path = OUT / "faiss"
-
 # ---- check if index exists ------------------------------------------------
-if bm25_path.exists() and faiss_path.exists():
-    print("✅  Indexes already exist, skipping rebuild.")
+if not index_store.needs_build(OUT):
+    print("✅  Indexes already exist, skipping rebuild "
+          "(python -m tools.rag.index_store build forces a new version).")
 else:
-    dp = DataProcess(PDF_PATH)
-    dp.parse(max_seq=512)
-    texts = dp.data
-
-    # ---- BM25 -------------------------------------------------------
-    bm25 = BM25(texts)
-    bm25.save(bm25_path)
-
-    # ---- FAISS ------------------------------------------------------
-    faiss = FaissRetriever(texts, model_name="text-embedding-3-large", chunk_size=128)
-    faiss.save(faiss_path)
-
-    print("✅  Indexes built and saved to", OUT.resolve())
+    version = index_store.build(OUT, PDF_PATH, "text-embedding-3-large")
+    print("✅  Indexes built and saved to", (OUT / version).resolve())
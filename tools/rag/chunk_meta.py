@@ -0,0 +1,379 @@
+"""
+Chunk-level metadata as bitmaps, and the filter expressions retrievers
+apply before top-k selection.
+
+Extracted once per version (``ChunkMeta.from_texts``, passages in document
+order) and stored beside the passage table in ``chunks/``::
+
+    labels.json   ["category:素菜", "dish:酸辣土豆丝", "method:stir_fried", "protein:pork",
+                   "vegetarian", …]
+    bitmaps.npy   uint8[n_labels, ceil(n / 8)] — bit i (little-endian) set ⇔ chunk i has the label
+    minutes.npy   int16[n] — estimated cooking minutes of the chunk's dish (-1 unknown)
+
+Labels come from the book's structure: section footers (``3.1.1 素菜- 126/782``)
+give the category, ``XXX的做法`` headers split a passage into per-dish
+segments (text before the first header continues the previous passage's
+dish — passages are overlapping windows that often span two or three
+recipes).  A chunk is labelled with every dish it has a segment of, and
+with each of those dishes' method (from the name), proteins (from the
+``必备原料和工具`` list, else the whole segment) and time (durations summed
+over the longest segment of the dish — an estimate).  ``vegetarian`` means
+none of the chunk's dishes lists meat or seafood.
+
+Filter expressions::
+
+    vegetarian AND time<=20
+    method:steamed OR method:braised
+    NOT protein:pork AND category:荤菜
+    (protein:chicken OR protein:duck) AND NOT method:fried
+
+Atoms are ``field:value`` labels, ``vegetarian``, ``recipe`` (chunks with
+a dish — not the front matter or the index) and ``time<=N`` / ``time<N``;
+``AND`` / ``OR`` / ``NOT`` (or ``&`` ``|`` ``!``) and parentheses combine
+them.  An unknown label matches nothing.  A time atom matches only chunks
+whose time is known: a stated limit is not met by a recipe that gives no
+durations (-1 in ``minutes.npy``, about one recipe passage in eight of the
+shipped book), so ``NOT time<=N`` includes those.  A filter that leaves no
+passage at all is dropped by the caller (``chef_agent._filter``).
+:func:`constraints` turns the constraints users state in a question ("no
+pork", "under 20 minutes", "steamed", "素食" …) into such an expression.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from tools import tracing
+
+__all__ = ["ChunkMeta", "extract", "parse", "constraints", "FilterError", "FILTERS"]
+
+FILES = ("labels.json", "bitmaps.npy", "minutes.npy")
+
+FILTERS = tracing.register(tracing.Counter(
+    "chef_retrieval_filters_total", "Retrievals with stated constraints, by whether a "
+    "metadata filter was applied or matched no passage.", ("result",)))
+
+_FOOTER = re.compile(r"3\.\d+\.\d+ ([一-鿿]+)- \d+/\d+")
+_DISH = re.compile(r"(?:^|(?<=[。•\s]))((?:(?!的做法)[一-鿿A-Za-z]){2,14})的做法")
+_NOT_DISH = re.compile(r"这|那|一种|一道|笔者|的")          # prose that happens to say 的做法
+_INGREDIENTS = re.compile(r"必备原料和工具(.*?)(?:计算|操作|$)", re.S)
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-\s*(\d+(?:\.\d+)?)\s*)?(分钟|小时|min|h\b)")
+
+# dish-name keyword → method (first match wins: 清蒸鱼 is steamed, not boiled)
+METHODS = (
+    ("steamed", "蒸"), ("cold", "凉拌|拌"), ("fried", "炸"), ("pan_fried", "煎|锅贴"),
+    ("roasted", "烤|焗"), ("braised", "炖|焖|红烧|卤|烧|煨"), ("stir_fried", "炒|爆|溜"),
+    ("soup", "汤|粥|羹"), ("boiled", "煮|汆|涮|白灼"),
+)
+# ingredient keyword → protein (鸡蛋 / 鸡精 are not chicken, 蚝油 is not an oyster …)
+PROTEINS = {
+    "pork": r"猪|排骨|五花|里脊|腊肉|腊肠|香肠|培根|火腿|肘子|瘦肉|(?<![牛羊鸡鸭鱼蟹兔蛙果])肉(?:末|丝|片|馅|块)",
+    "beef": r"牛(?!奶|油|蛙|至|角)",
+    "lamb": r"羊(?!奶)",
+    "chicken": r"鸡(?!蛋|精)",
+    "duck": r"鸭(?!蛋)",
+    "fish": r"(?<!鱿|墨)鱼(?!露|香|丸)|鳕|鲈|鲫",
+    "shrimp": r"虾",
+    "crab": r"蟹",
+    "shellfish": r"扇贝|贝类|蛤|蛏|螺(?!丝)|(?<!蚝)蚝(?!油)|鱿鱼|墨鱼|海参|海鲜",
+    "other_meat": r"兔|蛙|鸽|鹅|驴",
+    "egg": r"蛋",
+    "tofu": r"豆腐",
+}
+MEAT = ("pork", "beef", "lamb", "chicken", "duck", "fish", "shrimp", "crab", "shellfish",
+        "other_meat")
+_PROTEIN_RE = {p: re.compile(rx) for p, rx in PROTEINS.items()}
+_METHOD_RE = [(m, re.compile(rx)) for m, rx in METHODS]
+
+
+class FilterError(ValueError):
+    """A filter expression that does not parse."""
+
+
+def _minutes(text: str) -> float:
+    total = 0.0
+    for lo, hi, unit in _DURATION.findall(text):
+        v = float(hi or lo)
+        total += v * 60 if unit in ("小时", "h") else v
+    return total
+
+
+def _segments(text: str, carried: str | None, chapters: set[str]) -> list[tuple[str, str]]:
+    """``(dish, text)`` pieces of a passage, split at its dish headers."""
+    out, pos, dish = [], 0, carried
+    for m in _DISH.finditer(text):
+        name = m.group(1)
+        if _NOT_DISH.search(name):
+            continue
+        for c in chapters:                    # a chapter's first dish follows its title
+            if name.startswith(c) and len(name) - len(c) >= 2:
+                name = name[len(c):]
+                break
+        if dish is not None and m.start() > pos:
+            out.append((dish, text[pos:m.start()]))
+        dish, pos = name, m.start()
+    if dish is not None:
+        out.append((dish, text[pos:]))
+    return out
+
+
+def extract(texts: Iterable[str]) -> tuple[list[set[str]], list[int]]:
+    """Labels and estimated minutes per passage (*texts* in document order)."""
+    texts = list(texts)
+    footers = [_FOOTER.findall(t) for t in texts]
+    chapters = {c for cats in footers for c in cats}
+    segments, categories = [], []
+    dish, cat = None, None
+    for t, cats in zip(texts, footers):
+        segs = _segments(t, dish, chapters)
+        segments.append(segs)
+        categories.append(set(cats) or ({cat} if cat else set()))
+        if segs:
+            dish = segs[-1][0]
+        if cats:
+            cat = cats[-1]
+    # per dish, over all of its segments (windows overlap → longest, not sum)
+    proteins: dict[str, set[str]] = {}
+    minutes: dict[str, tuple[int, float]] = {}
+    for segs in segments:
+        for d, seg in segs:
+            m = _INGREDIENTS.search(seg)
+            found = {p for p, rx in _PROTEIN_RE.items() if rx.search(m.group(1) if m else seg)}
+            if m or d not in proteins:        # an ingredient list beats prose
+                proteins[d] = (proteins.get(d, set()) | found) if m else found
+            if len(seg) > minutes.get(d, (0, 0.0))[0]:
+                minutes[d] = (len(seg), _minutes(seg))
+    labels, mins = [], []
+    for segs, cats in zip(segments, categories):
+        dishes = list(dict.fromkeys(d for d, _ in segs))
+        lab = {f"category:{c}" for c in cats}
+        for d in dishes:
+            lab.add(f"dish:{d}")
+            for m, rx in _METHOD_RE:
+                if rx.search(d):
+                    lab.add(f"method:{m}")
+                    break
+            lab.update(f"protein:{p}" for p in proteins[d])
+        if dishes and not any(f"protein:{p}" in lab for p in MEAT):
+            lab.add("vegetarian")
+        labels.append(lab)
+        known = [minutes[d][1] for d in dishes if minutes[d][1] > 0]
+        mins.append(int(round(max(known))) if known else -1)
+    return labels, mins
+
+
+# ───────────────────────────── expressions ───────────────────────────────
+_TOKEN = re.compile(r"\s*(\(|\)|&|\||!|time\s*<=?\s*\d+|[^\s()&|!]+)", re.I)
+
+
+def _tokens(expr: str) -> list[str]:
+    pos, out = 0, []
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m:
+            raise FilterError(f"cannot parse filter at {expr[pos:]!r}")
+        out.append(m.group(1))
+        pos = m.end()
+    return out
+
+
+def parse(expr: str):
+    """Expression → nested tuples: ``("and", a, b)``, ``("or", a, b)``,
+    ``("not", a)``, ``("label", "method:steamed")``, ``("time", op, n)``,
+    ``("recipe",)``."""
+    toks = _tokens(expr)
+    pos = 0
+
+    def peek():
+        return toks[pos].upper() if pos < len(toks) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return toks[pos - 1]
+
+    def atom():
+        t = peek()
+        if t is None:
+            raise FilterError(f"filter ends early: {expr!r}")
+        if t in ("NOT", "!"):
+            take()
+            return ("not", atom())
+        if t == "(":
+            take()
+            node = disjunction()
+            if peek() != ")":
+                raise FilterError(f"missing ')' in {expr!r}")
+            take()
+            return node
+        tok = take()
+        if m := re.fullmatch(r"time\s*(<=?)\s*(\d+)", tok, re.I):
+            return ("time", m.group(1), int(m.group(2)))
+        if ":" not in tok and tok.lower() not in ("vegetarian", "recipe"):
+            raise FilterError(f"unknown filter term {tok!r} "
+                              "(field:value, vegetarian, recipe, time<=N)")
+        if tok.lower() == "recipe":
+            return ("recipe",)
+        field_, _, value = tok.partition(":")
+        return ("label", f"{field_.lower()}:{value}" if value else field_.lower())
+
+    def conjunction():
+        node = atom()
+        while peek() in ("AND", "&"):
+            take()
+            node = ("and", node, atom())
+        return node
+
+    def disjunction():
+        node = conjunction()
+        while peek() in ("OR", "|"):
+            take()
+            node = ("or", node, conjunction())
+        return node
+
+    node = disjunction()
+    if pos != len(toks):
+        raise FilterError(f"unexpected {toks[pos]!r} in {expr!r}")
+    return node
+
+
+# ───────────────────────────── bitmaps ───────────────────────────────────
+class ChunkMeta:
+    """Label bitmaps and minutes for one passage table."""
+
+    def __init__(self, labels: Sequence[str], bitmaps: np.ndarray, minutes: np.ndarray):
+        self.labels = list(labels)
+        self.bitmaps = bitmaps                    # uint8[n_labels, ceil(n / 8)], little bit order
+        self.minutes = minutes                    # int16[n]
+        self._row = {label: i for i, label in enumerate(self.labels)}
+        self._lock = threading.Lock()
+        self._masks: OrderedDict[str, np.ndarray] = OrderedDict()   # expression → bool[n]
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "ChunkMeta":
+        labels, minutes = extract(texts)
+        names = sorted(set().union(*labels)) if labels else []
+        row = {name: i for i, name in enumerate(names)}
+        dense = np.zeros((len(names), len(labels)), dtype=bool)
+        for i, lab in enumerate(labels):
+            dense[[row[x] for x in lab], i] = True
+        return cls(names, np.packbits(dense, axis=1, bitorder="little"),
+                   np.asarray(minutes, dtype=np.int16))
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+    def _bits(self, node) -> np.ndarray:
+        n = len(self)
+        kind = node[0]
+        if kind == "label":
+            i = self._row.get(node[1])
+            return (np.unpackbits(self.bitmaps[i], count=n, bitorder="little").view(bool)
+                    if i is not None else np.zeros(n, dtype=bool))
+        if kind == "recipe":
+            rows = [i for i, label in enumerate(self.labels) if label.startswith("dish:")]
+            if not rows:
+                return np.zeros(n, dtype=bool)
+            return np.unpackbits(np.bitwise_or.reduce(self.bitmaps[rows], axis=0), count=n,
+                                 bitorder="little").view(bool)
+        if kind == "time":
+            limit = node[2] if node[1] == "<=" else node[2] - 1
+            return (self.minutes >= 0) & (self.minutes <= limit)     # unknown never matches
+        if kind == "not":
+            return ~self._bits(node[1])
+        a, b = self._bits(node[1]), self._bits(node[2])
+        return a & b if kind == "and" else a | b
+
+    def select(self, where) -> np.ndarray:
+        """``bool[n]`` of the chunks matching *where* (an expression, or a
+        mask that is returned as is)."""
+        if not isinstance(where, str):
+            return np.asarray(where, dtype=bool)
+        with self._lock:
+            if (mask := self._masks.get(where)) is not None:
+                self._masks.move_to_end(where)
+                return mask
+        mask = self._bits(parse(where))
+        mask.flags.writeable = False               # shared between requests
+        with self._lock:
+            self._masks[where] = mask
+            while len(self._masks) > 256:
+                self._masks.popitem(last=False)
+        return mask
+
+    def counts(self) -> dict[str, int]:
+        """Chunks per label."""
+        return dict(zip(self.labels, np.unpackbits(self.bitmaps, axis=1).sum(axis=1).tolist()))
+
+    @staticmethod
+    def exists(directory) -> bool:
+        return all((Path(directory) / name).exists() for name in FILES)
+
+    def save(self, directory) -> None:
+        """Write the three files into the chunk directory (each replaced
+        atomically; ``labels.json`` last, so its presence means complete)."""
+        directory = Path(directory)
+        tmp = f".tmp{os.getpid()}"
+        for name, arr in (("bitmaps", self.bitmaps), ("minutes", self.minutes)):
+            np.save(directory / f"{name}{tmp}.npy", arr)
+            os.replace(directory / f"{name}{tmp}.npy", directory / f"{name}.npy")
+        (directory / f"labels.json{tmp}").write_text(
+            json.dumps(self.labels, ensure_ascii=False), encoding="utf-8")
+        os.replace(directory / f"labels.json{tmp}", directory / "labels.json")
+
+    @classmethod
+    def load(cls, directory, mmap: bool = True) -> "ChunkMeta":
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        return cls(json.loads((directory / "labels.json").read_text(encoding="utf-8")),
+                   np.load(directory / "bitmaps.npy", mmap_mode=mode),
+                   np.load(directory / "minutes.npy", mmap_mode=mode))
+
+
+# ───────────────────────────── from questions ────────────────────────────
+# English names; the Chinese ones are the labelling keywords (PROTEINS), so
+# "不要鸡蛋" excludes eggs, not chicken, and "no fish sauce" / "不加蚝油" no protein
+_PROTEIN_NAMES = {
+    "pork": "pork", "beef": "beef", "lamb": "lamb|mutton", "chicken": "chicken",
+    "duck": "duck", "fish": r"fish(?!\s*sauce)", "shrimp": "shrimp|prawns?", "crab": "crab",
+    "shellfish": r"shellfish|seafood|oysters?(?!\s*sauce)", "egg": "eggs?|鸡蛋|鸭蛋",
+    "tofu": "tofu",
+}
+_NEGATION = r"(?:no|without|not|don'?t (?:eat|want|like)|不要|不吃|不含|不加|没有|忌)\s*"
+_NEG_RE = {p: re.compile(_NEGATION + f"(?:{rx}|{PROTEINS[p]})", re.I)
+           for p, rx in _PROTEIN_NAMES.items()}
+_VEGETARIAN = re.compile(r"vegetarian|veggie|meat[- ]free|素食|吃素|全素", re.I)
+_TIME = re.compile(r"(?:under|within|less than|in|<)\s*(\d+)\s*(?:min|minutes?)|(\d+)\s*分钟(?:以内|之内|内)",
+                   re.I)
+_METHOD_WORDS = {
+    "steamed": r"steamed|清蒸|蒸菜", "stir_fried": r"stir[- ]?fr(?:y|ied)|炒菜|小炒",
+    "braised": r"braised|stewed|红烧|炖菜", "fried": r"deep[- ]fried|油炸|炸的",
+    "cold": r"cold dish(?:es)?|凉拌|凉菜", "soup": r"\bsoups?\b|汤品|煲汤",
+    "roasted": r"roast(?:ed)?|baked|烤",
+}
+_METHOD_WORD_RE = {m: re.compile(rx, re.I) for m, rx in _METHOD_WORDS.items()}
+
+
+def constraints(question: str) -> str | None:
+    """Filter expression for the dietary / time / method constraints stated
+    in *question*, or ``None``.  Ingredients the user *has* are not
+    constraints — only exclusions, "vegetarian", a time limit and an
+    explicit cooking method are."""
+    parts = []
+    if _VEGETARIAN.search(question):
+        parts.append("vegetarian")
+    parts += [f"NOT protein:{p}" for p, rx in _NEG_RE.items() if rx.search(question)]
+    if m := _TIME.search(question):
+        parts.append(f"time<={m.group(1) or m.group(2)}")
+    methods = [f"method:{m}" for m, rx in _METHOD_WORD_RE.items() if rx.search(question)]
+    if methods:
+        parts.append("(" + " OR ".join(methods) + ")" if len(methods) > 1 else methods[0])
+    return " AND ".join(parts) or None
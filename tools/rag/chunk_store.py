@@ -0,0 +1,137 @@
+"""
+Passage texts by contiguous integer ID — the one copy of the corpus that
+BM25, FAISS and the reranker share.
+
+Layout (``indexes/<version>/chunks/``)::
+
+    texts.bin     all passages, UTF-8, back to back
+    offsets.npy   int64[n + 1] — passage i is texts.bin[offsets[i]:offsets[i + 1]]
+    hashes.npy    uint64[n]    — blake2b-64 of each passage (text → ID lookups)
+    labels.json, bitmaps.npy, minutes.npy — per-passage metadata (``chunk_meta``)
+
+Retrievers return IDs (``int`` rows of this table); text is decoded only
+for the passages a request actually shows or sends upstream.  All three
+files are memory-mapped, so every worker reads the same page cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from .chunk_meta import ChunkMeta
+
+__all__ = ["ChunkStore"]
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class ChunkStore:
+    """Read-only passage table: one text blob plus an offsets array."""
+
+    FILES = ("texts.bin", "offsets.npy", "hashes.npy")
+
+    def __init__(self, blob, offsets: np.ndarray, hashes: np.ndarray,
+                 meta: ChunkMeta | None = None):
+        self.blob = blob              # uint8 array (or memmap) of UTF-8 text
+        self.offsets = offsets        # int64[n + 1]
+        self.hashes = hashes          # uint64[n]
+        self._view = memoryview(blob).cast("B") if len(blob) else memoryview(b"")
+        self._sorted = None           # (order, hashes[order]) — built on first find()
+        self._meta = meta             # extracted on first use when not stored
+        # identifies the contents (not the object): cache / single-flight keys
+        self.key = hashlib.blake2b(np.ascontiguousarray(hashes).tobytes(),
+                                   digest_size=8).hexdigest()
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "ChunkStore":
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        hashes = np.fromiter((_hash(b) for b in encoded), dtype=np.uint64, count=len(encoded))
+        return cls(blob, offsets, hashes)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def text(self, i: int) -> str:
+        return str(self._view[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def texts(self, ids: Sequence[int]) -> list[str]:
+        ids = np.asarray(ids, dtype=np.int64)
+        view = self._view
+        return [str(view[s:e], "utf-8")
+                for s, e in zip(self.offsets[ids].tolist(), self.offsets[ids + 1].tolist())]
+
+    def __iter__(self):
+        return (self.text(i) for i in range(len(self)))
+
+    def find(self, text: str) -> int | None:
+        """ID of the passage equal to *text*, or ``None``."""
+        if self._sorted is None:
+            order = np.argsort(self.hashes, kind="stable")
+            self._sorted = order, self.hashes[order]
+        order, hashes = self._sorted
+        h = np.uint64(_hash(text.encode("utf-8")))
+        i = int(np.searchsorted(hashes, h))
+        while i < len(hashes) and hashes[i] == h:      # equal hashes: compare the text
+            if self.text(int(order[i])) == text:
+                return int(order[i])
+            i += 1
+        return None
+
+    @property
+    def meta(self) -> ChunkMeta:
+        """Metadata bitmaps of the passages (for filtered retrieval)."""
+        if self._meta is None:
+            self._meta = ChunkMeta.from_texts(self)
+        return self._meta
+
+    def select(self, where) -> np.ndarray:
+        """``bool[n]`` — passages matching a ``chunk_meta`` filter expression."""
+        return self.meta.select(where)
+
+    @property
+    def nbytes(self) -> int:
+        return self.blob.nbytes + self.offsets.nbytes + self.hashes.nbytes
+
+    def save(self, directory) -> None:
+        """Write the three files; staged then renamed so racing workers are safe."""
+        directory = Path(directory)
+        staging = directory.with_name(f"{directory.name}.tmp{os.getpid()}")
+        staging.mkdir(parents=True, exist_ok=True)
+        (staging / "texts.bin").write_bytes(np.asarray(self.blob).tobytes())
+        np.save(staging / "offsets.npy", self.offsets)
+        np.save(staging / "hashes.npy", self.hashes)
+        self.meta.save(staging)
+        try:
+            os.replace(staging, directory)
+        except OSError:                       # another worker won the race
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def exists(directory) -> bool:
+        return all((Path(directory) / name).exists() for name in ChunkStore.FILES)
+
+    @classmethod
+    def load(cls, directory, mmap: bool = True) -> "ChunkStore":
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        path = directory / "texts.bin"
+        if not mmap:
+            blob = np.fromfile(path, dtype=np.uint8)
+        elif path.stat().st_size:
+            blob = np.memmap(path, dtype=np.uint8, mode="r")
+        else:                                 # mmap of an empty file is an error
+            blob = np.zeros(0, dtype=np.uint8)
+        return cls(blob,
+                   np.load(directory / "offsets.npy", mmap_mode=mode),
+                   np.load(directory / "hashes.npy", mmap_mode=mode),
+                   ChunkMeta.load(directory, mmap) if ChunkMeta.exists(directory) else None)
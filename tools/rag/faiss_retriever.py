@@ -1,10 +1,20 @@
 """
 FAISS wrapper that builds / loads a vector index using **remote**
 OpenAI embeddings (multilingual, handles Chinese well).
+
+On disk (``indexes/<version>/faiss/``)::
+
+    index.faiss   raw FAISS index (``faiss.write_index``), memory-mapped on load
+    ids.npy       int64[ntotal] — vector row → chunk ID (``tools/rag/chunk_store.py``)
+    meta.json     {"normalize_L2": …, "dim": …, "rows": …}
+
+Directories written by langchain's ``save_local`` (``index.faiss`` +
+pickled ``index.pkl`` docstore) still load; the sidecar is written next to
+them on the first load, and from then on the pickle is never read.
 """
 
+import json
 import os
-import torch
 from pathlib import Path
 from typing import List, Sequence
 import faiss
@@ -15,8 +25,14 @@ from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 
+from tools.clients import httpx_sync_client
+from tools.rag.chunk_store import ChunkStore
+
 __all__ = ["FaissRetriever"]
 
+# flat indexes are only mapped (not copied) with the IndexFlatCodes flag
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
 
 import asyncio
 
@@ -101,35 +117,150 @@ class FaissRetriever:
             for i, t in enumerate(texts) if len(t.strip()) > 4
         ]
         self.vector_store = FAISS.from_documents(docs, self.embeddings)
-        torch.cuda.empty_cache()
+        self.index, self.normalize_L2 = self.vector_store.index, self.vector_store._normalize_L2
+        self.chunks = self.chunk_ids = None
 
-    def save(self, path: Path | str) -> None:
+    def save(self, path: Path | str, chunks: ChunkStore | None = None) -> None:
         """
-        Persist index to *directory* ``path``.  Creates parent dirs.
+        Persist index to *directory* ``path``.  Creates parent dirs.  Rows are
+        mapped to IDs in *chunks* (default: a bound retriever's own mapping,
+        else row *i* is chunk *i* — both keep the same non-empty passages).
         """
+        if self.chunk_ids is None and chunks is not None:
+            self.bind(chunks)
+        ids = self.chunk_ids if self.chunk_ids is not None else np.arange(self.index.ntotal)
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
-        self.vector_store.save_local(path.as_posix())
+        faiss.write_index(self.index, (path / "index.faiss").as_posix())
+        self._write_sidecar(path, ids)
+
+    def _write_sidecar(self, path: Path, ids: np.ndarray) -> None:
+        # meta.json goes last: its presence means the sidecar is complete
+        tmp = f".tmp{os.getpid()}"
+        np.save(path / f"ids{tmp}.npy", np.asarray(ids, dtype=np.int64))
+        os.replace(path / f"ids{tmp}.npy", path / "ids.npy")
+        meta = {"normalize_L2": bool(self.normalize_L2), "dim": int(self.index.d),
+                "rows": int(self.index.ntotal)}
+        (path / f"meta.json{tmp}").write_text(json.dumps(meta))
+        os.replace(path / f"meta.json{tmp}", path / "meta.json")
 
     @classmethod
     def load(cls, path: Path | str,
-             model_name: str = "text-embedding-3-large") -> "FaissRetriever":
+             model_name: str = "text-embedding-3-large",
+             chunks: ChunkStore | None = None, mmap: bool = True,
+             embeddings=None) -> "FaissRetriever":
         """
-        Load index previously saved by :py:meth:`save`.
+        Load index previously saved by :py:meth:`save`: the index file is
+        memory-mapped (pages shared by every worker, nothing unpickled).  A
+        langchain ``save_local`` directory is loaded through its pickle and,
+        given *chunks*, gets its sidecar written for next time.  *embeddings*
+        replaces the OpenAI client (e.g. the in-process ``lsa`` model).
         """
-        embeddings = OpenAIEmbeddings(
-            model=model_name,
-            openai_api_key=os.getenv("OPENAI_API_KEY"),
-        )
-        vs = FAISS.load_local(Path(path).as_posix(), embeddings, 
-                          allow_dangerous_deserialization=True)
+        path = Path(path)
+        if embeddings is None:
+            embeddings = OpenAIEmbeddings(
+                model=model_name,
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx_sync_client(),      # pooled keep-alive connections
+            )
         obj = object.__new__(cls)           # bypass __init__
+        obj.embeddings = embeddings
+        obj.chunks = chunks
+        if (path / "meta.json").exists():
+            meta = json.loads((path / "meta.json").read_text())
+            obj.vector_store = None
+            obj.index = faiss.read_index((path / "index.faiss").as_posix(),
+                                         MMAP_FLAGS if mmap else 0)
+            obj.normalize_L2 = meta["normalize_L2"]
+            obj.chunk_ids = np.load(path / "ids.npy", mmap_mode="r" if mmap else None)
+            return obj
+        vs = FAISS.load_local(path.as_posix(), embeddings,
+                              allow_dangerous_deserialization=True)
         obj.vector_store = vs
+        obj.index, obj.normalize_L2 = vs.index, vs._normalize_L2
+        obj.chunk_ids = None
+        if chunks is not None:
+            obj.bind(chunks)
+            obj._write_sidecar(path, obj.chunk_ids)   # one-off migration
         return obj
 
+    def bind(self, chunks: ChunkStore) -> None:
+        """Map every vector row to its ID in the shared *chunks* table, then
+        drop langchain's docstore: searches return chunk IDs and text lives
+        only in *chunks*.  Rows whose text is not in the table map to -1."""
+        vs = self.vector_store
+        rows = np.full(vs.index.ntotal, -1, dtype=np.int64)
+        for row, doc_id in vs.index_to_docstore_id.items():
+            found = chunks.find(vs.docstore.search(doc_id).page_content)
+            if found is not None:
+                rows[row] = found
+        self.chunks, self.chunk_ids = chunks, rows
+        self.vector_store = None
+
+    def EmbedQuery(self, query: str) -> List[float]:
+        """Embed *query* with the remote model (one network round trip)."""
+        return self.embeddings.embed_query(query)
+
+    def EmbedQueries(self, queries: Sequence[str]) -> List[List[float]]:
+        """Embed many queries in as few requests as the client's chunk size allows."""
+        return self.embeddings.embed_documents(list(queries))
+
+    def _search_params(self, where):
+        """Search parameters restricting the scan to index rows whose chunk
+        matches *where* (``None`` when nothing matches)."""
+        allow = np.asarray(self.chunks.select(where))
+        ids = np.asarray(self.chunk_ids)
+        rows = (ids >= 0) & allow[np.maximum(ids, 0)]
+        if not rows.any():
+            return None
+        bits = np.packbits(rows, bitorder="little")
+        # the selector holds a raw pointer: keep the bitmap alive with it
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(rows), faiss.swig_ptr(bits)))
+        params._bits = bits
+        return params
+
+    def GetTopKIdsByVectors(self, vectors: Sequence[Sequence[float]], k: int = 10,
+                            where=None):
+        """``(ids, scores)`` — ``int64[n, k]`` chunk IDs (-1 = no hit) and
+        their distances for a batch of embeddings: one ``index.search`` call.
+        *where* (a ``chunk_meta`` filter expression or ``bool[n_chunks]``
+        mask) limits the search to matching passages.  Requires chunk IDs
+        (:meth:`load` or :meth:`bind`)."""
+        x = np.asarray(vectors, dtype=np.float32)
+        if self.normalize_L2:
+            faiss.normalize_L2(x)
+        if where is None:
+            scores, rows = self.index.search(x, k)
+        elif (params := self._search_params(where)) is None:
+            return np.full((len(x), k), -1, dtype=np.int64), np.zeros((len(x), k), np.float32)
+        else:
+            scores, rows = self.index.search(x, k, params=params)
+        ids = np.where(rows >= 0, self.chunk_ids[np.maximum(rows, 0)], -1)
+        return ids, scores
+
+    def GetTopKIdsByVector(self, vector: Sequence[float], k: int = 10,
+                           where=None) -> np.ndarray:
+        """Chunk IDs nearest to a pre-computed embedding, best first."""
+        ids, _ = self.GetTopKIdsByVectors([vector], k, where)
+        return ids[0][ids[0] >= 0]
+
+    def GetTopKByVector(self, vector: Sequence[float], k: int = 10):
+        """Return ``[(Document, score), …]`` nearest to a pre-computed embedding."""
+        return self.GetTopKByVectors([vector], k)[0]
+
+    def GetTopKByVectors(self, vectors: Sequence[Sequence[float]], k: int = 10):
+        """:meth:`GetTopKByVector` for a batch: one ``index.search`` call."""
+        if self.vector_store is not None:       # freshly built, not yet bound
+            return [self.vector_store.similarity_search_with_score_by_vector(v, k=k)
+                    for v in vectors]
+        ids, scores = self.GetTopKIdsByVectors(vectors, k)
+        return [[(Document(page_content=self.chunks.text(i), metadata={"id": int(i)}),
+                  float(s)) for i, s in zip(row_ids, row_scores) if i >= 0]
+                for row_ids, row_scores in zip(ids, scores)]
+
     def GetTopK(self, query: str, k: int = 10):
         """Return ``[(Document, score), …]`` best matches."""
-        return self.vector_store.similarity_search_with_score(query, k=k)
+        return self.GetTopKByVector(self.EmbedQuery(query), k=k)
 
     # helper
     def GetvectorStore(self):
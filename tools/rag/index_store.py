@@ -0,0 +1,404 @@
+"""
+Versioned index directories and zero-downtime hot swap.
+
+Layout::
+
+    indexes/
+      manifest.json          {"current": "20250601-0930", "versions": {"20250601-0930": {...}}}
+      20250601-0930/         bm25.pkl  bm25_csr/  chunks/  faiss/  lsa/
+      20250715-1410/         …
+
+Without ``manifest.json`` the flat layout (``indexes/bm25.pkl``,
+``indexes/faiss``) is served as version ``"legacy"``.  A version directory
+with ``shards.json`` holds one BM25 + FAISS pair per corpus instead, behind
+a query router (``tools/rag/shards.py``).  ``lsa/`` is the in-process
+dense index (``tools/rag/lsa.py``): served instead of ``faiss/`` with
+``DENSE_BACKEND=lsa`` (then ``faiss/`` is neither built nor needed), and
+as the fallback of a degraded embedding stage otherwise.
+
+:class:`IndexHolder` owns the active :class:`IndexSet`.  Callers take one
+snapshot per request (``holder.current()``) and use it throughout, so a swap
+never changes the indexes under an in-flight request: it finishes on the old
+version and the old set is freed once the last such request drops it.
+:meth:`IndexHolder.reload` loads the new set on a background thread, then
+swaps one reference under a lock and runs the ``on_swap`` listeners (cache
+invalidation).  With ``INDEX_WATCH_SECONDS`` > 0 every worker also polls the
+manifest and follows ``current`` on its own.  Nothing is loaded until the
+first ``current()`` (or an explicit warm-up, see ``tools/startup.py``).
+
+    python -m tools.rag.index_store build            # parse the PDF → new version, publish
+    python -m tools.rag.index_store build --corpus home=data/how_to_cook.pdf \
+        --corpus sichuan=data/sichuan.pdf --terms sichuan=川菜,四川   # sharded version
+    python -m tools.rag.index_store publish VERSION  # point "current" at VERSION
+    python -m tools.rag.index_store list
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from tools import tracing
+
+if TYPE_CHECKING:
+    from tools.rag.chunk_store import ChunkStore
+
+__all__ = ["IndexSet", "IndexHolder", "read_manifest", "publish", "build", "LEGACY"]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+LEGACY = "legacy"
+WATCH_SECONDS = float(os.getenv("INDEX_WATCH_SECONDS", "0"))
+
+RELOADS = tracing.register(tracing.Counter(
+    "chef_index_reloads_total", "Index reload attempts by outcome.", ("result",)))
+INDEX_INFO = tracing.register(tracing.Gauge(
+    "chef_index_info", "Index version being served (value is always 1).", ("version",)))
+
+
+# ───────────────────────────── manifest ──────────────────────────────────
+def read_manifest(root: Path) -> dict:
+    try:
+        return json.loads((Path(root) / MANIFEST).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(root: Path, manifest: dict) -> None:
+    tmp = Path(root) / f".{MANIFEST}.{os.getpid()}"
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, Path(root) / MANIFEST)          # readers see old or new, never half
+
+
+def current_version(root: Path) -> str:
+    return read_manifest(root).get("current", LEGACY)
+
+
+def version_dir(root: Path, version: str) -> Path:
+    return Path(root) if version == LEGACY else Path(root) / version
+
+
+def _complete(d: Path) -> bool:
+    return (((d / "bm25.pkl").exists() and ((d / "faiss").exists() or (d / "lsa").exists()))
+            or (d / "shards.json").exists())
+
+
+def publish(root: Path, version: str, **info) -> None:
+    """Make *version* (an existing directory under *root*) the current one."""
+    d = version_dir(root, version)
+    if not _complete(d):
+        raise FileNotFoundError(f"no index version {version!r} under {root}")
+    manifest = read_manifest(root)
+    versions = manifest.setdefault("versions", {})
+    versions.setdefault(version, {}).update(info)
+    manifest["current"] = version
+    _write_manifest(root, manifest)
+
+
+def _passages(source: Path) -> list[str]:
+    """Chunks of a PDF; a ``.txt`` collection is one passage per line."""
+    if source.suffix.lower() == ".txt":
+        return [line.strip() for line in source.read_text(encoding="utf-8").splitlines()
+                if line.strip()]
+    from tools.rag.pdf_parse import DataProcess
+    dp = DataProcess(source)
+    dp.parse(max_seq=512)
+    return dp.data
+
+
+def _build_corpus(d: Path, source: Path, embed_model: str, local: bool = False):
+    """``bm25.pkl`` (+ flat arrays, chunks) and ``faiss/`` for *source* in *d*;
+    with *local* also ``lsa/`` — and only that under ``DENSE_BACKEND=lsa``
+    (no embedding calls at all; the returned retriever is then ``None``)."""
+    from tools.rag.bm25_retriever import BM25
+    from tools.rag.faiss_retriever import FaissRetriever
+
+    texts = _passages(source)
+    bm25 = BM25(texts)
+    bm25.save(d / "bm25.pkl")
+    if local:
+        from tools.rag import lsa
+        # BM25's documents are the passages' jieba tokens, in chunk-ID order
+        lsa.build(d, bm25.chunks, [doc.page_content.split() for doc in bm25.documents])
+        if lsa.BACKEND == "lsa":
+            return len(bm25.chunks), None
+    dense = FaissRetriever(texts, model_name=embed_model, chunk_size=128)
+    dense.save(d / "faiss", chunks=bm25.chunks)
+    return len(bm25.chunks), dense
+
+
+def build(root: Path, pdf_path: Path, embed_model: str, version: str | None = None,
+          make_current: bool = True, corpora: dict[str, dict] | None = None) -> str:
+    """Parse *pdf_path* into a new BM25 + FAISS version directory (staged, then
+    renamed into place) and optionally publish it.  Returns the version.
+    With *corpora* (``name → {"source": path, "terms": [...]}``) the version
+    is sharded, one shard per corpus, and *pdf_path* is not used."""
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    final = version_dir(root, version)
+    staging = Path(root) / f".{version}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    try:
+        if corpora:
+            from tools.rag import shards
+            entries = shards.build(staging, corpora,
+                                   lambda d, source: _build_corpus(d, source, embed_model))
+            info = {"source": ", ".join(e["source"] for e in entries),
+                    "shards": [e["name"] for e in entries],
+                    "passages": sum(e["passages"] for e in entries)}
+        else:
+            passages, dense = _build_corpus(staging, Path(pdf_path), embed_model, local=True)
+            info = {"source": Path(pdf_path).name, "passages": passages}
+            if dense is None:
+                embed_model = "lsa"
+        os.replace(staging, final)
+    except BaseException:                       # failed or interrupted: no staging debris
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if make_current:
+        publish(root, version, built=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                embed_model=embed_model, **info)
+    return version
+
+
+def needs_build(root: Path) -> bool:
+    return not _complete(version_dir(root, current_version(root)))
+
+
+# ───────────────────────────── index sets ────────────────────────────────
+@dataclass(frozen=True, eq=False)
+class IndexSet:
+    """Everything one request retrieves against — never mutated after load."""
+    version: str
+    bm25: object
+    faiss: object
+    reranker: object
+    chunks: ChunkStore = field(repr=False)   # passage text by chunk ID (what retrievers return)
+    timings: dict = field(default_factory=dict, repr=False)   # part → load seconds
+    lsa: object = field(default=None, repr=False)   # in-process dense index (None: not built)
+
+    @classmethod
+    def load(cls, root: Path, version: str, embed_model: str, rerank_model: str,
+             reranker=None) -> "IndexSet":
+        """Load *version*; an existing *reranker* for the same model is reused
+        (keeps its pooled connections and breaker state).  ``timings`` holds
+        the seconds spent per part, module imports included."""
+        import jieba
+
+        timings = {}
+        t = time.perf_counter()
+
+        def lap(part: str) -> None:
+            nonlocal t
+            now = time.perf_counter()
+            timings[part], t = now - t, now
+
+        d = version_dir(root, version)
+        local = None
+        if (d / "shards.json").exists():
+            from tools.rag import shards
+            bm25, faiss = shards.load(d, embed_model)
+            lap("shards")
+            jieba.initialize()
+            lap("jieba")
+        else:
+            from tools.rag.bm25_retriever import BM25
+            bm25 = BM25.load(d / "bm25.pkl")
+            if not BM25.compact_dir(d / "bm25.pkl").exists():
+                # one-off migration: flat arrays are memory-mapped (shared) on next start
+                bm25.save_compact(BM25.compact_dir(d / "bm25.pkl"))
+            lap("bm25")
+            jieba.initialize()          # dictionary for query tokenisation, before a fork
+            lap("jieba")
+            from tools.rag import lsa
+            if lsa.BACKEND == "lsa" and not lsa.exists(d):
+                lsa.build(d, bm25.chunks)  # one-off: versions built before the LSA backend
+            if lsa.exists(d) and (lsa.BACKEND == "lsa" or lsa.FALLBACK):
+                local = lsa.load(d, bm25.chunks)
+                lap("lsa")
+            if lsa.BACKEND == "lsa":
+                faiss = local
+            else:
+                from tools.rag.faiss_retriever import FaissRetriever
+                # memory-mapped; a pickled langchain directory is migrated on first load
+                faiss = FaissRetriever.load(d / "faiss", model_name=embed_model,
+                                            chunks=bm25.chunks)
+                lap("faiss")
+        if reranker is None or reranker.model != rerank_model:
+            from tools.rag.rerank_api import APIReranker
+            reranker = APIReranker(model=rerank_model)
+        lap("reranker")
+        return cls(version, bm25, faiss, reranker, bm25.chunks, timings, lsa=local)
+
+
+class IndexHolder:
+    """The active :class:`IndexSet` of one process, swappable at runtime.
+
+    Loaded on the first :meth:`current` call; with *pdf_path* a missing
+    current version is built from it first (first-run setup)."""
+
+    def __init__(self, root: Path, embed_model: str, rerank_model: str,
+                 watch_seconds: float = WATCH_SECONDS, pdf_path: Path | None = None):
+        self.root, self.embed_model, self.rerank_model = Path(root), embed_model, rerank_model
+        self.watch_seconds = watch_seconds
+        self.pdf_path = pdf_path
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._listeners: list = []
+        self._loading: str | None = None          # version being loaded in the background
+        self._last_error: str | None = None
+        self._manifest_mtime = self._mtime()
+        self._checked = time.monotonic()
+        self._active: IndexSet | None = None
+        INDEX_INFO.set_function(
+            lambda: {(self._active.version,): 1} if self._active is not None else {})
+
+    @property
+    def loaded(self) -> bool:
+        return self._active is not None
+
+    def _load_first(self) -> IndexSet:
+        with self._first_load:                    # concurrent first requests load once
+            if self._active is None:
+                if self.pdf_path is not None and needs_build(self.root):
+                    # first run → build indexes (can take a few minutes per PDF)
+                    logger.info("building BM25 / FAISS indexes – first-time setup …")
+                    build(self.root, self.pdf_path, self.embed_model)
+                t0 = time.perf_counter()
+                active = IndexSet.load(self.root, current_version(self.root),
+                                       self.embed_model, self.rerank_model)
+                with self._lock:
+                    self._active = active
+                logger.info("index %s loaded in %.1f s", active.version,
+                            time.perf_counter() - t0)
+        return self._active
+
+    def current(self) -> IndexSet:
+        """Snapshot for one request (loads on first use).  Also polls the
+        manifest when watching."""
+        if self._active is None:
+            return self._load_first()
+        if self.watch_seconds > 0 and time.monotonic() - self._checked >= self.watch_seconds:
+            self._checked = time.monotonic()
+            mtime = self._mtime()
+            if mtime != self._manifest_mtime:
+                self._manifest_mtime = mtime
+                self.reload()
+        return self._active
+
+    def on_swap(self, fn) -> None:
+        """Call ``fn(old, new)`` after every swap (drop version-bound caches)."""
+        self._listeners.append(fn)
+
+    def _mtime(self) -> int:
+        try:
+            return (self.root / MANIFEST).stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def status(self) -> dict:
+        active = self._active
+        return {"version": active.version if active is not None else None,
+                "loading": self._loading, "manifest": current_version(self.root),
+                "last_error": self._last_error,
+                "load_seconds": {k: round(v, 3) for k, v in active.timings.items()}
+                                if active is not None else None}
+
+    def reload(self, version: str | None = None, wait: bool = False) -> dict:
+        """Load *version* (default: the manifest's ``current``) in the
+        background and swap it in.  Returns :meth:`status`; with *wait* only
+        after the load finished (or failed)."""
+        if self._active is None:
+            self._load_first()                    # nothing to swap out yet
+        target = version or current_version(self.root)
+        with self._lock:
+            if target == self._active.version or self._loading is not None:
+                busy = self._loading
+                thread = None
+            else:
+                busy = self._loading = target
+                thread = threading.Thread(target=self._load_and_swap, args=(target,),
+                                          name=f"index-load-{target}", daemon=True)
+        if thread is not None:
+            thread.start()
+            if wait:
+                thread.join()
+        elif busy and wait:
+            while self._loading is not None:
+                time.sleep(0.05)
+        return self.status()
+
+    def _load_and_swap(self, version: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            new = IndexSet.load(self.root, version, self.embed_model, self.rerank_model,
+                                reranker=self._active.reranker)
+        except Exception as err:
+            logger.exception("loading index version %s failed; keeping %s",
+                             version, self._active.version)
+            RELOADS.inc("failed")
+            self._last_error = f"{version}: {err}"
+            with self._lock:
+                self._loading = None
+            return
+        with self._lock:
+            old, self._active = self._active, new
+            self._loading, self._last_error = None, None
+        for fn in self._listeners:
+            try:
+                fn(old, new)
+            except Exception:
+                logger.exception("index swap listener %r failed", fn)
+        RELOADS.inc("swapped")
+        logger.info("index %s → %s swapped in after %.1f s",
+                    old.version, new.version, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    root_default = Path(__file__).resolve().parents[2] / "indexes"
+    ap = argparse.ArgumentParser(description="Manage versioned index directories.")
+    ap.add_argument("--root", type=Path, default=Path(os.getenv("CHEF_INDEX_DIR", root_default)))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="build a new version from the PDF")
+    b.add_argument("--pdf", type=Path,
+                   default=Path(__file__).resolve().parents[2] / "data" / "how_to_cook.pdf")
+    b.add_argument("--corpus", action="append", default=[], metavar="NAME=PATH",
+                   help="build a sharded version, one shard per corpus (PDF or .txt)")
+    b.add_argument("--terms", action="append", default=[], metavar="NAME=T1,T2",
+                   help="query terms that route to shard NAME")
+    b.add_argument("--version")
+    b.add_argument("--embed-model", default="text-embedding-3-large")
+    b.add_argument("--no-publish", action="store_true")
+    p = sub.add_parser("publish", help="make an existing version current")
+    p.add_argument("version")
+    sub.add_parser("list")
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        corpora = {n: {"source": Path(s), "terms": []}
+                   for n, s in (c.split("=", 1) for c in args.corpus)}
+        for name, terms in (t.split("=", 1) for t in args.terms):
+            corpora[name]["terms"] = terms.split(",")
+        v = build(args.root, args.pdf, args.embed_model, args.version,
+                  make_current=not args.no_publish, corpora=corpora)
+        print(f"built {v}" + ("" if args.no_publish else " (current)"))
+    elif args.cmd == "publish":
+        publish(args.root, args.version)
+        print(f"current → {args.version}")
+    else:
+        m = read_manifest(args.root)
+        for v, info in sorted(m.get("versions", {}).items()):
+            mark = "*" if v == m.get("current") else " "
+            print(f"{mark} {v}  {json.dumps(info, ensure_ascii=False)}")
+        if not m:
+            print(f"* {LEGACY}  (flat layout, no manifest)")
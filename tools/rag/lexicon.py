@@ -0,0 +1,220 @@
+"""
+Bilingual ingredient lexicon: English query words → the Chinese terms the
+cookbook uses, substituted before BM25 (and LSA) scoring.
+
+Users and the image detector (``ingredients_detector`` returns English
+JSON arrays) write "green pepper, eggs"; the corpus says 青椒 and 鸡蛋, and
+jieba tokens of English text match nothing in it.  :meth:`Lexicon.expand`
+rewrites every English alias it knows into the entry's usual Chinese term::
+
+    "green pepper, eggs, no pork"  →  "青椒, 鸡蛋, no pork"
+
+Negated items ("no pork", "without shrimp") are left as they are — they
+are metadata filters (``chunk_meta.constraints``), not search terms.
+
+The lexicon is ``lexicon.tsv`` beside this module (``LEXICON_PATH``
+overrides it): ``en`` aliases and ``zh`` corpus terms, ``|``-separated,
+plus a ``kind`` (ingredient, seasoning, method, dish).  Its Chinese side
+is mined from the corpus — ``python -m tools.rag.lexicon mine`` lists the
+ingredient-list terms of an index that no entry covers yet, most frequent
+first, as TSV rows to translate.
+
+:meth:`Lexicon.concepts` also drives the lexical shortcut in
+``chef_agent``: when every passage of the BM25 top-k contains every
+ingredient or dish the query names, BM25 answers alone and the embedding,
+FAISS and rerank calls are skipped.
+"""
+from __future__ import annotations
+
+import csv
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Sequence
+
+from tools import tracing
+from tools.rag.chunk_meta import _DISH
+
+__all__ = ["Entry", "Lexicon", "LEXICON", "SHORTCUT", "ANSWERS"]
+
+PATH = Path(os.getenv("LEXICON_PATH", Path(__file__).with_name("lexicon.tsv")))
+SHORTCUT = os.getenv("LEXICAL_SHORTCUT", "1").lower() not in ("0", "false", "off", "no")
+MIN_CONCEPTS = int(os.getenv("LEXICAL_MIN_CONCEPTS", "2"))
+
+ANSWERS = tracing.register(tracing.Counter(
+    "chef_lexical_shortcut_total", "Retrievals answered by BM25 alone (shortcut) or by "
+    "the full hybrid pipeline.", ("result",)))
+
+# kinds a confident lexical answer must cover (seasonings and methods are too
+# common in the corpus to tell dishes apart)
+SEARCH_KINDS = ("ingredient", "dish")
+# query words that carry no search meaning of their own
+_FILLER = frozenset("""a an and or the with without some any i me my we our have has got
+    what which can could should would make cook cooking recipe recipes dish dishes meal meals
+    for to of in on from using use please how do does something anything left leftover
+    leftovers fridge pantry ingredients ingredient only just also that this these is are
+    want like eat tonight today dinner lunch breakfast easy quick simple chinese""".split())
+_NEGATED = re.compile(r"(?:\bno|\bwithout|\bnot|n't\s+(?:eat|want|like)|free\s+of)\s+$", re.I)
+_NOUNS = frozenset(("n", "nz", "ng", "nr"))        # jieba POS tags mined as ingredients
+_WORD = re.compile(r"[a-z][a-z'\-]*", re.I)
+
+
+@dataclass(frozen=True)
+class Entry:
+    en: tuple[str, ...]
+    zh: tuple[str, ...]
+    kind: str
+
+
+class Lexicon:
+    """English aliases → :class:`Entry`; leftmost-longest whole-word matching."""
+
+    def __init__(self, entries: Iterable[Entry]):
+        self.entries = list(entries)
+        self._by_alias: dict[str, Entry] = {}
+        self._by_term: dict[str, Entry] = {}
+        for e in self.entries:
+            for alias in e.en:
+                self._by_alias.setdefault(alias.casefold(), e)
+            for term in e.zh:
+                self._by_term.setdefault(term, e)
+        longest = lambda xs: sorted(xs, key=len, reverse=True)          # noqa: E731
+        self._en = re.compile(r"(?<![a-z])(?:" + "|".join(
+            re.escape(a).replace(r"\ ", r"[\s\-]+") for a in longest(self._by_alias))
+            + r")(?![a-z])", re.I) if self._by_alias else None
+        self._zh = re.compile("|".join(map(re.escape, longest(self._by_term)))) \
+            if self._by_term else None
+
+    @classmethod
+    def load(cls, path=PATH) -> "Lexicon":
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = csv.DictReader((line for line in f if not line.startswith("#")),
+                                  delimiter="\t")
+            return cls(Entry(tuple(a.strip() for a in r["en"].split("|") if a.strip()),
+                             tuple(t.strip() for t in r["zh"].split("|") if t.strip()),
+                             (r.get("kind") or "ingredient").strip())
+                       for r in rows if r.get("zh"))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _alias(self, match: re.Match) -> Entry:
+        text = match.group(0).casefold()
+        return self._by_alias.get(text) or self._by_alias[re.sub(r"[\s\-]+", " ", text)]
+
+    def expand(self, query: str, alternatives: bool = False) -> str:
+        """*query* with every known, non-negated English alias replaced by
+        the entry's usual Chinese term (all its terms with *alternatives* —
+        rarer synonyms weigh heavily in BM25 and mostly pull in the index
+        pages, see ``benchmarks/lexicon_expansion.py``)."""
+        if self._en is None:
+            return query
+
+        def sub(m: re.Match) -> str:
+            if _NEGATED.search(query[:m.start()]):
+                return m.group(0)
+            zh = self._alias(m).zh
+            return " " + " ".join(zh if alternatives else zh[:1]) + " "
+
+        return self._en.sub(sub, query)
+
+    def concepts(self, query: str, kinds: Sequence[str] = SEARCH_KINDS
+                 ) -> tuple[list[Entry], list[str]]:
+        """Entries of *kinds* the query asks for (English aliases and
+        Chinese terms, negated ones excluded) and the English words it does
+        not account for (neither a known alias nor filler)."""
+        found: dict[int, Entry] = {}
+        rest = query
+        if self._en is not None:
+            for m in self._en.finditer(query):
+                if not _NEGATED.search(query[:m.start()]):
+                    e = self._alias(m)
+                    found[id(e)] = e
+            rest = self._en.sub(" ", query)
+        if self._zh is not None:
+            for m in self._zh.finditer(query):
+                e = self._by_term[m.group(0)]
+                found[id(e)] = e
+        unknown = [w for w in _WORD.findall(rest) if w.casefold() not in _FILLER
+                   and not _NEGATED.search(w + " ")]
+        return [e for e in found.values() if e.kind in kinds], unknown
+
+    def eligible(self, query: str, min_concepts: int = MIN_CONCEPTS) -> bool:
+        """Whether BM25 may answer *query* alone: it names at least
+        *min_concepts* ingredients / dishes and nothing the lexicon cannot
+        place ("something my kids like" needs the semantic stages)."""
+        wanted, unknown = self.concepts(query)
+        return not unknown and len(wanted) >= min_concepts
+
+    def confident(self, query: str, passages: Sequence[str],
+                  min_concepts: int = MIN_CONCEPTS) -> bool:
+        """Whether *passages* (the BM25 top-k, recipe passages) answer
+        *query* on their own: it is :meth:`eligible` and every passage has
+        a dish segment (cut at ``XXX的做法`` headers — passages span two or
+        three recipes) that contains every ingredient / dish it names."""
+        wanted, unknown = self.concepts(query)
+        if unknown or len(wanted) < min_concepts or not passages:
+            return False
+
+        def covered(text: str) -> bool:
+            cuts = [0, *(m.start() for m in _DISH.finditer(text)), len(text)]
+            return any(all(any(t in text[a:b] for t in e.zh) for e in wanted)
+                       for a, b in zip(cuts, cuts[1:]))
+
+        return all(covered(p) for p in passages)
+
+
+LEXICON = Lexicon.load()
+
+
+def _mine(index: Path, top: int) -> None:
+    import collections
+
+    import jieba
+    import jieba.posseg
+
+    from tools.rag.bm25_retriever import BM25
+    from tools.rag.chunk_meta import _INGREDIENTS
+
+    jieba.setLogLevel(60)
+    counts: collections.Counter[str] = collections.Counter()
+    seen: set[str] = set()
+    for text in BM25.load(index / "bm25.pkl").chunks:       # overlapping windows: each list once
+        for m in _INGREDIENTS.finditer(text):
+            if m.group(1) not in seen:
+                seen.add(m.group(1))
+                counts.update({w.word for w in jieba.posseg.cut(m.group(1))
+                               if w.flag in _NOUNS and re.fullmatch(r"[一-鿿]{2,6}", w.word)})
+    covered = [t for e in LEXICON.entries for t in e.zh]
+    print("en\tzh\tkind\t# passages")
+    shown = 0
+    for term, n in counts.most_common():
+        if any(term in t or t in term for t in covered):
+            continue
+        print(f"\t{term}\tingredient\t# {n}")
+        shown += 1
+        if shown >= top:
+            break
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Bilingual ingredient lexicon.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("mine", help="ingredient terms of an index the lexicon does not cover")
+    m.add_argument("--index", type=Path,
+                   default=Path(__file__).resolve().parents[2] / "indexes")
+    m.add_argument("--top", type=int, default=100)
+    e = sub.add_parser("expand", help="show the BM25 query for QUERY")
+    e.add_argument("query")
+    args = ap.parse_args()
+
+    if args.cmd == "mine":
+        _mine(args.index, args.top)
+    else:
+        wanted, unknown = LEXICON.concepts(args.query)
+        print(LEXICON.expand(args.query))
+        print("concepts:", ", ".join("/".join(e.zh) for e in wanted) or "-",
+              "| unknown:", ", ".join(unknown) or "-")
@@ -0,0 +1,230 @@
+"""
+In-process dense retrieval: latent semantic analysis (jieba TF-IDF →
+truncated SVD) trained on the version's own passages, searched with FAISS.
+No embedding API call — a query costs a jieba cut, a sparse projection and
+one FAISS search.
+
+Layout (``indexes/<version>/lsa/``)::
+
+    terms.npy        sorted vocabulary (terms in ≥ ``LSA_MIN_DF`` passages)
+    idf.npy          float32[n_terms]       smoothed idf
+    components.npy   float32[n_terms, dim]  term → latent space
+    meta.json        {"dim": 256, "passages": 2882, "terms": 10495}
+    faiss/           index.faiss + ids.npy + meta.json (``FaissRetriever`` layout),
+                     unit-length passage vectors in an inner-product index
+
+A passage (or query) vector is its TF-IDF row (sublinear tf, L2-normalised)
+times ``components``, normalised to unit length, so the index ranks by
+cosine similarity.  The SVD is a randomized range finder with power
+iterations (Halko et al.) over the sparse TF-IDF matrix in numpy — the
+vocabulary is too large for a dense matrix and no sparse-linear-algebra
+package is a dependency.
+
+Served as the dense stage with ``DENSE_BACKEND=lsa``, and (``LSA_FALLBACK``,
+on by default) in place of the embedding-based search whenever the
+embedding stage is degraded.  ``index_store build`` trains it with every
+unsharded version; existing versions::
+
+    python -m tools.rag.lsa build indexes/20250601-0930
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from tools.rag.chunk_store import ChunkStore
+from tools.rag.faiss_retriever import FaissRetriever
+
+__all__ = ["LSAEmbeddings", "build", "exists", "load", "BACKEND", "FALLBACK"]
+
+DIM = int(os.getenv("LSA_DIM", "256"))
+MIN_DF = int(os.getenv("LSA_MIN_DF", "2"))
+BACKEND = os.getenv("DENSE_BACKEND", "openai").lower()          # "openai" | "lsa"
+FALLBACK = os.getenv("LSA_FALLBACK", "1").lower() not in ("0", "false", "off", "no")
+
+FILES = ("terms.npy", "idf.npy", "components.npy", "meta.json")
+
+
+def _tokens(text: str) -> list[str]:
+    import jieba
+    return " ".join(jieba.cut_for_search(text)).split()        # as BM25 tokenises
+
+
+class _TfIdf:
+    """Sparse TF-IDF rows in CSR form (``indptr``, ``cols``, ``vals``)."""
+
+    def __init__(self, indptr: np.ndarray, cols: np.ndarray, vals: np.ndarray, n_cols: int):
+        self.indptr, self.cols, self.vals, self.n_cols = indptr, cols, vals, n_cols
+
+    @classmethod
+    def from_tokens(cls, docs: Iterable[Sequence[str]], terms: np.ndarray,
+                    idf: np.ndarray) -> "_TfIdf":
+        indptr, cols, vals = [0], [], []
+        for tokens in docs:
+            tok = np.asarray(list(tokens), dtype=str)
+            col = np.searchsorted(terms, tok)
+            hit = col < len(terms)
+            hit[hit] = terms[col[hit]] == tok[hit]            # out-of-vocabulary tokens drop
+            col, tf = np.unique(col[hit], return_counts=True)
+            w = (1 + np.log(tf)) * idf[col]
+            w /= max(float(np.linalg.norm(w)), 1e-12)
+            cols.append(col)
+            vals.append(w.astype(np.float32))
+            indptr.append(indptr[-1] + len(col))
+        return cls(np.asarray(indptr, dtype=np.int64),
+                   np.concatenate(cols) if cols else np.zeros(0, np.int64),
+                   np.concatenate(vals) if vals else np.zeros(0, np.float32), len(terms))
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def transpose(self) -> "_TfIdf":
+        rows = np.repeat(np.arange(self.n_rows), np.diff(self.indptr))
+        order = np.argsort(self.cols, kind="stable")
+        indptr = np.zeros(self.n_cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.cols, minlength=self.n_cols), out=indptr[1:])
+        return _TfIdf(indptr, rows[order], self.vals[order], self.n_rows)
+
+    def dot(self, m: np.ndarray, block: int = 1 << 16) -> np.ndarray:
+        """``self @ m`` for a dense *m* (about *block* postings at a time)."""
+        out = np.zeros((self.n_rows, m.shape[1]), dtype=np.float32)
+        step = max(1, block * self.n_rows // max(len(self.cols), 1))
+        for r0 in range(0, self.n_rows, step):
+            r1 = min(r0 + step, self.n_rows)
+            s, e = self.indptr[r0], self.indptr[r1]
+            if s == e:
+                continue
+            prod = self.vals[s:e, None] * m[self.cols[s:e]]
+            filled = np.diff(self.indptr[r0:r1 + 1]) > 0
+            out[r0:r1][filled] = np.add.reduceat(prod, self.indptr[r0:r1][filled] - s, axis=0)
+        return out
+
+
+def _randomized_svd(a: _TfIdf, dim: int, oversample: int = 20, power: int = 4,
+                    seed: int = 0) -> np.ndarray:
+    """Top-*dim* right singular vectors of *a* — ``float32[n_cols, dim]``."""
+    at = a.transpose()
+    r = min(dim + oversample, a.n_rows, a.n_cols)
+    q, _ = np.linalg.qr(a.dot(np.random.default_rng(seed).standard_normal(
+        (a.n_cols, r)).astype(np.float32)))
+    for _ in range(power):                             # sharpen the spectrum
+        q, _ = np.linalg.qr(at.dot(q))
+        q, _ = np.linalg.qr(a.dot(q))
+    b = at.dot(q).T                                    # (q.T @ a), r × n_cols
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return np.ascontiguousarray(vt[:dim].T, dtype=np.float32)
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+class LSAEmbeddings:
+    """``embed_query`` / ``embed_documents`` of the LSA model (the interface
+    ``FaissRetriever`` uses for its OpenAI embeddings)."""
+
+    model = "lsa"
+
+    def __init__(self, terms: np.ndarray, idf: np.ndarray, components: np.ndarray):
+        self.terms, self.idf, self.components = terms, idf, components
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        return self.project([_tokens(t) for t in texts])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+    def project(self, token_lists: Sequence[Sequence[str]]) -> np.ndarray:
+        """``float32[n, dim]`` unit vectors of already-tokenised texts."""
+        return _unit(_TfIdf.from_tokens(token_lists, self.terms, self.idf).dot(self.components))
+
+    @classmethod
+    def fit(cls, token_lists: Sequence[Sequence[str]], dim: int = DIM,
+            min_df: int = MIN_DF) -> "LSAEmbeddings":
+        df: dict[str, int] = {}
+        for tokens in token_lists:
+            for t in set(tokens):
+                df[t] = df.get(t, 0) + 1
+        terms = np.array(sorted(t for t, c in df.items() if c >= min_df))
+        n = len(token_lists)
+        counts = np.array([df[t] for t in terms], dtype=np.float64)
+        idf = (np.log((1 + n) / (1 + counts)) + 1).astype(np.float32)
+        tfidf = _TfIdf.from_tokens(token_lists, terms, idf)
+        return cls(terms, idf, _randomized_svd(tfidf, min(dim, n, len(terms))))
+
+    def save(self, directory: Path, passages: int) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "terms.npy", self.terms)
+        np.save(directory / "idf.npy", self.idf)
+        np.save(directory / "components.npy", self.components)
+        (directory / "meta.json").write_text(json.dumps(
+            {"dim": int(self.components.shape[1]), "passages": passages,
+             "terms": len(self.terms)}))
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "LSAEmbeddings":
+        mode = "r" if mmap else None
+        return cls(np.load(directory / "terms.npy"),
+                   np.load(directory / "idf.npy", mmap_mode=mode),
+                   np.load(directory / "components.npy", mmap_mode=mode))
+
+
+def exists(directory) -> bool:
+    d = Path(directory) / "lsa"
+    return all((d / name).exists() for name in FILES) and (d / "faiss" / "meta.json").exists()
+
+
+def build(directory, chunks: ChunkStore, token_lists=None, dim: int = DIM) -> None:
+    """Train the model on *chunks* (``token_lists[i]`` = tokens of passage
+    *i*, tokenised here when not given) and write ``<directory>/lsa/``;
+    staged, then renamed so racing workers are safe."""
+    import faiss
+
+    directory = Path(directory)
+    if token_lists is None:
+        token_lists = [_tokens(t) for t in chunks]
+    model = LSAEmbeddings.fit(token_lists, dim)
+    vectors = model.project(token_lists)
+    staging = directory / f"lsa.tmp{os.getpid()}"
+    model.save(staging, len(chunks))
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    (staging / "faiss").mkdir()
+    faiss.write_index(index, str(staging / "faiss" / "index.faiss"))
+    np.save(staging / "faiss" / "ids.npy", np.arange(len(vectors), dtype=np.int64))
+    (staging / "faiss" / "meta.json").write_text(json.dumps(
+        {"normalize_L2": False, "dim": int(index.d), "rows": int(index.ntotal)}))
+    try:
+        os.replace(staging, directory / "lsa")
+    except OSError:                           # another worker won the race
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def load(directory, chunks: ChunkStore) -> FaissRetriever:
+    """The version's LSA index as a ``FaissRetriever`` (memory-mapped) whose
+    embeddings are the in-process model."""
+    d = Path(directory) / "lsa"
+    return FaissRetriever.load(d / "faiss", chunks=chunks, embeddings=LSAEmbeddings.load(d))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from tools.rag.bm25_retriever import BM25
+
+    ap = argparse.ArgumentParser(description="In-process LSA dense index.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="train the LSA index of an existing version directory")
+    b.add_argument("directory", type=Path)
+    b.add_argument("--dim", type=int, default=DIM)
+    args = ap.parse_args()
+
+    store = BM25.load(args.directory / "bm25.pkl").chunks
+    build(args.directory, store, dim=args.dim)
+    print(f"built {args.directory / 'lsa'}: {len(store)} passages, dim {args.dim}")
@@ -43,12 +43,13 @@ class RAGPipeline:
         # 3. FAISS
         if faiss_index_path.exists():
             self.faiss = FaissRetriever.load(faiss_index_path,
-                                             model_name=embed_model)
+                                             model_name=embed_model,
+                                             chunks=self.bm25.chunks)
         else:
             # build from BM25 docs (fall-back safety)
             corpus = [d.page_content for d in self.bm25.full_documents]
             self.faiss = FaissRetriever(corpus, model_name=embed_model)
-            self.faiss.save(faiss_index_path)
+            self.faiss.save(faiss_index_path, chunks=self.bm25.chunks)
 
         # 4. Cohere reranker
         self.rerank = APIReranker(model="rerank-multilingual-v3.0")
@@ -80,4 +81,4 @@ class RAGPipeline:
         bm25.save(bm25_out)
 
         fr = FaissRetriever(texts, model_name=embed_model)
-        fr.save(faiss_out)
+        fr.save(faiss_out, chunks=bm25.chunks)
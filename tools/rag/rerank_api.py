@@ -7,8 +7,16 @@ import cohere
 from typing import List
 from langchain.schema import Document   # so type hints resolve
 
+from tools.clients import httpx_sync_client
+from tools.limits import upstream
+from tools.query_cache import RERANK
+from tools.resilience import guarded_sync
+from tools.singleflight import SingleFlight
+
 __all__ = ["APIReranker"]
 
+_flight = SingleFlight("rerank")
+
 
 class APIReranker:
     """
@@ -22,7 +30,7 @@ class APIReranker:
         api_key = os.getenv("COHERE_API_KEY")
         if not api_key:
             raise ValueError("COHERE_API_KEY env var not set")
-        self.client = cohere.Client(api_key)
+        self.client = cohere.Client(api_key, httpx_client=httpx_sync_client())
         self.model = model
 
     def predict(self, query: str, docs: List[Document]) -> List[Document]:
@@ -31,16 +39,39 @@ class APIReranker:
         """
         if not docs:
             return []
+        return [docs[i] for i in self.rank(query, [d.page_content for d in docs])]
+
+    def rank(self, query: str, texts: List[str], key=None) -> List[int]:
+        """
+        Positions in *texts* by decreasing relevance.  *key* identifies the
+        candidates for coalescing (e.g. chunk IDs); default: the texts.
+        """
+        if not texts:
+            return []
+        ck = (self.model, query, key or tuple(texts))
+        if (order := RERANK.get(ck)) is not None:
+            return order
+        # identical concurrent (query, candidates) share one upstream call
+        return _flight.do_sync(ck, self._rank, query, texts, ck)
+
+    def _rank(self, query: str, payload: List[str], ck) -> List[int]:
+        order = guarded_sync("rerank", lambda: self._rerank_call(query, payload),
+                             fallback=lambda: None)
+        if order is None:
+            # degraded mode: keep the incoming (fused retrieval) order, uncached
+            return list(range(len(payload)))
+        RERANK.put(ck, order)
+        return order
 
-        payload = [d.page_content for d in docs]
-        res = self.client.rerank(
-            query=query,
-            documents=payload,
-            top_n=len(docs),
-            model=self.model,
-        )
+    def _rerank_call(self, query: str, payload: List[str]) -> List[int]:
+        with upstream("cohere"):
+            res = self.client.rerank(
+                query=query,
+                documents=payload,
+                top_n=len(payload),
+                model=self.model,
+            )
 
         # Cohere → list[cohere.RerankResult]; order by score ↓
-        order = [r.index for r in sorted(res.results,
-                                         key=lambda r: -r.relevance_score)]
-        return [docs[i] for i in order]
+        return [r.index for r in sorted(res.results,
+                                        key=lambda r: -r.relevance_score)]
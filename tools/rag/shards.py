@@ -0,0 +1,311 @@
+"""
+Sharded index versions: one BM25 + FAISS pair per corpus (a regional
+cookbook, an in-house recipe collection, a category …), a query router and
+a merge of the per-shard top-k.
+
+Layout (a version directory that has ``shards.json`` instead of
+``bm25.pkl`` / ``faiss``)::
+
+    indexes/<version>/
+      shards.json      {"shards": [{"name": "home", "source": "how_to_cook.pdf",
+                                    "terms": ["家常"], "passages": 2908}, …]}
+      shards/home/     bm25.pkl  bm25_csr/  chunks/  faiss/  centroid.npy
+      shards/sichuan/  …
+
+Chunk IDs stay global: shard *i*'s passages are numbered after those of the
+shards before it in ``shards.json`` (:class:`ShardedChunks`), so sessions,
+caches and the reranker see one passage table.
+
+Routing — every stage searches only the shards that can contribute:
+
+* lexical: shards whose ``terms`` occur in the query; with none, the shards
+  whose vocabulary has at least one query token;
+* dense: the ``SHARD_FANOUT`` shards whose centroid (mean unit embedding)
+  is closest to the query embedding.
+
+Routed shards are searched in parallel (``SHARD_WORKERS`` threads; numpy
+and FAISS release the GIL) and their top-k merged by score.  Embedding
+distances are on one scale across shards (one model), BM25 scores are not:
+each shard has its own IDF and average passage length, so a term rare in
+one shard weighs more there than the same match elsewhere.  BM25 scores
+are therefore divided by the shard's best score before the merge — each
+shard's top hit counts 1.0 and the rest rank relative to it.  Every index file
+is memory-mapped, so shards a query is not routed to cost no resident
+memory.  A metadata filter (``where``, see ``chunk_meta``) is applied inside
+each shard, against that shard's own bitmaps.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Sequence
+
+import jieba
+import numpy as np
+
+from tools import tracing
+from tools.rag.bm25_retriever import BM25
+from tools.rag.chunk_store import ChunkStore
+from tools.rag.faiss_retriever import FaissRetriever
+
+__all__ = ["SHARDS", "is_sharded", "ShardedChunks", "Shard", "Router",
+           "ShardedBM25", "ShardedFaiss", "load", "build"]
+
+SHARDS = "shards.json"
+FANOUT = int(os.getenv("SHARD_FANOUT", "2"))
+WORKERS = int(os.getenv("SHARD_WORKERS", "8"))
+
+SEARCHES = tracing.register(tracing.Counter(
+    "chef_shard_searches_total", "Per-shard searches by stage.", ("shard", "stage")))
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="chef-shard")
+
+
+def is_sharded(directory: Path) -> bool:
+    return (Path(directory) / SHARDS).exists()
+
+
+def _parallel(fn: Callable, items: Sequence) -> list:
+    """``[fn(x) for x in items]``, on the shard pool when there is more than one."""
+    if len(items) <= 1:
+        return [fn(x) for x in items]
+    return list(_pool.map(fn, items))
+
+
+# ───────────────────────────── passages ──────────────────────────────────
+class ShardedChunks:
+    """The shards' :class:`ChunkStore` tables behind one global ID space
+    (same interface as a single store)."""
+
+    def __init__(self, stores: Sequence[ChunkStore]):
+        self.stores = list(stores)
+        self.starts = np.cumsum([0] + [len(s) for s in self.stores]).astype(np.int64)
+        self.key = hashlib.blake2b("".join(s.key for s in self.stores).encode(),
+                                   digest_size=8).hexdigest()
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def _locate(self, i: int) -> tuple[int, int]:
+        s = int(np.searchsorted(self.starts, i, side="right")) - 1
+        return s, i - int(self.starts[s])
+
+    def text(self, i: int) -> str:
+        s, local = self._locate(int(i))
+        return self.stores[s].text(local)
+
+    def texts(self, ids: Sequence[int]) -> list[str]:
+        ids = np.asarray(ids, dtype=np.int64)
+        shard = np.searchsorted(self.starts, ids, side="right") - 1
+        out: list[str] = [""] * len(ids)
+        for s in np.unique(shard).tolist():
+            pos = np.flatnonzero(shard == s)
+            for p, t in zip(pos.tolist(), self.stores[s].texts(ids[pos] - self.starts[s])):
+                out[p] = t
+        return out
+
+    def __iter__(self):
+        for store in self.stores:
+            yield from store
+
+    def select(self, where) -> np.ndarray:
+        """``bool[n]`` over the global IDs — each shard's own bitmaps."""
+        return np.concatenate([s.select(where) for s in self.stores])
+
+    def find(self, text: str) -> int | None:
+        for start, store in zip(self.starts.tolist(), self.stores):
+            if (row := store.find(text)) is not None:
+                return start + row
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self.stores)
+
+
+# ───────────────────────────── shards + router ───────────────────────────
+@dataclass(frozen=True, eq=False)
+class Shard:
+    name: str
+    terms: frozenset
+    start: int                        # global ID of the shard's first passage
+    bm25: BM25
+    faiss: FaissRetriever
+    centroid: np.ndarray              # float32[dim], unit length
+
+
+class Router:
+    """Picks the shards each stage searches (see the module docstring)."""
+
+    def __init__(self, shards: Sequence[Shard], fanout: int = FANOUT):
+        self.shards, self.fanout = list(shards), fanout
+        self.centroids = np.stack([s.centroid for s in shards]) if shards else None
+
+    def lexical(self, query: str, tokens: Sequence[str]) -> list[int]:
+        named = [i for i, s in enumerate(self.shards) if any(t in query for t in s.terms)]
+        if named:
+            return named
+        return [i for i, s in enumerate(self.shards)
+                if any(s.bm25.index._column(t) >= 0 for t in tokens)]
+
+    def dense(self, x: np.ndarray) -> np.ndarray:
+        """``int[n, fanout]`` — closest shards per row of *x* (unit rows)."""
+        sim = x @ self.centroids.T
+        k = min(self.fanout, len(self.shards))
+        return np.argsort(-sim, axis=1, kind="stable")[:, :k]
+
+
+def _local(where, shard: Shard):
+    """*where* for one shard: expressions are evaluated against the shard's
+    own metadata, a global mask is sliced to the shard's ID range."""
+    if where is None or isinstance(where, str):
+        return where
+    return np.asarray(where)[shard.start:shard.start + len(shard.bm25.chunks)]
+
+
+def _merge(rows: list[np.ndarray], scores: list[np.ndarray], k: int,
+           larger_is_better: bool) -> tuple[np.ndarray, np.ndarray]:
+    """Best *k* of several ``(ids, scores)`` lists (ids < 0 are padding)."""
+    ids, sc = np.concatenate(rows), np.concatenate(scores)
+    keep = ids >= 0
+    ids, sc = ids[keep], sc[keep]
+    order = np.argsort(-sc if larger_is_better else sc, kind="stable")[:k]
+    return ids[order], sc[order]
+
+
+class ShardedBM25:
+    """``BM25`` search interface over the lexically routed shards."""
+
+    def __init__(self, router: Router, chunks: ShardedChunks):
+        self.router, self.chunks = router, chunks
+
+    def _search(self, query: str, tokens: list[str], topk: int, where) -> np.ndarray:
+        shards = [self.router.shards[i] for i in self.router.lexical(query, tokens)]
+
+        def one(shard: Shard):
+            SEARCHES.inc(shard.name, "bm25")
+            rows, scores = shard.bm25.index.topk(tokens, topk, return_scores=True,
+                                                 allow=shard.bm25._allow(_local(where, shard)))
+            if len(scores) and scores[0] > 0:      # per-shard IDF: rescale (module docstring)
+                scores = scores / scores[0]
+            return rows + shard.start, scores
+
+        hits = _parallel(one, shards)
+        if not hits:
+            return np.zeros(0, dtype=np.int64)
+        return _merge([h[0] for h in hits], [h[1] for h in hits], topk, True)[0]
+
+    def GetBM25TopKIds(self, query, topk, where=None) -> np.ndarray:
+        tokens = " ".join(jieba.cut_for_search(query)).split()
+        return self._search(query, tokens, topk, where)
+
+    def GetBM25TopKIdsBatch(self, queries, topk, where=None) -> np.ndarray:
+        rows = [self.GetBM25TopKIds(q, topk, where) for q in queries]
+        out = np.full((len(rows), topk), -1, dtype=np.int64)
+        for i, r in enumerate(rows):
+            out[i, :len(r)] = r
+        return out
+
+
+class ShardedFaiss:
+    """``FaissRetriever`` search interface over the centroid-routed shards."""
+
+    def __init__(self, router: Router):
+        self.router = router
+        first = router.shards[0].faiss
+        self.embeddings, self.normalize_L2 = first.embeddings, first.normalize_L2
+        self.larger_is_better = first.index.metric_type == 0    # METRIC_INNER_PRODUCT
+
+    def EmbedQuery(self, query: str):
+        return self.embeddings.embed_query(query)
+
+    def EmbedQueries(self, queries: Sequence[str]):
+        return self.embeddings.embed_documents(list(queries))
+
+    def GetTopKIdsByVectors(self, vectors, k: int = 10, where=None):
+        x = np.asarray(vectors, dtype=np.float32)
+        unit = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+        routes = self.router.dense(unit)
+        wanted = sorted(set(routes.ravel().tolist()))
+
+        def one(i: int):
+            shard = self.router.shards[i]
+            rows = np.flatnonzero((routes == i).any(axis=1))
+            SEARCHES.inc(shard.name, "faiss", amount=len(rows))
+            ids, scores = shard.faiss.GetTopKIdsByVectors(x[rows], k, _local(where, shard))
+            return rows, np.where(ids >= 0, ids + shard.start, -1), scores
+
+        per_row: list[list] = [[] for _ in range(len(x))]
+        for rows, ids, scores in _parallel(one, wanted):
+            for r, i, s in zip(rows.tolist(), ids, scores):
+                per_row[r].append((i, s))
+        out_ids = np.full((len(x), k), -1, dtype=np.int64)
+        out_scores = np.zeros((len(x), k), dtype=np.float32)
+        for r, hits in enumerate(per_row):
+            if hits:
+                ids, scores = _merge([h[0] for h in hits], [h[1] for h in hits], k,
+                                     self.larger_is_better)
+                out_ids[r, :len(ids)], out_scores[r, :len(ids)] = ids, scores
+        return out_ids, out_scores
+
+    def GetTopKIdsByVector(self, vector, k: int = 10, where=None) -> np.ndarray:
+        ids, _ = self.GetTopKIdsByVectors([vector], k, where)
+        return ids[0][ids[0] >= 0]
+
+
+# ───────────────────────────── load / build ──────────────────────────────
+def _centroid(dense: FaissRetriever) -> np.ndarray:
+    index = dense.index
+    c = np.zeros(index.d, dtype=np.float64)
+    for s in range(0, index.ntotal, 4096):           # bounded transient memory
+        x = index.reconstruct_n(s, min(4096, index.ntotal - s))
+        c += (x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)).sum(axis=0)
+    return (c / max(np.linalg.norm(c), 1e-12)).astype(np.float32)
+
+
+def load(directory: Path, embed_model: str) -> tuple[ShardedBM25, ShardedFaiss]:
+    """Open every shard of a sharded version directory (memory-mapped); a
+    missing ``centroid.npy`` is computed and written."""
+    directory = Path(directory)
+    spec = json.loads((directory / SHARDS).read_text(encoding="utf-8"))
+    shards, start = [], 0
+    for entry in spec["shards"]:
+        d = directory / "shards" / entry["name"]
+        bm25 = BM25.load(d / "bm25.pkl")
+        if not BM25.compact_dir(d / "bm25.pkl").exists():
+            bm25.save_compact(BM25.compact_dir(d / "bm25.pkl"))
+        dense = FaissRetriever.load(d / "faiss", model_name=embed_model, chunks=bm25.chunks)
+        if (d / "centroid.npy").exists():
+            centroid = np.load(d / "centroid.npy")
+        else:
+            centroid = _centroid(dense)
+            np.save(d / "centroid.npy", centroid)
+        terms = frozenset(t.casefold() for t in entry.get("terms", ()))   # queries are case-folded
+        shards.append(Shard(entry["name"], terms, start, bm25, dense, centroid))
+        start += len(bm25.chunks)
+    router = Router(shards)
+    chunks = ShardedChunks([s.bm25.chunks for s in shards])
+    return ShardedBM25(router, chunks), ShardedFaiss(router)
+
+
+def build(directory: Path, corpora: dict[str, dict], build_one: Callable) -> list[dict]:
+    """Build one shard per entry of *corpora* (``name → {"source": path,
+    "terms": [...]}``) under *directory* with ``build_one(shard_dir, source)
+    -> (passages, faiss_retriever)`` and write ``shards.json``.  Returns the
+    manifest entries."""
+    directory = Path(directory)
+    entries = []
+    for name, spec in corpora.items():
+        d = directory / "shards" / name
+        d.mkdir(parents=True)
+        passages, dense = build_one(d, Path(spec["source"]))
+        np.save(d / "centroid.npy", _centroid(dense))
+        entries.append({"name": name, "source": Path(spec["source"]).name,
+                        "terms": list(spec.get("terms", ())), "passages": passages})
+    (directory / SHARDS).write_text(json.dumps({"shards": entries}, indent=2,
+                                               ensure_ascii=False), encoding="utf-8")
+    return entries
@@ -0,0 +1,210 @@
+"""
+Overlap-aware context assembly: the reranked passages merged into
+contiguous spans of the cookbook before they go into the prompt.
+
+Passages are sliding windows (``pdf_parse.DataProcess._sliding_window``,
+~1350 characters, one-sentence stride), so the top ``final_k`` often hold
+the same recipe several times over: windows 41, 42 and 44 share most of
+their text.  :func:`assemble` walks the ranked chunk IDs and
+
+* folds a window into a span it overlaps (windows ``i..j`` are one span,
+  their text the union :func:`union`), paying only for the new text;
+* otherwise adds it as a passage of its own,
+
+while the context stays within a token *budget* — by default what the
+top ``final_k`` windows cost unmerged, so the tokens the duplicates would
+have taken go to further distinct passages of the ranking instead.
+
+Spans are stored (``RagResult.ids``, session memory) as their window IDs
+``i..j`` and rebuilt by :func:`texts`; :func:`window_ids` maps a span's
+text back to them.  Prompt tokens are counted with ``tiktoken`` (the
+``o200k_base`` encoding of the chat model) when it is installed, else
+estimated (one per CJK character, one per four others).
+"""
+from __future__ import annotations
+
+import os
+import weakref
+from dataclasses import dataclass
+from typing import Iterable, List, Sequence
+
+from tools import tracing
+
+__all__ = ["Span", "assemble", "union", "texts", "window_ids", "count_tokens",
+           "BUDGET", "MERGE"]
+
+MERGE = os.getenv("CONTEXT_MERGE", "1").lower() not in ("0", "false", "off", "no")
+BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))    # 0: the unmerged top final_k
+REACH = int(os.getenv("CONTEXT_MERGE_REACH", "48"))      # windows apart that may still overlap
+HEAD = 32                                                # characters a window is found by
+
+CONTEXT_TOKENS = tracing.register(tracing.Histogram(
+    "chef_rag_context_tokens", "Tokens of the retrieved passages per prompt: the top "
+    "final_k windows as ranked (raw) and as sent after merging overlaps (merged).",
+    ("context",), buckets=tracing.TOKEN_BUCKETS))
+PASSAGES = tracing.register(tracing.Counter(
+    "chef_rag_context_passages_total", "Ranked windows folded into another passage "
+    "(merged) and distinct passages added with the freed tokens (extra).", ("result",)))
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:                          # not installed / no BPE file offline
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    wide = (len(text.encode()) - len(text)) // 2   # three-byte (CJK) characters
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _merge(a: str, b: str, start: int = 0) -> str | None:
+    """*a* extended by *b* when *b* is a later window of the same text
+    (starts inside *a* at or after *start*); ``None`` when they do not
+    overlap.  Windows end in an extra "。", which the comparison ignores."""
+    head = b[:HEAD]
+    tail = b.rstrip("。")
+    p = a.find(head, start)
+    while p >= 0:
+        rest = a[p:].rstrip("。")
+        if b.startswith(rest):
+            return a[:p] + b                       # b runs past the end of a
+        if a.startswith(tail, p):
+            return a                               # b lies inside a
+        p = a.find(head, p + 1)
+    return None
+
+
+def union(chunks, first: int, last: int) -> str | None:
+    """The text windows *first*..*last* cover together; ``None`` when two
+    consecutive ones do not overlap (a document or shard boundary)."""
+    text = prev = chunks.text(first)
+    for i in range(first + 1, last + 1):
+        w = chunks.text(i)
+        merged = _merge(text, w, max(0, len(text) - len(prev)))
+        if merged is None:
+            return None
+        text, prev = merged, w
+    return text
+
+
+@dataclass
+class Span:
+    first: int
+    last: int
+    text: str
+    tokens: int
+    rank: int                                      # best rank of the windows it holds
+
+    @property
+    def ids(self) -> range:
+        return range(self.first, self.last + 1)
+
+
+def _fold(spans: List[Span], cid: int, chunks) -> tuple[Span, List[Span]] | None:
+    """The cheapest span holding window *cid* and the spans near it that
+    it absorbs (with every span inside its range), or ``None``."""
+    best = None
+    for s in spans:
+        if not s.first - REACH <= cid <= s.last + REACH:
+            continue
+        lo, hi = min(s.first, cid), max(s.last, cid)
+        while True:                                # absorb spans the range now touches
+            inside = [t for t in spans if t.first <= hi + 1 and t.last >= lo - 1]
+            nlo, nhi = min(lo, *(t.first for t in inside)), max(hi, *(t.last for t in inside))
+            if (nlo, nhi) == (lo, hi):
+                break
+            lo, hi = nlo, nhi
+        text = union(chunks, lo, hi)
+        if text is None:
+            continue
+        span = Span(lo, hi, text, count_tokens(text), min(t.rank for t in inside))
+        cost = span.tokens - sum(t.tokens for t in inside)
+        if best is None or cost < best[0]:
+            best = (cost, span, inside)
+    return None if best is None else best[1:]
+
+
+def assemble(ranked: Sequence[int], chunks, budget: int) -> List[Span]:
+    """Spans for the *ranked* chunk IDs, best first: each window folded into
+    a span it overlaps when that costs no more than sending it separately,
+    as long as the total stays within *budget* tokens (the first window is
+    always sent)."""
+    spans: List[Span] = []
+    used = 0
+    for rank, cid in enumerate(ranked):
+        if any(cid in s.ids for s in spans):
+            PASSAGES.inc("merged")
+            continue
+        text = chunks.text(cid)
+        alone = Span(cid, cid, text, count_tokens(text), rank)
+        folded = _fold(spans, cid, chunks)
+        if folded is not None:
+            span, inside = folded
+            cost = span.tokens - sum(t.tokens for t in inside)
+            if cost <= alone.tokens:
+                if used + cost > budget:
+                    continue
+                spans = [t for t in spans if t not in inside] + [span]
+                used += cost
+                PASSAGES.inc("merged")
+                continue
+        if spans and used + alone.tokens > budget:
+            continue
+        spans.append(alone)
+        used += alone.tokens
+    spans.sort(key=lambda s: s.rank)
+    return spans
+
+
+def texts(ids: Iterable[int], chunks) -> List[str]:
+    """Passage texts for stored window IDs: each run ``i, i+1, … j`` of
+    overlapping windows one span."""
+    out: List[str] = []
+    last = prev = None
+    for cid in ids:
+        w = chunks.text(cid)
+        if last is not None and cid == last + 1:
+            merged = _merge(out[-1], w, max(0, len(out[-1]) - len(prev)))
+            if merged is not None:
+                out[-1], last, prev = merged, cid, w
+                continue
+        out.append(w)
+        last, prev = cid, w
+    return out
+
+
+_heads: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def window_ids(passage: str, chunks) -> List[int]:
+    """Window IDs of a passage :func:`assemble` produced (one window or a
+    span); empty when it is no such text."""
+    row = chunks.find(passage)
+    if row is not None:
+        return [row]
+    heads = _heads.get(chunks)
+    if heads is None:
+        heads = {}
+        for i, w in enumerate(chunks):
+            heads.setdefault(w[:HEAD], []).append(i)
+        _heads[chunks] = heads
+    want = passage.rstrip("。")
+    for first in heads.get(passage[:HEAD], ()):
+        text = prev = chunks.text(first)
+        last = first
+        while (last + 1 < len(chunks) and len(text.rstrip("。")) < len(want)
+               and want.startswith(text.rstrip("。"))):
+            w = chunks.text(last + 1)
+            merged = _merge(text, w, max(0, len(text) - len(prev)))
+            if merged is None:
+                break
+            text, prev, last = merged, w, last + 1
+        if text.rstrip("。") == want:
+            return list(range(first, last + 1))
+    return []
@@ -0,0 +1,339 @@
+"""tools/resilience.py — deadlines, hedged requests and circuit breakers.
+
+Every upstream call in the pipeline goes through :func:`guarded` (async) or
+:func:`guarded_sync` (blocking SDKs) under a *stage* name, which
+
+* bounds it by ``min(stage timeout, time left in the request budget)`` —
+  the budget is started per HTTP request with :func:`begin_budget`
+  (``REQUEST_BUDGET`` seconds, default 25);
+* for side-effect free stages (``HEDGE_STAGES``), fires one duplicate ("hedge") once the first
+  attempt is slower than the stage's recent p95 and keeps whichever answers
+  first (at most ``HEDGE_RATIO`` of calls are hedged);
+* fails fast with :class:`CircuitOpen` while the stage's circuit breaker is
+  open (``BREAKER_FAILURES`` consecutive failures open it for
+  ``BREAKER_COOLDOWN`` seconds, then a single probe is let through);
+* on timeout / error / open circuit returns ``fallback()`` — the stage's
+  degraded mode — when one is given, otherwise re-raises.
+
+Degraded modes live with the callers: the gatekeeper assumes RAG, a missing
+query embedding means BM25-only retrieval, a failed rerank keeps the fused
+order, YouTube and Places answer with a notice / empty list.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from tools import tracing
+from tools.limits import Overloaded
+
+__all__ = [
+    "DeadlineExceeded", "CircuitOpen", "CircuitBreaker", "Stage", "STAGES",
+    "begin_budget", "end_budget", "budget", "remaining",
+    "guarded", "guarded_sync",
+]
+
+REQUEST_BUDGET   = float(os.getenv("REQUEST_BUDGET", "25"))
+HEDGE_RATIO      = float(os.getenv("HEDGE_RATIO", "0.1"))
+HEDGE_MIN_DELAY  = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "15"))
+
+HEDGES = tracing.register(tracing.Counter(
+    "chef_upstream_hedges_total", "Hedged duplicate calls by winning attempt.",
+    ("stage", "winner")))
+DEGRADED = tracing.register(tracing.Counter(
+    "chef_upstream_degraded_total", "Calls answered by the stage's degraded mode.",
+    ("stage", "reason")))
+BREAKER_STATE = tracing.register(tracing.Gauge(
+    "chef_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+    ("stage",)))
+
+_RAISE = object()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The stage timeout or the request budget ran out."""
+
+
+class CircuitOpen(Overloaded):
+    """The stage's breaker is open; fail fast (→ 503 when not degraded)."""
+
+
+# ───────────────────────────── request budget ────────────────────────────
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar(
+    "chef_deadline", default=None)
+
+
+def begin_budget(seconds: float = REQUEST_BUDGET) -> contextvars.Token:
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def end_budget(token: contextvars.Token) -> None:
+    try:
+        _deadline.reset(token)
+    except ValueError:          # token minted in another context
+        _deadline.set(None)
+
+
+@contextmanager
+def budget(seconds: float = REQUEST_BUDGET):
+    token = begin_budget(seconds)
+    try:
+        yield
+    finally:
+        end_budget(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current request budget (``None`` = unbounded)."""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+# ───────────────────────────── circuit breaker ───────────────────────────
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.name, self.threshold, self.cooldown = name, failures, cooldown
+        self._lock = threading.Lock()
+        self.state, self._failures, self._opened, self._probing = self.CLOSED, 0, 0.0, False
+        BREAKER_STATE.set_function(lambda: {(self.name,): self.state})
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            left = self._opened + self.cooldown - time.monotonic()
+            if left > 0:
+                raise CircuitOpen(self.name, "circuit_open", left)
+            if self._probing:                # one probe at a time while half-open
+                raise CircuitOpen(self.name, "circuit_open", 1.0)
+            self.state, self._probing = self.HALF_OPEN, True
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self._failures, self._probing = self.CLOSED, 0, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self.state, self._opened, self._probing = self.OPEN, time.monotonic(), False
+                tracing.inc(f"breaker_open.{self.name}")
+
+    def release_probe(self) -> None:
+        """A half-open probe ended without a verdict (e.g. shed locally)."""
+        with self._lock:
+            self._probing = False
+
+
+# ───────────────────────────── stage policies ────────────────────────────
+@dataclass
+class Stage:
+    name: str
+    timeout: float | None           # None → whatever is left of the budget
+    hedge: bool = False             # idempotent and cheap enough to duplicate
+    breaker: CircuitBreaker = field(init=False)
+    _window: deque = field(init=False, repr=False)
+    _calls: int = field(default=0, init=False, repr=False)
+    _hedges: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self):
+        self.breaker = CircuitBreaker(self.name)
+        self._window = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._window.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """Recent p95, or ``None`` if this call should not be hedged."""
+        with self._lock:
+            self._calls += 1
+            if not self.hedge or len(self._window) < 20 \
+                    or self._hedges >= HEDGE_RATIO * self._calls:
+                return None
+            ordered = sorted(self._window)
+            return max(HEDGE_MIN_DELAY, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def hedged(self) -> None:
+        with self._lock:
+            self._hedges += 1
+
+    def call_timeout(self) -> float | None:
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            raise DeadlineExceeded(f"{self.name}: request budget exhausted")
+        return left if self.timeout is None else min(self.timeout, left)
+
+
+def _parse(spec: str) -> dict[str, float]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = item.partition("=")
+        out[name.strip()] = float(value)
+    return out
+
+
+_TIMEOUTS = _parse(os.getenv("STAGE_TIMEOUTS", ""))
+# cheap, idempotent reads only.  generate (a second gpt-4o completion, and a
+# different answer) and youtube (search quota) can be opted in via HEDGE_STAGES
+_HEDGED = set(os.getenv("HEDGE_STAGES", "gatekeeper,embed,rerank,geocode,places").split(","))
+
+STAGES: dict[str, Stage] = {s.name: s for s in (
+    Stage("gatekeeper", _TIMEOUTS.get("gatekeeper", 4.0), "gatekeeper" in _HEDGED),
+    Stage("embed",      _TIMEOUTS.get("embed", 4.0),      "embed" in _HEDGED),
+    Stage("rerank",     _TIMEOUTS.get("rerank", 4.0),     "rerank" in _HEDGED),
+    Stage("generate",   _TIMEOUTS.get("generate"),        "generate" in _HEDGED),
+    Stage("vision",     _TIMEOUTS.get("vision", 30.0),    "vision" in _HEDGED),
+    Stage("youtube",    _TIMEOUTS.get("youtube", 5.0),    "youtube" in _HEDGED),
+    Stage("geocode",    _TIMEOUTS.get("geocode", 5.0),    "geocode" in _HEDGED),
+    Stage("places",     _TIMEOUTS.get("places", 5.0),     "places" in _HEDGED),
+)}
+_stages_lock = threading.Lock()
+
+
+def _stage(name: str) -> Stage:
+    with _stages_lock:
+        st = STAGES.get(name)
+        if st is None:
+            st = STAGES[name] = Stage(name, _TIMEOUTS.get(name, 10.0), name in _HEDGED)
+        return st
+
+
+def _degrade(st: Stage, reason: str, err: BaseException, fallback):
+    if fallback is _RAISE:
+        raise err
+    DEGRADED.inc(st.name, reason)
+    tracing.inc(f"degraded.{st.name}")
+    return fallback()
+
+
+def _settle(st: Stage, err: BaseException, fallback):
+    """Book-keeping for a failed call, then degrade or re-raise."""
+    if isinstance(err, CircuitOpen):
+        return _degrade(st, "circuit_open", err, fallback)
+    if isinstance(err, Overloaded):          # shed locally — says nothing about the upstream
+        st.breaker.release_probe()
+        return _degrade(st, "overloaded", err, fallback)
+    st.breaker.failure()
+    if isinstance(err, DeadlineExceeded):
+        return _degrade(st, "timeout", err, fallback)
+    return _degrade(st, "error", err, fallback)
+
+
+# ───────────────────────────── async calls ───────────────────────────────
+async def _race(st: Stage, make: Callable[[], Awaitable[Any]]):
+    first = asyncio.ensure_future(make())
+    tasks = [first]
+    try:
+        delay = st.hedge_delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                st.hedged()
+                tasks.append(asyncio.ensure_future(make()))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    if len(tasks) > 1:
+                        HEDGES.inc(st.name, "primary" if t is first else "hedge")
+                    return t.result()
+                error = error or t.exception()
+        raise error
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+async def guarded(stage: str, make: Callable[[], Awaitable[Any]], fallback=_RAISE):
+    """Await ``make()`` under *stage*'s deadline / hedging / breaker policy.
+    *make* is called once per attempt, so it must build a fresh awaitable."""
+    st = _stage(stage)
+    t0 = time.monotonic()
+    try:
+        timeout = st.call_timeout()
+    except DeadlineExceeded as err:
+        return _degrade(st, "budget", err, fallback)
+    try:
+        st.breaker.allow()
+        try:
+            result = await asyncio.wait_for(_race(st, make), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{stage}: no answer after {timeout:.1f}s") from None
+    except asyncio.CancelledError:
+        st.breaker.release_probe()
+        raise
+    except Exception as err:
+        return _settle(st, err, fallback)
+    st.breaker.success()
+    st.record(time.monotonic() - t0)
+    return result
+
+
+# ───────────────────────────── blocking calls ────────────────────────────
+# Attempts run on their own pool: guarded_sync is usually called from a
+# BLOCKING_POOL thread, and waiting there on BLOCKING_POOL work can deadlock.
+# A timed-out attempt cannot be interrupted; it finishes in the background.
+_ATTEMPTS = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "32")),
+                               thread_name_prefix="chef-upstream")
+
+
+def _submit(fn):
+    return _ATTEMPTS.submit(contextvars.copy_context().run, fn)
+
+
+def guarded_sync(stage: str, fn: Callable[[], Any], fallback=_RAISE):
+    """Blocking counterpart of :func:`guarded` for SDKs without async APIs."""
+    st = _stage(stage)
+    t0 = time.monotonic()
+    try:
+        timeout = st.call_timeout()
+    except DeadlineExceeded as err:
+        return _degrade(st, "budget", err, fallback)
+    try:
+        st.breaker.allow()
+        deadline = None if timeout is None else t0 + timeout
+        first = _submit(fn)
+        futures = [first]
+        delay = st.hedge_delay()
+        if delay is not None and (timeout is None or delay < timeout):
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                st.hedged()
+                futures.append(_submit(fn))
+        pending, error = set(futures), None
+        while pending:
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{stage}: no answer after {timeout:.1f}s")
+            for f in done:
+                if f.exception() is None:
+                    if len(futures) > 1:
+                        HEDGES.inc(st.name, "primary" if f is first else "hedge")
+                    for other in futures:
+                        other.cancel()
+                    st.breaker.success()
+                    st.record(time.monotonic() - t0)
+                    return f.result()
+                error = error or f.exception()
+        raise error
+    except Exception as err:
+        return _settle(st, err, fallback)
@@ -0,0 +1,141 @@
+"""tools/singleflight.py — coalesce identical in-flight upstream calls.
+
+When several requests ask for the same thing at the same moment (a popular
+query embedded, reranked, gate-kept …) only the first caller — the *leader* —
+performs the upstream call; every concurrent caller with the same key waits
+on the leader's future and receives the same result (or exception).
+
+Nothing is cached: once the leader finishes, the key is forgotten and the
+next call goes upstream again.  Futures are ``concurrent.futures.Future`` so
+callers on different threads / event loops (one loop per Flask request) can
+share them.
+
+Usage::
+
+    @coalesce("gatekeeper", key=lambda focus, msg, sid=None: (focus, msg))
+    async def need_rag(focus, msg, sid=None): ...
+
+Results are shared objects — callers must treat them as read-only.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+from typing import Any, Callable, Hashable
+
+from tools import tracing
+
+__all__ = ["SingleFlight", "coalesce"]
+
+CALLS = tracing.register(tracing.Counter(
+    "chef_singleflight_calls_total",
+    "Single-flight calls by role (leader = went upstream, coalesced = shared).",
+    ("group", "role")))
+INFLIGHT = tracing.register(tracing.Gauge(
+    "chef_singleflight_inflight", "Distinct keys currently in flight.", ("group",)))
+
+
+class _LeaderGone(Exception):
+    """The leader was cancelled before finishing; followers should retry."""
+
+
+class SingleFlight:
+    """A named group of in-flight calls keyed by a hashable value."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, concurrent.futures.Future] = {}
+
+    def _join(self, key: Hashable) -> tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                return fut, False
+            fut = self._inflight[key] = concurrent.futures.Future()
+            INFLIGHT.set(len(self._inflight), self.name)
+            return fut, True
+
+    def _forget(self, key: Hashable, fut: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+            INFLIGHT.set(len(self._inflight), self.name)
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs):
+        """Await ``fn(*args, **kwargs)`` once per *key* across all callers."""
+        while True:
+            fut, leader = self._join(key)
+            if not leader:
+                CALLS.inc(self.name, "coalesced")
+                tracing.record_cache(f"singleflight.{self.name}", True)
+                try:
+                    # shield: a cancelled follower must not cancel the leader
+                    return await asyncio.shield(asyncio.wrap_future(fut))
+                except _LeaderGone:
+                    continue
+            CALLS.inc(self.name, "leader")
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                fut.set_exception(_LeaderGone())
+                raise
+            except BaseException as err:
+                fut.set_exception(err)
+                raise
+            else:
+                fut.set_result(result)
+                return result
+            finally:
+                self._forget(key, fut)
+
+    def do_sync(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs):
+        """Blocking counterpart of :meth:`do` for thread-pool callers."""
+        while True:
+            fut, leader = self._join(key)
+            if not leader:
+                CALLS.inc(self.name, "coalesced")
+                tracing.record_cache(f"singleflight.{self.name}", True)
+                try:
+                    return fut.result()
+                except _LeaderGone:
+                    continue
+            CALLS.inc(self.name, "leader")
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as err:
+                fut.set_exception(err)
+                raise
+            else:
+                fut.set_result(result)
+                return result
+            finally:
+                self._forget(key, fut)
+
+
+def coalesce(group: str, key: Callable[..., Hashable] | None = None):
+    """Decorator: run the wrapped (async or sync) function through a
+    :class:`SingleFlight` named *group*.  *key* maps the call arguments to a
+    hashable key; by default the positional/keyword arguments themselves."""
+    flight = SingleFlight(group)
+
+    def make_key(args, kwargs):
+        if key is not None:
+            return key(*args, **kwargs)
+        return args, tuple(sorted(kwargs.items()))
+
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await flight.do(make_key(args, kwargs), fn, *args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return flight.do_sync(make_key(args, kwargs), fn, *args, **kwargs)
+        wrapper.flight = flight
+        return wrapper
+
+    return deco
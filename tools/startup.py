@@ -0,0 +1,238 @@
+"""tools/startup.py — lazy subsystems, optional warm-up, startup profile.
+
+Importing ``server.server`` loads no index, model dictionary or heavy SDK:
+each subsystem is loaded by the first request that needs it (the indexes by
+``chef_agent.indexes.current()``, the Azure Speech SDK by
+``speech_to_text.speech_sdk()``, googleapiclient by ``clients.youtube_service``
+…).  :func:`warm_up` loads the subsystems named in ``CHEF_WARMUP`` ahead of
+traffic instead, and times every step:
+
+* gunicorn — in the master before forking with ``preload_app`` (so workers
+  share the pages), otherwise in each worker before it accepts connections;
+  subsystems that are not fork-safe (``queries``: live upstream calls on
+  thread pools) always run in the worker;
+* ``server.asgi`` — in the lifespan startup, before uvicorn serves requests;
+* ``python -m server.server`` — before ``app.run``.
+
+``CHEF_WARMUP`` is a comma-separated list of :data:`SUBSYSTEMS`, ``all``, or
+empty / ``none`` (fully lazy; the default outside gunicorn).  ``queries``
+replays the ``QUERY_WARM_TOP`` most frequent logged queries through the
+retrieval caches (``tools/query_log.py``); it loads ``rag`` first.
+
+The report (``/api/admin/startup``, ``chef_startup_seconds``) splits every
+subsystem into its module imports and its load steps (index parts, …)::
+
+    python -m tools.startup                      # cold import of server.server + warm-up all
+    python -m tools.startup --warm rag --top 25  # … and the 25 costliest packages
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from tools import tracing
+
+__all__ = ["SUBSYSTEMS", "warm_up", "report", "warmup_names", "import_costs"]
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = tracing.register(tracing.Gauge(
+    "chef_startup_seconds", "Warm-up seconds by subsystem and part (import / load step).",
+    ("subsystem", "part")))
+
+
+def _load_rag() -> dict[str, float]:
+    from tools import chef_agent
+    return dict(chef_agent.indexes.current().timings)
+
+
+def _load_queries() -> dict[str, float]:
+    from tools import chef_agent, query_log
+    t0 = time.perf_counter()
+    questions = query_log.top_queries(int(os.getenv("QUERY_WARM_TOP", "100")))
+    t1 = time.perf_counter()
+    cached = chef_agent.warm_caches(questions) if questions else 0
+    logger.info("query warm-up: %d of %d logged queries cached", cached, len(questions))
+    return {"read log": t1 - t0, "caches": time.perf_counter() - t1}
+
+
+@dataclass(frozen=True)
+class Subsystem:
+    modules: tuple[str, ...]                  # imported (and timed) first, in order
+    load: object = None                       # fn() -> {step: seconds} | None
+    fork_safe: bool = True                    # may run in a master that forks afterwards
+
+
+SUBSYSTEMS: dict[str, Subsystem] = {
+    "rag": Subsystem(("tools.chef_agent", "langchain.schema", "tools.rag.bm25_retriever",
+                      "tools.rag.faiss_retriever", "tools.rag.rerank_api"), _load_rag),
+    "gatekeeper": Subsystem(("tools.gatekeeper",)),
+    "vision": Subsystem(("tools.entity_recognition.ingredient_recognition",)),
+    "speech": Subsystem(("tools.audio.speech_to_text", "azure.cognitiveservices.speech")),
+    "youtube": Subsystem(("tools.youtube_video_recommender.youtube_helper",
+                          "googleapiclient.discovery")),
+    "grocery": Subsystem(("tools.grocery_search.grocery_helper",)),
+    "queries": Subsystem(("tools.query_log", "tools.query_cache"), _load_queries,
+                         fork_safe=False),
+}
+
+_lock = threading.Lock()
+_phases: list[dict] = []                      # one row per timed step, in order
+_warmed: set[str] = set()
+_errors: dict[str, str] = {}
+
+
+def warmup_names(spec: str | None = None) -> list[str]:
+    """Parse a ``CHEF_WARMUP`` value (default: the environment)."""
+    spec = os.getenv("CHEF_WARMUP", "") if spec is None else spec
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    if names in ([], ["none"]):
+        return []
+    if names == ["all"]:
+        return list(SUBSYSTEMS)
+    unknown = [n for n in names if n not in SUBSYSTEMS]
+    if unknown:
+        raise ValueError(f"unknown CHEF_WARMUP subsystem(s) {unknown}; "
+                         f"choose from {sorted(SUBSYSTEMS)} or 'all'")
+    return names
+
+
+def _record(name: str, part: str, seconds: float) -> None:
+    _phases.append({"subsystem": name, "part": part, "seconds": round(seconds, 4)})
+    STARTUP_SECONDS.set(seconds, name, part)
+
+
+def _warm_one(name: str) -> None:
+    spec = SUBSYSTEMS[name]
+    t0 = time.perf_counter()
+    for module in spec.modules:
+        fresh = module not in sys.modules
+        t = time.perf_counter()
+        importlib.import_module(module)
+        if fresh:                              # shared deps are billed to whoever came first
+            _record(name, f"import {module}", time.perf_counter() - t)
+    if spec.load is not None:
+        for step, seconds in (spec.load() or {}).items():
+            _record(name, f"load {step}", seconds)
+    logger.info("warm-up %s: %.2f s", name, time.perf_counter() - t0)
+
+
+def warm_up(names: list[str] | str | None = None, before_fork: bool = False) -> list[str]:
+    """Load *names* (default ``CHEF_WARMUP``) now; already-warm subsystems
+    are skipped, so it is safe to call from several hooks.  A failing
+    subsystem is logged and reported, not raised — it is retried lazily by
+    the first request that needs it.  *before_fork* skips the subsystems
+    that must run in the serving process.  Returns the names warmed by this
+    call."""
+    if names is None or isinstance(names, str):
+        names = warmup_names(names)
+    done = []
+    with _lock:
+        for name in names:
+            if name in _warmed or (before_fork and not SUBSYSTEMS[name].fork_safe):
+                continue
+            try:
+                _warm_one(name)
+            except Exception as err:
+                logger.exception("warm-up %s failed; it will load on first use", name)
+                _errors[name] = f"{type(err).__name__}: {err}"
+                continue
+            _errors.pop(name, None)
+            _warmed.add(name)
+            done.append(name)
+    return done
+
+
+def _loaded(name: str) -> bool:
+    if name == "rag":
+        chef_agent = sys.modules.get("tools.chef_agent")
+        return chef_agent is not None and chef_agent.indexes.loaded
+    return all(m in sys.modules for m in SUBSYSTEMS[name].modules)
+
+
+def report() -> dict:
+    """What was warmed, how long each step took, and what is loaded now
+    (lazily loaded subsystems show up here without phases)."""
+    with _lock:
+        phases = list(_phases)
+    totals: dict[str, float] = {}
+    for row in phases:
+        totals[row["subsystem"]] = totals.get(row["subsystem"], 0.0) + row["seconds"]
+    return {"warmed": sorted(_warmed), "errors": dict(_errors),
+            "loaded": {name: _loaded(name) for name in SUBSYSTEMS},
+            "seconds": {k: round(v, 3) for k, v in totals.items()},
+            "phases": phases}
+
+
+# ──────────────────────── per-package import cost ────────────────────────
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+def import_costs(target: str) -> tuple[float, dict[str, float]]:
+    """Import *target* in a fresh interpreter under ``-X importtime``.
+    Returns its cumulative seconds and the self time per top-level package."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                          capture_output=True, text=True, env=os.environ.copy())
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {target} failed:\n{proc.stderr[-2000:]}")
+    per_package: dict[str, float] = {}
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, module = m.groups()
+        package = module.split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + int(self_us) / 1e6
+        if module == target:
+            total = int(cumulative_us) / 1e6
+    return total, per_package
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="Cold-start profile: import cost per "
+                                             "package, then warm-up cost per subsystem.")
+    ap.add_argument("--target", default="server.server", help="module a worker imports")
+    ap.add_argument("--warm", default="all", help="CHEF_WARMUP value to profile")
+    ap.add_argument("--top", type=int, default=15, help="packages to list")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    total, packages = import_costs(args.target)
+    t = time.perf_counter()
+    importlib.import_module(args.target)
+    imported = time.perf_counter() - t
+    t = time.perf_counter()
+    warm_up(args.warm)
+    warmed = time.perf_counter() - t
+    rep = report()
+
+    if args.json:
+        print(json.dumps({"import_seconds": round(total, 3), "warm_up_seconds": round(warmed, 3),
+                          "packages": {k: round(v, 4) for k, v in packages.items()},
+                          **rep}, indent=2))
+        sys.exit(0)
+    print(f"import {args.target}: {total:.2f} s cold (-X importtime), "
+          f"{imported:.2f} s in this process")
+    for package, seconds in sorted(packages.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {package:32} {seconds:7.3f} s")
+    print(f"warm-up {args.warm}: {warmed:.2f} s")
+    for name in SUBSYSTEMS:
+        rows = [r for r in rep["phases"] if r["subsystem"] == name]
+        if name in rep["errors"]:
+            print(f"  {name:12} failed: {rep['errors'][name]}")
+        elif rows:
+            print(f"  {name:12} {rep['seconds'][name]:7.3f} s")
+            for r in rows:
+                print(f"    {r['part']:44} {r['seconds']:7.3f} s")
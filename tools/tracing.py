@@ -0,0 +1,276 @@
+"""tools/tracing.py — lightweight per-request spans and Prometheus-style metrics.
+
+Every expensive stage of a request (gatekeeper, BM25, embedding, FAISS,
+rerank, generation, YouTube, Places, vision, STT) is wrapped in
+:func:`span`, which
+
+* observes the wall-clock duration in a per-stage histogram, and
+* appends a ``(stage, seconds)`` record to the current request's trace.
+
+Token usage reported by OpenAI (``completion.usage``) is fed through
+:func:`record_usage`, cache lookups through :func:`record_cache`.
+:func:`render_prometheus` dumps everything in the Prometheus text format
+for the ``/api/metrics`` endpoint.
+
+Metrics are per-process; with several workers scrape each one (or sum them).
+"""
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+__all__ = [
+    "Trace", "begin_trace", "end_trace", "adopt", "current_trace", "current_trace_id",
+    "span", "record_usage", "record_cache", "inc", "observe",
+    "render_prometheus",
+]
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# USD per 1M tokens (prompt, completion) — keep in sync with provider pricing
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4o":                 (2.50, 10.00),
+    "gpt-4o-mini":            (0.15, 0.60),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+# ───────────────────────────── metric types ──────────────────────────────
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_: str, labels: tuple[str, ...],
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_, labels, buckets
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, ...], list] = {}   # key → [counts, sum, n]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                lbl = _labels(self.labels, key)
+                for b, c in zip(self.buckets, counts):
+                    out.append(f'{self.name}_bucket{{{lbl}{"," if lbl else ""}le="{b}"}} {c}')
+                out.append(f'{self.name}_bucket{{{lbl}{"," if lbl else ""}le="+Inf"}} {n}')
+                out.append(f"{self.name}_sum{{{lbl}}} {total:.6f}")
+                out.append(f"{self.name}_count{{{lbl}}} {n}")
+        return out
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help_: str, labels: tuple[str, ...]):
+        self.name, self.help, self.labels = name, help_, labels
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._series.get(label_values, 0.0)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._series.items()):
+                out.append(f"{self.name}{{{_labels(self.labels, key)}}} {v:g}")
+        return out
+
+
+class Gauge:
+    """Point-in-time value, either set explicitly or pulled from a callback."""
+
+    def __init__(self, name: str, help_: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_, labels
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, ...], float] = {}
+        self._callbacks: list = []     # fn() -> dict[label tuple, value]
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._series[label_values] = value
+
+    def add(self, amount: float, *label_values: str) -> None:
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0.0) + amount
+
+    def set_function(self, fn) -> None:
+        self._callbacks.append(fn)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            series = dict(self._series)
+        for fn in self._callbacks:
+            try:
+                series.update(fn())
+            except Exception:                       # never break a scrape
+                logger.exception("gauge callback for %s failed", self.name)
+        for key, v in sorted(series.items()):
+            out.append(f"{self.name}{{{_labels(self.labels, key)}}} {v:g}")
+        return out
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+STAGE_SECONDS = Histogram("chef_stage_duration_seconds",
+                          "Wall-clock duration of a pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("chef_request_duration_seconds",
+                            "End-to-end HTTP request duration.", ("endpoint",))
+STAGE_TOKENS = Histogram("chef_stage_tokens", "OpenAI tokens per call.",
+                         ("stage", "kind"), buckets=TOKEN_BUCKETS)
+STAGE_COST = Counter("chef_stage_cost_usd_total",
+                     "Estimated OpenAI spend in USD.", ("stage", "model"))
+STAGE_ERRORS = Counter("chef_stage_errors_total",
+                       "Stages that raised an exception.", ("stage",))
+CACHE_EVENTS = Counter("chef_cache_events_total",
+                       "Cache lookups by outcome.", ("cache", "result"))
+EVENTS = Counter("chef_events_total", "Miscellaneous named events.", ("event",))
+
+_REGISTRY: list = [REQUEST_SECONDS, STAGE_SECONDS, STAGE_TOKENS, STAGE_COST,
+                   STAGE_ERRORS, CACHE_EVENTS, EVENTS]
+
+
+def register(metric):
+    """Add *metric* to the ``/api/metrics`` output and return it."""
+    _REGISTRY.append(metric)
+    return metric
+
+
+# ───────────────────────────── request traces ────────────────────────────
+@dataclass
+class Trace:
+    id: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: list[tuple[str, float]] = field(default_factory=list)
+    tokens: dict[str, int] = field(default_factory=dict)
+    cache: dict[str, int] = field(default_factory=dict)
+
+    def stage_seconds(self) -> dict[str, float]:
+        out: dict[str, float] = {}
+        for name, secs in self.spans:
+            out[name] = out.get(name, 0.0) + secs
+        return out
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "chef_trace", default=None)
+
+
+def begin_trace(trace_id: str | None = None) -> contextvars.Token:
+    """Start a new trace for the current context; returns a reset token."""
+    return _current.set(Trace(id=trace_id or uuid.uuid4().hex))
+
+
+def end_trace(token: contextvars.Token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:          # token minted in another context (thread hop)
+        _current.set(None)
+
+
+def adopt(trace: Trace | None) -> None:
+    """Make *trace* current in this context (e.g. a task on another thread)."""
+    _current.set(trace)
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+def current_trace_id() -> str | None:
+    t = _current.get()
+    return t.id if t else None
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as *stage* (works around ``await`` too)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage)
+        if (t := _current.get()) is not None:
+            t.spans.append((stage, dt))
+        logger.debug("span %s %.1f ms trace=%s", stage, dt * 1e3,
+                     t.id if t else "-")
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record an externally timed stage (e.g. measured in another thread)."""
+    STAGE_SECONDS.observe(seconds, stage)
+    if (t := _current.get()) is not None:
+        t.spans.append((stage, seconds))
+
+
+def record_usage(stage: str, model: str, usage) -> None:
+    """Account for an OpenAI ``usage`` object (or dict); ``None`` is ignored."""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else (lambda k: getattr(usage, k, None))
+    prompt = get("prompt_tokens") or 0
+    completion = get("completion_tokens") or 0
+    STAGE_TOKENS.observe(prompt, stage, "prompt")
+    if completion:
+        STAGE_TOKENS.observe(completion, stage, "completion")
+    p_in, p_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    STAGE_COST.inc(stage, model, amount=(prompt * p_in + completion * p_out) / 1e6)
+    if (t := _current.get()) is not None:
+        t.tokens[f"{stage}.prompt"] = t.tokens.get(f"{stage}.prompt", 0) + prompt
+        t.tokens[f"{stage}.completion"] = t.tokens.get(f"{stage}.completion", 0) + completion
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    result = "hit" if hit else "miss"
+    CACHE_EVENTS.inc(cache, result)
+    if (t := _current.get()) is not None:
+        key = f"{cache}.{result}"
+        t.cache[key] = t.cache.get(key, 0) + 1
+
+
+def inc(event: str, amount: float = 1.0) -> None:
+    EVENTS.inc(event, amount=amount)
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for m in _REGISTRY:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
@@ -8,6 +8,9 @@ each bot reply for better readability.
 import sys
 import os
 import asyncio
+import json
+import time
+from tools import tracing
 from tools.ui_memory import ConversationMemory
 
 # Optional color support (use colorama if available for Windows, otherwise ANSI)
@@ -79,6 +82,20 @@ def prompt_user(prompt: str = "User: ") -> str:
         print("\n[Session terminated by user]")
         sys.exit(0)
 
+async def _respond(get_response, user_query: str, memory: ConversationMemory) -> str:
+    """One turn through *get_response* with the last five Q‑A pairs; stores the reply."""
+    history_pairs = memory.recent(5)
+    if asyncio.iscoroutinefunction(get_response):
+        bot_reply = await get_response(user_query, history_pairs)
+    else:
+        bot_reply = await asyncio.get_running_loop().run_in_executor(
+            None, get_response, user_query, history_pairs
+        )
+    if isinstance(bot_reply, tuple):          # chef_agent.answer_query → (answer, context)
+        bot_reply = bot_reply[0]
+    memory.add_interaction(user_query, bot_reply)
+    return bot_reply
+
 async def chat_loop(get_response):
     """
     Run the main chat loop, continuously reading user input and printing bot responses.
@@ -104,15 +121,9 @@ async def chat_loop(get_response):
         # 2. Display the user's message in the conversation log
         display_user_message(user_query)
 
-        # 3. Grab the last 3 Q‑A pairs as structured history
-        history_pairs = memory.history[-5:]
+        # 3. Answer with the recent Q‑A pairs as structured history, store the reply
         try:
-            if asyncio.iscoroutinefunction(get_response):
-                bot_reply = await get_response(user_query, history_pairs)
-            else:
-                bot_reply = await asyncio.get_event_loop().run_in_executor(
-                    None, get_response, user_query, history_pairs
-                )
+            bot_reply = await _respond(get_response, user_query, memory)
         except Exception as e:
             # Handle any errors during retrieval/response generation
             error_msg = f"[Error] {e}"
@@ -124,8 +135,7 @@ async def chat_loop(get_response):
             # Continue to next iteration (prompt user again)
             continue
 
-        # 4. Store + display the bot’s response
-        memory.add_interaction(user_query, bot_reply)
+        # 4. Display the bot’s response
         display_bot_message(bot_reply)
 
         # 5. Pause for the user to read the answer, before next prompt
@@ -135,8 +145,108 @@ async def chat_loop(get_response):
             print("\n[Session terminated by user]")
             break
 
-# If this module is run directly, we might want to start the chat with a default backend.
-if __name__ == "__main__":
+# ─────────────────────────── scripted replay ────────────────────────────
+def load_script(path: str) -> list[dict]:
+    """
+    Read a replay script: one conversation per JSONL line,
+    ``{"id": "tomato-egg", "turns": ["I have eggs and tomatoes", "make it spicy?"]}``.
+    Blank lines and ``#`` comments are skipped.
+    """
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            conv = json.loads(line)
+            if not conv.get("turns"):
+                raise ValueError(f"{path}:{n}: conversation has no turns")
+            conv.setdefault("id", f"line{n}")
+            conversations.append(conv)
+    return conversations
+
+async def replay(get_response, conversations: list[dict], concurrency: int = 8,
+                 echo: bool = False) -> list[dict]:
+    """
+    Play scripted *conversations* through the same turn logic and
+    ``ConversationMemory`` as :func:`chat_loop`, *concurrency* sessions at a
+    time (turns within a session stay in order).  Returns one record per turn:
+    latency, OpenAI tokens and cache lookups taken from the turn's trace.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    records: list[dict] = []
+
+    async def play(conv: dict, run: int):
+        memory = ConversationMemory(max_history=5)
+        async with sem:
+            for turn, user_query in enumerate(conv["turns"], 1):
+                token = tracing.begin_trace(f"replay-{conv['id']}-{run}-{turn}")
+                trace = tracing.current_trace()
+                t0 = time.perf_counter()
+                error = None
+                try:
+                    bot_reply = await _respond(get_response, user_query, memory)
+                except Exception as e:
+                    bot_reply, error = None, f"{type(e).__name__}: {e}"
+                finally:
+                    tracing.end_trace(token)
+                records.append({
+                    "session": conv["id"], "run": run, "turn": turn,
+                    "seconds": time.perf_counter() - t0,
+                    "tokens": dict(trace.tokens), "cache": dict(trace.cache),
+                    "stages": trace.stage_seconds(), "error": error,
+                })
+                if echo:
+                    display_user_message(f"[{conv['id']}] {user_query}")
+                    display_bot_message(bot_reply if error is None else f"[Error] {error}")
+
+    await asyncio.gather(*(play(conv, run) for run, conv in enumerate(conversations)))
+    return records
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+def replay_report(records: list[dict]) -> str:
+    """Per-turn latency / token / cache table for :func:`replay` records."""
+    if not records:
+        return "no turns replayed"
+    def row(label: str, recs: list[dict]) -> str:
+        secs = [r["seconds"] * 1000 for r in recs]
+        prompt = sum(v for r in recs for k, v in r["tokens"].items() if k.endswith(".prompt"))
+        completion = sum(v for r in recs for k, v in r["tokens"].items()
+                         if k.endswith(".completion"))
+        hits = sum(v for r in recs for k, v in r["cache"].items() if k.endswith(".hit"))
+        lookups = sum(v for r in recs for v in r["cache"].values())
+        errors = sum(r["error"] is not None for r in recs)
+        hit_rate = f"{hits / lookups:6.0%}" if lookups else f"{'-':>6}"
+        return (f"{label:8} {len(recs):5d} {_pct(secs, .5):8.0f} {_pct(secs, .95):8.0f} "
+                f"{max(secs):8.0f} {prompt / len(recs):9.0f} {completion / len(recs):9.0f} "
+                f"{hit_rate} {errors:6d}")
+
+    lines = [f"{'turn':8} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+             f"{'prompt':>9} {'compl.':>9} {'cache':>6} {'errors':>6}"]
+    for turn in sorted({r["turn"] for r in records}):
+        lines.append(row(str(turn), [r for r in records if r["turn"] == turn]))
+    lines.append(row("all", records))
+    return "\n".join(lines)
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="ChefBot terminal chat (or scripted replay).")
+    ap.add_argument("--replay", metavar="SCRIPT.jsonl",
+                    help="replay scripted conversations instead of chatting")
+    ap.add_argument("--concurrency", type=int, default=8, help="sessions replayed at once")
+    ap.add_argument("--repeat", type=int, default=1, help="play the script N times")
+    ap.add_argument("--echo", action="store_true", help="print every replayed turn")
+    ap.add_argument("--out", metavar="RESULTS.jsonl", help="write per-turn records")
+    ap.add_argument("--max-p95", type=float, metavar="MS",
+                    help="exit 1 if p95 turn latency exceeds MS (regression check)")
+    args = ap.parse_args(argv)
+
     try:
         # Import the recipe RAG answer generator (to integrate with chat loop)
         from tools import chef_agent
@@ -145,9 +255,37 @@ if __name__ == "__main__":
 
     if chef_agent and hasattr(chef_agent, "answer_query"):
         # Use the answer_query function from recipe_rag if available
-        asyncio.run(chat_loop(chef_agent.answer_query))
+        get_response = chef_agent.answer_query
     else:
         # Fallback: echo mode or error if recipe_rag not available
-        async def echo_response(msg):
+        async def get_response(msg, history=None):
             return "Echo: " + msg
-        asyncio.run(chat_loop(echo_response))
+
+    if not args.replay:
+        asyncio.run(chat_loop(get_response))
+        return 0
+
+    conversations = load_script(args.replay) * args.repeat
+    if not conversations:
+        print(f"{args.replay}: no conversations to replay", file=sys.stderr)
+        return 1
+    t0 = time.perf_counter()
+    records = asyncio.run(replay(get_response, conversations, args.concurrency, args.echo))
+    wall = time.perf_counter() - t0
+    print(f"{len(conversations)} sessions, {len(records)} turns, "
+          f"concurrency {args.concurrency}, {wall:.1f} s")
+    print(replay_report(records))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    if args.max_p95 is not None:
+        p95 = _pct([r["seconds"] * 1000 for r in records], .95)
+        if p95 > args.max_p95:
+            print(f"p95 {p95:.0f} ms exceeds --max-p95 {args.max_p95:.0f} ms")
+            return 1
+    return 0
+
+# If this module is run directly, we might want to start the chat with a default backend.
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,102 @@
+import sys
+import zlib
+from array import array
+from collections import deque
+
+COMPRESS_MIN_CHARS = 256      # shorter bot turns are not worth a zlib stream
+
+
+def _text(turn: str | bytes) -> str:
+    return zlib.decompress(turn).decode("utf-8") if isinstance(turn, bytes) else turn
+
+
 class ConversationMemory:
-    """Stores conversation history, last RAG context, and the current topic."""
-    def __init__(self, max_history: int = 5):
+    """Stores conversation history, last RAG context, and the current topic.
+
+    The server keeps one of these per live session, so it is kept compact:
+    ``__slots__``, a bounded deque for history, the cached RAG context as an
+    ``array`` of chunk IDs (rows of the BM25 passage table, rehydrated with
+    ``chef_agent.chunk_context``) and, when *keep_plain* is set, every bot turn
+    but the newest *keep_plain* zlib-compressed.
+    """
+    __slots__ = ("max_history", "keep_plain", "history", "_rag", "rag_version", "last_topic")
+
+    def __init__(self, max_history: int = 5, keep_plain: int | None = None):
         self.max_history = max_history
-        self.history: list[tuple[str, str]] = []  # (user, bot)
-        self.last_rag:   str | None = None        # cached RAG passages
-        self.last_topic: str | None = None        # last detected dish / ingredient set
+        self.keep_plain = keep_plain                     # None → never compress
+        self.history: deque[tuple[str, str | bytes]] = deque(maxlen=max_history)  # (user, bot)
+        self._rag: array | None = None                   # chunk IDs of cached RAG passages
+        self.rag_version: str | None = None              # index version those IDs belong to
+        self.last_topic: str | None = None               # last detected dish / ingredient set
+
+    @property
+    def last_rag(self) -> array | None:
+        return self._rag
+
+    @last_rag.setter
+    def last_rag(self, chunk_ids) -> None:
+        self._rag = array("I", chunk_ids) if chunk_ids else None
 
     # ─────────────────────────────── storage ──────────────────────────────
     def add_interaction(self, user_msg: str, bot_msg: str) -> None:
-        self.history.append((user_msg, bot_msg))
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
+        self.history.append((user_msg, bot_msg))         # deque drops the oldest
+        if self.keep_plain is None or len(self.history) <= self.keep_plain:
+            return
+        i = len(self.history) - self.keep_plain - 1      # the turn that just aged out
+        user, bot = self.history[i]
+        if isinstance(bot, str) and len(bot) >= COMPRESS_MIN_CHARS:
+            self.history[i] = (user, zlib.compress(bot.encode("utf-8"), 6))
+
+    def recent(self, n: int | None = None) -> list[tuple[str, str]]:
+        """The last *n* (user, bot) pairs as plain text, oldest first."""
+        turns = list(self.history)
+        if n is not None:
+            turns = turns[max(0, len(turns) - n):]
+        return [(u, _text(b)) for u, b in turns]
 
     # ────────────────────────────── utilities ─────────────────────────────
     def save_to_disk(self, path: str) -> None:
         with open(path, "w", encoding="utf-8") as f:
-            for u, b in self.history:
+            for u, b in self.recent():
                 f.write(f"User: {u}\nChefBot: {b}\n\n")
 
     def get_context(self) -> str:
         lines: list[str] = []
-        for u, b in self.history:
+        for u, b in self.recent():
             lines += [f"User asked: {u}", f"ChefBot answered: {b}", ""]
         return "\n".join(lines)
 
+    def footprint(self) -> dict[str, int]:
+        """Heap bytes held per part (``sys.getsizeof`` of everything owned)."""
+        size = sys.getsizeof
+        history = size(self.history) + sum(size(t) + size(t[0]) + size(t[1])
+                                           for t in self.history)
+        rag = size(self._rag) if self._rag is not None else 0
+        topic = size(self.last_topic) if self.last_topic is not None else 0
+        return {"object": size(self), "history": history, "rag": rag, "topic": topic}
+
+    def approx_bytes(self) -> int:
+        """Heap footprint of this session (for session-store caps and metrics)."""
+        return sum(self.footprint().values())
+
+    # ──────────────────────────── serialisation ───────────────────────────
+    def to_dict(self) -> dict:
+        return {
+            "max_history": self.max_history,
+            "keep_plain": self.keep_plain,
+            "history": [list(p) for p in self.recent()],
+            "last_rag": list(self._rag) if self._rag is not None else None,
+            "rag_version": self.rag_version,
+            "last_topic": self.last_topic,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ConversationMemory":
+        mem = cls(data.get("max_history", 5), data.get("keep_plain"))
+        for user, bot in data.get("history", []):
+            mem.add_interaction(user, bot)
+        rag = data.get("last_rag")
+        mem.last_rag = rag if isinstance(rag, list) else None   # pre-ID sessions stored text
+        mem.rag_version = data.get("rag_version")
+        mem.last_topic = data.get("last_topic")
+        return mem
@@ -1,22 +1,33 @@
 import os
-from googleapiclient.discovery import build
 
+from tools import tracing
+from tools.clients import youtube_service
+from tools.limits import upstream
+from tools.resilience import guarded_sync
+from tools.singleflight import coalesce
+
+@coalesce("youtube")
 def search_youtube_recipes(dish_name: str, max_results: int = 5):
     api_key = os.environ.get("GOOGLE_API")
     if not api_key:
         raise EnvironmentError("Environment variable 'GOOGLE_API' not set.")
 
-    youtube = build('youtube', 'v3', developerKey=api_key)
     query = f"{dish_name} cooking tutorial"
 
-    request = youtube.search().list(
-        q=query,
-        part="snippet",
-        type="video",
-        maxResults=max_results,
-        order="relevance"
-    )
-    response = request.execute()
+    def call():
+        # per-thread client: hedged attempts run on other threads
+        request = youtube_service(api_key).search().list(
+            q=query,
+            part="snippet",
+            type="video",
+            maxResults=max_results,
+            order="relevance"
+        )
+        with upstream("youtube"):
+            return request.execute()
+
+    with tracing.span("youtube"):
+        response = guarded_sync("youtube", call)
 
     results = []
     for item in response['items']: